@@ -174,6 +174,12 @@ def run_step(step, wait=True, args=cf.config_args()):
     elif step == 'REDIS':
         arg_list = ["python3", os.path.join(args.code_path, 'redis_utilities.py'),
                     args.config_opts]
+    elif step == 'REDIS_BULK_START':
+        arg_list = ["python3", os.path.join(args.code_path, 'redis_utilities.py'),
+                    '--bulk_load', 'start', args.config_opts]
+    elif step == 'REDIS_BULK_FINISH':
+        arg_list = ["python3", os.path.join(args.code_path, 'redis_utilities.py'),
+                    '--bulk_load', 'finish', args.config_opts]
     elif step == 'SETUP':
         arg_list = ['python3', os.path.join(args.code_path, 'workflow_utilities.py'),
                     'CHECK', '-su', args.config_opts]
@@ -224,9 +230,16 @@ def main():
     else:
         run_step("MYSQL", False, args)
         run_step("REDIS", False, args)
-        wait_for_port(int(args.redis_port), args.redis_host)
+        for idx in range(args.redis_shards):
+            wait_for_port(int(args.redis_port) + idx, args.redis_host)
         wait_for_port(int(args.mysql_port), args.mysql_host)
+        if args.redis_from_rdb:
+            run_step('REDIS_BULK_FINISH', False, args)
+        if args.redis_bulk_load:
+            run_step('REDIS_BULK_START', False, args)
         run_step('SETUP', True, args)
+        if args.redis_bulk_load:
+            run_step('REDIS_BULK_FINISH', False, args)
         run_step('CHECK', True, args)
         run_step('IMPORT', True, args)
         run_step('EXPORT1', True, args)
@@ -463,6 +463,8 @@ def compare_versions(src_obj, args=None):
             version_dict[alias]['fetch_needed'] = True
         elif l_size == r_size and l_date == r_date and l_version == r_version:
             version_dict[alias]['fetch_needed'] = False
+            # the file of the last fetch is kept, and so is its checksum
+            version_dict[alias]['checksum'] = file_meta[alias].get('checksum')
         else:
             version_dict[alias]['fetch_needed'] = True
 
@@ -484,7 +486,8 @@ def check(module, args=None):
 
     This runs the compare_versions function on a 'module' object to find the
     version information of the source and determine if a fetch is needed. The
-    version information is also printed.
+    version information is also printed and saved to the raw_file table,
+    except for ensembl species that need a fetch (see ensembl.fetch).
 
     Args:
         module (str): string name of module defining source specific class
@@ -502,6 +505,9 @@ def check(module, args=None):
     SrcClass = src_module.get_SrcClass(args)
     version_dict = compare_versions(SrcClass, args)
     for alias in version_dict:
+        # ensembl records a new release once the species is loaded
+        if module == 'ensembl' and version_dict[alias]['fetch_needed']:
+            continue
         iu.import_filemeta(version_dict[alias], args)
     return version_dict
 
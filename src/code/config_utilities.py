@@ -9,6 +9,7 @@ Contains module functions::
     add_file_config_args(parser)
     add_mysql_config_args(parser)
     add_redis_config_args(parser)
+    add_map_config_args(parser)
     add_config_args(parser)
     config_args()
     pretty_name(orig_name, endlen=63)
@@ -36,6 +37,9 @@ DEFAULT_CHRONOS_URL = '127.0.0.1:8888'
 DEFAULT_MARATHON_URL = '127.0.0.1:8080'
 DEFAULT_BUILD_IMAGE = 'knoweng/kn_builder:latest'
 DEFAULT_ENS_SPECIES = 'homo_sapiens'
+DEFAULT_ENS_WORKERS = 4
+DEFAULT_ENS_IMPORT_WORKERS = 2
+DEFAULT_ENS_DOWNLOAD_WORKERS = 4
 
 def add_run_config_args(parser):
     """Add global configuation options to command line arguments.
@@ -51,6 +55,10 @@ def add_run_config_args(parser):
     --marathon      |str    |-m     |url of marathon scheduler
     --build_image   |str    |-i     |docker image name to use for kn_build pipeline
     --ens_species   |str    |-es    |',,' separated ensembl species to run in setup pipeline
+    --ens_direct    |bool   |-ed    |build ensembl mappings from the table dumps without MySQL staging
+    --ens_workers   |int    |-ew    |species to fetch at a time in LOCAL mode, 0 for all, 1 for one job each
+    --ens_import_workers    |int    |-eiw   |species to import into MySQL and Redis at a time
+    --ens_download_workers  |int    |-edw   |tables of a species to download at a time
     --src_classes   |str    |-srcs  |',,' separated source keywords to run in parse pipeline
     --force_fetch   |bool   |-ff    |fetch even if file exists and is unchanged from last run
     --test_mode     |bool   |-tm    |run in test mode by only printing commands
@@ -69,6 +77,17 @@ def add_run_config_args(parser):
                         help='docker image name to use for kn_build pipeline')
     parser.add_argument('-es', '--ens_species', default=DEFAULT_ENS_SPECIES,
                         help=',, separated list of ensembl species to run in setup pipeline')
+    parser.add_argument('-ed', '--ens_direct', action='store_true', default=False,
+                        help='build ensembl mappings from the table dumps without MySQL staging')
+    parser.add_argument('-ew', '--ens_workers', type=int, default=DEFAULT_ENS_WORKERS,
+                        help='species to fetch at a time in LOCAL mode, 0 for all, '
+                        '1 for one job each')
+    parser.add_argument('-eiw', '--ens_import_workers', type=int,
+                        default=DEFAULT_ENS_IMPORT_WORKERS,
+                        help='species to import into MySQL and Redis at a time')
+    parser.add_argument('-edw', '--ens_download_workers', type=int,
+                        default=DEFAULT_ENS_DOWNLOAD_WORKERS,
+                        help='tables of a species to download at a time')
     parser.add_argument('-srcs', '--src_classes', default='',
                         help=',, separated list of source keywords to run in parse pipeline')
     parser.add_argument('-ff', '--force_fetch', action='store_true', default=False,
@@ -135,6 +154,9 @@ DEFAULT_MYSQL_CPU = '0.5'
 DEFAULT_MYSQL_CONF = 'build_conf/'
 DEFAULT_MYSQL_USER = 'root'
 DEFAULT_MYSQL_PASS = 'KnowEnG'
+DEFAULT_MYSQL_LOAD_WORKERS = 4
+DEFAULT_MYSQL_LOAD_SPLITS = 1
+DEFAULT_MYSQL_FETCH_SIZE = 10000
 
 def add_mysql_config_args(parser):
     """Add global configuation options to command line arguments.
@@ -154,6 +176,14 @@ def add_mysql_config_args(parser):
     --mysql_conf    |str    |-mycf  |relative config dir for deploying MySQL
     --mysql_user    |str    |-myu   |user for mySQL db
     --mysql_pass    |str    |-myps  |password for mySQL db
+    --mysql_load_workers    |int    |-mylw  |tables to LOAD DATA at a time in LOCAL IMPORT, 1 for one job each
+    --mysql_defer_keys  |bool   |-mydk  |drop secondary keys during IMPORT and rebuild them after
+    --mysql_load_splits |int    |-myls  |key range files to split each merged table into for IMPORT
+    --mysql_incremental |bool   |-myinc |IMPORT only the sources whose checksum changed since the last import
+    --mysql_binary_hashes   |bool   |-mybh  |create KnowNet with BINARY(16) hash columns
+    --mysql_raw_store   |bool   |-myrs  |keep raw line text in compressed files instead of MySQL
+    --mysql_partitions  |bool   |-mypt  |partition the status and edge tables by et_name
+    --mysql_fetch_size  |int    |-myfs  |rows fetched at a time by a streaming MySQL query
 
     Args:
         parser (argparse.ArgumentParser): a parser to add global config opts to
@@ -177,6 +207,23 @@ def add_mysql_config_args(parser):
                         help='user for mySQL db')
     parser.add_argument('-myps', '--mysql_pass', default=DEFAULT_MYSQL_PASS,
                         help='password for mySQL db')
+    parser.add_argument('-mylw', '--mysql_load_workers', type=int,
+                        default=DEFAULT_MYSQL_LOAD_WORKERS,
+                        help='tables to LOAD DATA at a time in LOCAL IMPORT, 1 for one job each')
+    parser.add_argument('-mydk', '--mysql_defer_keys', action='store_true', default=False,
+                        help='drop secondary keys during IMPORT and rebuild them after')
+    parser.add_argument('-myls', '--mysql_load_splits', type=int, default=DEFAULT_MYSQL_LOAD_SPLITS,
+                        help='key range files to split each merged table into for IMPORT')
+    parser.add_argument('-myinc', '--mysql_incremental', action='store_true', default=False,
+                        help='IMPORT only the sources whose checksum changed since the last import')
+    parser.add_argument('-mybh', '--mysql_binary_hashes', action='store_true', default=False,
+                        help='create KnowNet with BINARY(16) hash columns')
+    parser.add_argument('-myrs', '--mysql_raw_store', action='store_true', default=False,
+                        help='keep raw line text in compressed files instead of MySQL')
+    parser.add_argument('-mypt', '--mysql_partitions', action='store_true', default=False,
+                        help='partition the status and edge tables by et_name')
+    parser.add_argument('-myfs', '--mysql_fetch_size', type=int, default=DEFAULT_MYSQL_FETCH_SIZE,
+                        help='rows fetched at a time by a streaming MySQL query')
     return parser
 
 
@@ -186,6 +233,12 @@ DEFAULT_REDIS_DIR = os.path.join(DEFAULT_WORKING_DIR, 'kn-redis')
 DEFAULT_REDIS_MEM = '0'
 DEFAULT_REDIS_CPU = '0.5'
 DEFAULT_REDIS_PASS = 'KnowEnG'
+DEFAULT_REDIS_DB = 0
+DEFAULT_REDIS_SOCKET = ''
+DEFAULT_REDIS_POOL_SIZE = 16
+DEFAULT_REDIS_TIMEOUT = 60
+DEFAULT_REDIS_KEEPALIVE = 60
+DEFAULT_REDIS_SHARDS = 1
 
 def add_redis_config_args(parser):
     """Add global configuation options to command line arguments.
@@ -203,6 +256,14 @@ def add_redis_config_args(parser):
     --redis_mem     |str    |-rm    |memory for deploying redis container
     --redis_cpu     |str    |-rc    |cpus for deploying redis container
     --redis_pass    |str    |-rps   |password for Redis db
+    --redis_db      |int    |-rdb   |database number of Redis db
+    --redis_socket  |str    |-rsk   |unix socket of a co-located Redis db, used instead of host and port
+    --redis_pool_size|int   |-rpl   |max connections per Redis connection pool
+    --redis_timeout |float  |-rto   |seconds to wait for Redis, 0 to wait forever
+    --redis_keepalive|int   |-rka   |idle seconds before TCP keepalive probes, 0 to disable
+    --redis_shards  |int    |-rsh   |number of Redis dbs the mapping store is split across
+    --redis_bulk_load|      |-rbl   |turn Redis persistence off during SETUP and save once after
+    --redis_from_rdb|       |-rfr   |start Redis from the dump.rdb files of rdb_utilities
 
     Args:
         parser (argparse.ArgumentParser): a parser to add global config opts to
@@ -222,6 +283,71 @@ def add_redis_config_args(parser):
                         help='cpus for deploying redis container')
     parser.add_argument('-rps', '--redis_pass', default=DEFAULT_REDIS_PASS,
                         help='password for Redis db')
+    parser.add_argument('-rdb', '--redis_db', type=int, default=DEFAULT_REDIS_DB,
+                        help='database number of Redis db')
+    parser.add_argument('-rsk', '--redis_socket', default=DEFAULT_REDIS_SOCKET,
+                        help='unix socket of a co-located Redis db, used instead of host and port')
+    parser.add_argument('-rpl', '--redis_pool_size', type=int, default=DEFAULT_REDIS_POOL_SIZE,
+                        help='max connections per Redis connection pool')
+    parser.add_argument('-rto', '--redis_timeout', type=float, default=DEFAULT_REDIS_TIMEOUT,
+                        help='seconds to wait for Redis, 0 to wait forever')
+    parser.add_argument('-rka', '--redis_keepalive', type=int, default=DEFAULT_REDIS_KEEPALIVE,
+                        help='idle seconds before TCP keepalive probes, 0 to disable')
+    parser.add_argument('-rsh', '--redis_shards', type=int, default=DEFAULT_REDIS_SHARDS,
+                        help='number of Redis dbs the mapping store is split across, \
+                        on consecutive ports from redis_port')
+    parser.add_argument('-rbl', '--redis_bulk_load', action='store_true', default=False,
+                        help='turn Redis persistence off during SETUP and save once after')
+    parser.add_argument('-rfr', '--redis_from_rdb', action='store_true', default=False,
+                        help='start Redis from the dump.rdb files of rdb_utilities')
+    return parser
+
+
+DEFAULT_MAP_SNAPSHOT = ''
+DEFAULT_MAP_CACHE_SIZE = 100000
+DEFAULT_MAP_CACHE_FILE = ''
+DEFAULT_MAP_CONCURRENCY = 4
+DEFAULT_MAP_WORKERS = 0
+
+def add_map_config_args(parser):
+    """Add global configuation options to command line arguments.
+
+    If global arguments are not specified, supplies their default values.
+
+.. csv-table::
+    :header: parameter,argument,flag,description
+    :widths: 4,2,2,12
+    :delim: |
+
+    --map_snapshot  |str    |-msn   |mapping snapshot file to use instead of Redis
+    --map_cache_size|int    |-mcs   |max gene conversions cached per map process
+    --map_cache_file|str    |-mcf   |file to warm the conversion cache from and save it to
+    --map_async     |       |-mas   |map with the asyncio pipeline
+    --map_concurrency|int   |-mcc   |number of batches looked up concurrently by -mas
+    --map_workers   |int    |-mw    |number of LOCAL map worker processes, 0 for one per core
+    --map_filter    |       |-mf    |skip lookups of foreign keys not in the id_map filters
+
+    Args:
+        parser (argparse.ArgumentParser): a parser to add global config opts to
+
+    Returns:
+        argparse.ArgumentParser: parser with appended global options
+    """
+    parser.add_argument('-msn', '--map_snapshot', default=DEFAULT_MAP_SNAPSHOT,
+                        help='mapping snapshot file to use instead of Redis')
+    parser.add_argument('-mcs', '--map_cache_size', type=int, default=DEFAULT_MAP_CACHE_SIZE,
+                        help='max gene conversions cached per map process, 0 to disable')
+    parser.add_argument('-mcf', '--map_cache_file', default=DEFAULT_MAP_CACHE_FILE,
+                        help='file to warm the conversion cache from and save it to')
+    parser.add_argument('-mas', '--map_async', action='store_true', default=False,
+                        help='map with the asyncio pipeline')
+    parser.add_argument('-mcc', '--map_concurrency', type=int, default=DEFAULT_MAP_CONCURRENCY,
+                        help='number of batches looked up concurrently by --map_async')
+    parser.add_argument('-mw', '--map_workers', type=int, default=DEFAULT_MAP_WORKERS,
+                        help='number of LOCAL map worker processes, 0 for one per core, \
+                        1 to run one mapper job per file')
+    parser.add_argument('-mf', '--map_filter', action='store_true', default=False,
+                        help='skip lookups of foreign keys not in the id_map filters')
     return parser
 
 
@@ -244,6 +370,8 @@ def add_config_args(parser):
     group3 = add_mysql_config_args(group3)
     group4 = parser.add_argument_group('redis arguments')
     group4 = add_redis_config_args(group4)
+    group5 = parser.add_argument_group('map arguments')
+    group5 = add_map_config_args(group5)
     return parser
 
 
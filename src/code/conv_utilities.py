@@ -2,13 +2,35 @@
 
 Contains module functions::
 
+    get_mapping_db(args)
+    get_conv_cache(args)
+    get_fk_filter(args)
+    get_supported_taxids(args)
+    collect_nodes(lines, supported_taxids)
+    resolve_nodes(rdb, to_map, cache=None, fk_filter=None)
+    read_line_nums(tablefile)
+    map_lines(lines, mapped, supported_taxids, e_writer, s_writer, provenance)
+    read_batches(reader, size=MAP_BATCH)
+    map_sync(tablefile, cache, args, fk_filter=None)
+    resolve_nodes_async(ardb, to_map, cache=None, fk_filter=None)
+    map_async(tablefile, supported_taxids, cache, args, fk_filter=None)
+    sort_async(tablefile)
+    init_map_worker(args)
+    map_worker(job)
+    map_files(jobs, args)
     map_list(namefile, args=None)
+    read_names(infile)
     main_parse_args()
     main(tablefile, args=None)
 
 Attributes:
     DEFAULT_HINT (str): the default mapping hint for converting identifiers
     DEFAULT_TAXON (int): the default taxon id to use for converting identfiers
+    MAP_BATCH (int): the number of table lines mapped together in one batch
+    CONV_CACHE (ConvCache): the gene conversion cache of this process
+    FK_FILTER (FKFilter): the foreign key filter of this process
+    MAPPING_DB (object): the mapping db connection of this process
+    WORKER_ARGS (Namespace): the args of this map_files worker process
 
 Examples:
     To run conv on a single source (e.g. dip) after table complete::
@@ -26,13 +48,19 @@ Examples:
 
 import csv
 import sys
+import asyncio
 import hashlib
 import os
 import json
+import glob
+import time
+import traceback
+import multiprocessing
 from argparse import ArgumentParser
 from collections import defaultdict
 import config_utilities as cf
 import redis_utilities as ru
+import snapshot_utilities as sn
 import table_utilities as tu
 import import_utilities as iu
 
@@ -40,18 +68,253 @@ csv.field_size_limit(sys.maxsize)
 
 DEFAULT_HINT = ''
 DEFAULT_TAXON = 9606
+MAP_BATCH = 50000
+CONV_CACHE = None
+FK_FILTER = None
+MAPPING_DB = None
+WORKER_ARGS = None
+
+def get_mapping_db(args):
+    """Returns the database used to resolve node identifiers.
+
+    This returns the memory-mapped snapshot named by args.map_snapshot (see
+    snapshot_utilities.build_snapshot) if one is given, and a Redis database
+    connection otherwise. Both provide the lookups used by redis_utilities.
+    The Redis connection, and so its connection pool, is created once per
+    process and shared by every table mapped in it.
+
+    Args:
+        args (Namespace): args as populated namespace
+
+    Returns:
+        object: a Snapshot or StrictRedis object
+    """
+    global MAPPING_DB
+    if args.map_snapshot:
+        return sn.get_snapshot(args.map_snapshot)
+    if MAPPING_DB is None:
+        MAPPING_DB = ru.get_database(args)
+    return MAPPING_DB
+
+def get_conv_cache(args):
+    """Returns the gene conversion cache shared by every table mapped in this
+    process.
+
+    The cache is created on first use with args.map_cache_size entries and is
+    warmed from args.map_cache_file if that file exists. Returns None if
+    caching is disabled.
+
+    Args:
+        args (Namespace): args as populated namespace
+
+    Returns:
+        ConvCache: the conversion cache of this process or None
+    """
+    global CONV_CACHE
+    if args.map_cache_size <= 0:
+        return None
+    if CONV_CACHE is None:
+        CONV_CACHE = ru.ConvCache(args.map_cache_size)
+        if args.map_cache_file and os.path.isfile(args.map_cache_file):
+            CONV_CACHE.load(args.map_cache_file)
+    return CONV_CACHE
+
+def get_fk_filter(args):
+    """Returns the foreign key filter shared by every table mapped in this
+    process.
+
+    The filter is loaded on first use from every FKFilter file written to
+    the id_map directory by redis_utilities.import_ensembl. Returns None if
+    args.map_filter is not set or no filter files exist.
+
+    Args:
+        args (Namespace): args as populated namespace
+
+    Returns:
+        FKFilter: the foreign key filter of this process or None
+    """
+    global FK_FILTER
+    if not args.map_filter:
+        return None
+    if FK_FILTER is None:
+        map_dir = os.path.join(args.working_dir, args.data_path, cf.DEFAULT_MAP_PATH)
+        filter_files = sorted(glob.glob(os.path.join(map_dir, '*' + ru.FILTER_SUFFIX)))
+        if not filter_files:
+            print('No foreign key filters found in ' + map_dir)
+            return None
+        FK_FILTER = ru.FKFilter()
+        for filter_file in filter_files:
+            FK_FILTER.load(filter_file)
+    return FK_FILTER
+
+def collect_nodes(lines, supported_taxids):
+    """Returns the distinct gene identifiers to look up for a batch of lines.
+
+    Args:
+        lines (list): table rows (see table_utilities.main)
+        supported_taxids (set): taxids that can be mapped
+
+    Returns:
+        dict: the set of gene names for each (hint, taxid) pair
+    """
+    to_map = defaultdict(set)
+    for line in lines:
+        (n1, hint, ntype, taxid) = line[1:5]
+        if ntype == 'gene' and taxid in supported_taxids:
+            to_map[hint, taxid].add(n1)
+        (n2, hint, ntype, taxid) = line[5:9]
+        if ntype == 'gene' and taxid in supported_taxids:
+            to_map[hint, taxid].add(n2)
+    return {k: list(v) for k, v in to_map.items()}
+
+def resolve_nodes(rdb, to_map, cache=None, fk_filter=None):
+    """Looks up the identifiers collected by collect_nodes.
+
+    Args:
+        rdb (redis object): redis connection or snapshot of the mapping db
+        to_map (dict): the list of gene names for each (hint, taxid) pair
+        cache (ConvCache): optional cache of previous conversions
+        fk_filter (FKFilter): optional filter of the loaded foreign keys
+
+    Returns:
+        dict: a dictionary of name to stable id for each (hint, taxid) pair
+    """
+    return {k: dict(zip(v, ru.conv_gene(rdb, v, k[0], k[1], cache, fk_filter)))
+            for k, v in to_map.items()}
+
+def read_line_nums(tablefile):
+    """Returns the file_id and line numbers of the source lines of tablefile.
+
+    These are read from the raw_line chunk the tablefile was made from (see
+    fetch_utilities.chunk), so the status rows can carry the provenance of
+    their line without a join to the raw_line table.
+
+    Args:
+        tablefile (str): path to an tablefile to be mapped
+
+    Returns:
+        tuple: the file_id of the chunk and a dictionary of line_hash to
+            line_num, or 'NULL' and an empty dictionary without a chunk
+    """
+    raw_line_file = tablefile.replace('table', 'raw_line')
+    file_id = 'NULL'
+    line_nums = dict()
+    if not os.path.isfile(raw_line_file):
+        return file_id, line_nums
+    with open(raw_line_file, 'rb') as infile:
+        for line in infile:
+            fields = line.split(b'\t', 3)
+            if len(fields) < 4:
+                continue
+            line_nums[fields[0].decode()] = fields[1].decode()
+            file_id = fields[2].decode()
+    return file_id, line_nums
+
+def map_lines(lines, mapped, supported_taxids, e_writer, s_writer, provenance):
+    """Writes the edge and status rows for a batch of mapped lines.
+
+    Args:
+        lines (list): table rows (see table_utilities.main)
+        mapped (dict): the lookups returned by resolve_nodes for lines
+        supported_taxids (set): taxids that can be mapped
+        e_writer (csv.writer): writer for the edge file
+        s_writer (csv.writer): writer for the status file
+        provenance (tuple): the file_id and line numbers returned by
+            read_line_nums for lines
+    """
+    file_id, line_nums = provenance
+    for line in lines:
+        (n1, hint, ntype, taxid) = line[1:5]
+        if ntype == 'gene':
+            if taxid not in supported_taxids:
+                n1_map = 'unmapped-unsupported-species'
+            else:
+                n1_map = mapped[hint, taxid][n1]
+        else:
+            n1_map = n1
+        (n2, hint, ntype, taxid) = line[5:9]
+        if ntype == 'gene':
+            if taxid not in supported_taxids:
+                n2_map = 'unmapped-unsupported-species'
+            else:
+                n2_map = mapped[hint, taxid][n2]
+        else:
+            n2_map = n2
+        chksum = line[0] #line chksum
+        et_map = line[9]
+        weight = line[10]
+        t_chksum = line[11] #raw edge chksum
+        hasher = hashlib.md5()
+        hasher.update('\t'.join([n1_map, n2_map, et_map]).encode())
+        e_chksum = hasher.hexdigest()
+        if 'unmapped' in n1_map:
+            status = 'unmapped'
+            status_desc = n1_map
+        elif 'unmapped' in n2_map:
+            status = 'unmapped'
+            status_desc = n2_map
+        else:
+            status = 'production'
+            status_desc = 'mapped'
+            e_writer.writerow([e_chksum, n1_map, n2_map, et_map, weight])
+        s_writer.writerow([t_chksum, n1_map, n2_map, et_map, weight, e_chksum, \
+            chksum, status, status_desc, file_id, line_nums.get(chksum, 'NULL')])
+
+def read_batches(reader, size=MAP_BATCH):
+    """Yields lists of at most size rows from reader.
+
+    Args:
+        reader (iterable): the rows to split into batches
+        size (int): maximum number of rows per batch
+
+    Yields:
+        list: the next batch of rows
+    """
+    batch = []
+    for line in reader:
+        batch.append(line)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def get_supported_taxids(args):
+    """Returns the taxids of the species in the mapping db.
+
+    Args:
+        args (Namespace): args as populated namespace
+
+    Returns:
+        set: the supported taxids, including 'unknown'
+    """
+    src_data_dir = os.path.join(args.working_dir, args.data_path, cf.DEFAULT_MAP_PATH)
+    species_file = os.path.join(src_data_dir, 'species', 'species.json')
+    with open(species_file, 'r') as infile:
+        species_dict = json.load(infile)
+    return set(['unknown'] + list(species_dict.values()))
 
 def main(tablefile, args=None):
     """Maps the nodes for the source:alias tablefile.
 
     This takes the path to an tablefile (see table_utilities.main) and maps
-    the nodes in it using the Redis DB. It then outputs a status files in
+    the nodes in it using the Redis DB (or the mapping snapshot given by
+    args.map_snapshot). It then outputs a status files in
     the format (table_hash, n1, n2, edge_type, weight, edge_hash, line_hash,
-    status, status_desc), where status is production if both nodes mapped and
+    status, status_desc, file_id, line_num), where status is production if both nodes mapped and
     unmapped otherwise. It also outpus an edge file which all rows where status
     is production, in the format (edge_hash, n1, n2, edge_type, weight), and
     and edge2line file in the formate (edge_hash, line_hash).
 
+    The tablefile is read once in batches of MAP_BATCH lines. The distinct
+    gene names of each batch are looked up together and the edge and status
+    rows of the batch are written before the next batch is read, so memory
+    use does not depend on the size of the tablefile. With args.map_async
+    the batches are mapped by the asyncio pipeline in map_async instead,
+    unless a mapping snapshot is used or the asyncio Redis connections are
+    not available (see redis_utilities.async_supported). With args.map_filter, gene names that
+    are not in the foreign key filters (see get_fk_filter) are not looked up.
+
     Args:
         tablefile (str): path to an tablefile to be mapped
         args (Namespace): args as populated namespace or 'None' for defaults
@@ -63,94 +326,274 @@ def main(tablefile, args=None):
             iu.import_pnode(tablefile.replace('conv', 'node'), args)
         iu.import_edge(tablefile, args)
         return
-    rdb = ru.get_database(args)
+    cache = get_conv_cache(args)
+    fk_filter = get_fk_filter(args)
+    use_async = args.map_async and not args.map_snapshot
+    if use_async and not ru.async_supported():
+        print('Python 3.9 and redis-py 4.2 are needed for --map_async, mapping synchronously')
+        use_async = False
+    if use_async:
+        supported_taxids = get_supported_taxids(args)
+        asyncio.run(map_async(tablefile, supported_taxids, cache, args, fk_filter))
+        asyncio.run(sort_async(tablefile))
+    else:
+        map_sync(tablefile, cache, args, fk_filter)
+    if cache is not None:
+        cache.report()
+    if fk_filter is not None:
+        fk_filter.report()
+
+def map_sync(tablefile, cache, args, fk_filter=None):
+    """Writes the edge, status and unique files for tablefile one batch at a
+    time (see main).
+
+    Args:
+        tablefile (str): path to an tablefile to be mapped
+        cache (ConvCache): optional cache of previous conversions
+        args (Namespace): args as populated namespace
+        fk_filter (FKFilter): optional filter of the loaded foreign keys
+    """
+    rdb = get_mapping_db(args)
     edge_file = tablefile.replace('table', 'edge')
     status_file = tablefile.replace('table', 'status')
     ue_file = tablefile.replace('table', 'unique.edge')
     ue2l_file = tablefile.replace('table', 'unique.edge2line')
     us_file = tablefile.replace('table', 'unique.status')
-    src_data_dir = os.path.join(args.working_dir, args.data_path, cf.DEFAULT_MAP_PATH)
-    species_file = os.path.join(src_data_dir, 'species', 'species.json')
-    with open(species_file, 'r') as infile:
-        species_dict = json.load(infile)
-    supported_taxids = ['unknown'] + list(species_dict.values())
+    supported_taxids = get_supported_taxids(args)
+    provenance = read_line_nums(tablefile)
     with open(tablefile, 'r') as infile, \
         open(edge_file, 'w') as edge, \
         open(status_file, 'w') as e_stat:
         reader = csv.reader(infile, delimiter='\t')
         s_writer = csv.writer(e_stat, delimiter='\t', lineterminator='\n')
         e_writer = csv.writer(edge, delimiter='\t', lineterminator='\n')
-        to_map = defaultdict(list)
-        for line in reader:
-            (n1, hint, ntype, taxid) = line[1:5]
-            if ntype == 'gene' and taxid in supported_taxids:
-                to_map[hint, taxid].append(n1)
-            (n2, hint, ntype, taxid) = line[5:9]
-            if ntype == 'gene' and taxid in supported_taxids:
-                to_map[hint, taxid].append(n2)
-        infile.seek(0)
-        mapped = {k: {n: m for m, n in zip(ru.conv_gene(rdb, v, k[0], k[1]), v)} for k, v in
-                  to_map.items()}
-        for line in reader:
-            (n1, hint, ntype, taxid) = line[1:5]
-            if ntype == 'gene':
-                if taxid not in supported_taxids:
-                    n1_map = 'unmapped-unsupported-species'
-                else:
-                    n1_map = mapped[hint, taxid][n1]
-            else:
-                n1_map = n1
-            (n2, hint, ntype, taxid) = line[5:9]
-            if ntype == 'gene':
-                if taxid not in supported_taxids:
-                    n2_map = 'unmapped-unsupported-species'
-                else:
-                    n2_map = mapped[hint, taxid][n2]
-            else:
-                n2_map = n2
-            chksum = line[0] #line chksum
-            et_map = line[9]
-            weight = line[10]
-            t_chksum = line[11] #raw edge chksum
-            hasher = hashlib.md5()
-            hasher.update('\t'.join([n1_map, n2_map, et_map]).encode())
-            e_chksum = hasher.hexdigest()
-            if 'unmapped' in n1_map:
-                status = 'unmapped'
-                status_desc = n1_map
-            elif 'unmapped' in n2_map:
-                status = 'unmapped'
-                status_desc = n2_map
-            else:
-                status = 'production'
-                status_desc = 'mapped'
-                e_writer.writerow([e_chksum, n1_map, n2_map, et_map, weight])
-            s_writer.writerow([t_chksum, n1_map, n2_map, et_map, weight, e_chksum, \
-                chksum, status, status_desc])
+        for lines in read_batches(reader):
+            to_map = collect_nodes(lines, supported_taxids)
+            mapped = resolve_nodes(rdb, to_map, cache, fk_filter)
+            map_lines(lines, mapped, supported_taxids, e_writer, s_writer, provenance)
     tu.csu(edge_file, ue_file)
     tu.csu(status_file, us_file)
     tu.csu(us_file, ue2l_file, [6, 7])
 
+async def resolve_nodes_async(ardb, to_map, cache=None, fk_filter=None):
+    """Coroutine version of resolve_nodes using an asyncio Redis connection.
+
+    Args:
+        ardb (redis.asyncio object): asyncio redis connection to the mapping db
+        to_map (dict): the list of gene names for each (hint, taxid) pair
+        cache (ConvCache): optional cache of previous conversions
+        fk_filter (FKFilter): optional filter of the loaded foreign keys
+
+    Returns:
+        dict: a dictionary of name to stable id for each (hint, taxid) pair
+    """
+    keys = list(to_map)
+    results = await asyncio.gather(*[ru.conv_gene_async(ardb, to_map[k], k[0], k[1],
+                                                        cache, fk_filter)
+                                     for k in keys])
+    return {k: dict(zip(to_map[k], res)) for k, res in zip(keys, results)}
+
+async def map_async(tablefile, supported_taxids, cache, args, fk_filter=None):
+    """Writes the edge and status files for tablefile with an asyncio
+    pipeline.
+
+    A reader task parses batches of MAP_BATCH lines into a queue holding at
+    most args.map_concurrency batches. The same number of resolver tasks each
+    take a batch, look up its genes and write its rows, so reading, the
+    Redis lookups of several batches and writing all overlap. Rows are written
+    in the order batches finish, which is fine as every output is sorted.
+
+    Args:
+        tablefile (str): path to an tablefile to be mapped
+        supported_taxids (set): taxids that can be mapped
+        cache (ConvCache): optional cache of previous conversions
+        args (Namespace): args as populated namespace
+        fk_filter (FKFilter): optional filter of the loaded foreign keys
+    """
+    ardb = ru.get_async_database(args)
+    concurrency = max(1, args.map_concurrency)
+    queue = asyncio.Queue(maxsize=concurrency)
+    provenance = read_line_nums(tablefile)
+    with open(tablefile, 'r') as infile, \
+        open(tablefile.replace('table', 'edge'), 'w') as edge, \
+        open(tablefile.replace('table', 'status'), 'w') as e_stat:
+        reader = csv.reader(infile, delimiter='\t')
+        s_writer = csv.writer(e_stat, delimiter='\t', lineterminator='\n')
+        e_writer = csv.writer(edge, delimiter='\t', lineterminator='\n')
+
+        async def read():
+            """Queue the batches of tablefile followed by one stop marker per
+            resolver.
+            """
+            for lines in read_batches(reader):
+                await queue.put(lines)
+            for _ in range(concurrency):
+                await queue.put(None)
+
+        async def resolve():
+            """Map and write queued batches until the stop marker.
+            """
+            while True:
+                lines = await queue.get()
+                if lines is None:
+                    return
+                to_map = collect_nodes(lines, supported_taxids)
+                mapped = await resolve_nodes_async(ardb, to_map, cache, fk_filter)
+                map_lines(lines, mapped, supported_taxids, e_writer, s_writer,
+                          provenance)
+
+        try:
+            await asyncio.gather(read(), *[resolve() for _ in range(concurrency)])
+        finally:
+            await ru.close_async_database(ardb)
+
+async def sort_async(tablefile):
+    """Creates the unique edge, status and edge2line files of tablefile.
+
+    The three sorts are independent, as the unique edge2line file is cut
+    directly from the status file, so they are run at the same time.
+
+    Args:
+        tablefile (str): path to an tablefile that has been mapped
+    """
+    status_file = tablefile.replace('table', 'status')
+    await asyncio.gather(
+        asyncio.to_thread(tu.csu, tablefile.replace('table', 'edge'),
+                          tablefile.replace('table', 'unique.edge')),
+        asyncio.to_thread(tu.csu, status_file, tablefile.replace('table', 'unique.status')),
+        asyncio.to_thread(tu.csu, status_file,
+                          tablefile.replace('table', 'unique.edge2line'), [6, 7]))
+
+def init_map_worker(args):
+    """Initializes a map_files worker process.
+
+    This stores args for map_worker and opens the mapping db connection,
+    conversion cache and foreign key filter of the worker, which it then reuses for every table file
+    it maps.
+
+    Args:
+        args (Namespace): args as populated namespace
+    """
+    global WORKER_ARGS, MAPPING_DB, CONV_CACHE, FK_FILTER
+    WORKER_ARGS = args
+    MAPPING_DB = None
+    CONV_CACHE = None
+    FK_FILTER = None
+    get_mapping_db(args)
+    get_conv_cache(args)
+    get_fk_filter(args)
+
+def map_worker(job):
+    """Maps one table file in a map_files worker process.
+
+    The output of main is written to the log file of the job, as it would be
+    by a LOCAL mapper job.
+
+    Args:
+        job (tuple): the path of the tablefile and the path of its log file
+
+    Returns:
+        tuple: the tablefile, the seconds it took and the error message or
+            None if it succeeded
+    """
+    tablefile, logfile = job
+    start = time.time()
+    error = None
+    sys.stdout.flush()
+    saved_stdout = os.dup(1)
+    with open(logfile, 'w') as log:
+        os.dup2(log.fileno(), 1)
+        try:
+            main(tablefile, WORKER_ARGS)
+            if CONV_CACHE is not None and WORKER_ARGS.map_cache_file:
+                CONV_CACHE.dump(WORKER_ARGS.map_cache_file)
+        except Exception as ex1:
+            traceback.print_exc(file=sys.stdout)
+            error = repr(ex1)
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved_stdout, 1)
+            os.close(saved_stdout)
+    return tablefile, time.time() - start, error
+
+def map_files(jobs, args=None):
+    """Maps many table files on a pool of worker processes.
+
+    The jobs are queued from the largest to the smallest tablefile and each
+    worker takes the next one as soon as it is free, so the chunks of a large
+    source keep every worker busy and no worker is left with a large file at
+    the end. Each worker keeps one mapping db connection and conversion cache
+    for all of its files (see init_map_worker).
+
+    Args:
+        jobs (list): (tablefile, logfile) tuples to map (see map_worker)
+        args (Namespace): args as populated namespace or 'None' for defaults,
+            args.map_workers sets the number of workers, 0 for one per core
+
+    Returns:
+        list: the tablefiles that failed to map
+    """
+    if args is None:
+        args = cf.config_args()
+    jobs = sorted(jobs, key=lambda job: os.path.getsize(job[0]), reverse=True)
+    workers = args.map_workers if args.map_workers > 0 else multiprocessing.cpu_count()
+    workers = min(workers, len(jobs))
+    failed = []
+    if not jobs:
+        return failed
+    print('Mapping {0} table files on {1} workers'.format(len(jobs), workers))
+    start = time.time()
+    with multiprocessing.Pool(workers, init_map_worker, (args,)) as pool:
+        for ctr, (tablefile, secs, error) in \
+            enumerate(pool.imap_unordered(map_worker, jobs, chunksize=1), 1):
+            print('\t'.join([str(ctr), os.path.basename(tablefile), '{0:.1f}s'.format(secs),
+                             'failed: ' + error if error else 'done']))
+            if error:
+                failed.append(tablefile)
+    cf.CSVM.writerow(['run info', 'map_files_seconds', '{0:.1f}'.format(time.time() - start)])
+    return failed
+
 def map_list(namefile, args=None):
     """Maps the nodes for the provided namefile.
 
     This takes the path to an namefile and maps the nodes in it using the Redis
     DB. It then outputs an mapped file in the format (mapped, original).
 
+    The namefile is read twice in batches of MAP_BATCH names, so memory use
+    does not depend on its length. The first pass finds the node type of the
+    whole list (see redis_utilities.pick_node_type) and the second pass maps
+    each batch and writes its rows before reading the next.
+
     Args:
         namefile (str): path to an namefile to be mapped
         args (Namespace): args as populated namespace or 'None' for defaults
     """
     if args is None:
         args = main_parse_args()
-    rdb = ru.get_database(args)
+    rdb = get_mapping_db(args)
+    types = set()
+    with open(namefile, 'r') as infile:
+        for names in read_batches(read_names(infile)):
+            types |= ru.node_types(rdb, names)
+    ntype = ru.pick_node_type(types)
     with open(namefile, 'r') as infile, \
         open(os.path.splitext(namefile)[0] + '.node_map.txt', 'w') as n_map:
-        reader = csv.reader(infile, delimiter='\t')
         writer = csv.writer(n_map, delimiter='\t', lineterminator='\n')
-        mapped = ru.get_node_info(rdb, [line[0] if line else '' for line in reader], None,
-                                  args.source_hint, args.taxon)
-        writer.writerows(mapped)
+        for names in read_batches(read_names(infile)):
+            writer.writerows(ru.get_node_info(rdb, names, ntype,
+                                              args.source_hint, args.taxon))
+
+def read_names(infile):
+    """Yields the name in the first column of each line of infile.
+
+    Args:
+        infile (file): tab separated file with one name per line
+
+    Yields:
+        str: the name, or '' for an empty line
+    """
+    for line in csv.reader(infile, delimiter='\t'):
+        yield line[0] if line else ''
 
 
 def main_parse_args():
@@ -184,6 +627,8 @@ if __name__ == "__main__":
     args = main_parse_args()
     if args.mode == 'EDGE':
         main(args.infile, args)
+        if CONV_CACHE is not None and args.map_cache_file:
+            CONV_CACHE.dump(args.map_cache_file)
     elif args.mode == 'LIST':
         map_list(args.infile, args)
     else:
@@ -8,10 +8,27 @@ Classes:
 Functions:
     get_SrcClass: returns an Ensembl object
     fetch: performs a fetch for ensembl
+    download_tables: downloads the schema and tables of a species concurrently
+    download_table: downloads one gzipped file of a species
+    ingest: fetches many species on a pool of worker processes
+    init_ingest_worker: sets up an ingest worker process
+    ingest_worker: fetches one species in an ingest worker process
+    db_import: imports the fetched tables into MySQL and builds the mappings
+    db_direct: builds the mappings from the fetched table dumps
+    join_mappings: joins the table dumps into the rows of <alias>_mappings
+    read_schema: returns the columns of each table in the ensembl schema
+    read_dump: yields the rows of a fetched table dump
+    read_rows: yields the unescaped fields of each line of a dump file
+    unescape_dump: reverses the escaping of a field of a dump file
+    escape_dump: escapes a field for a dump file
     main: runs compare_versions (see utilities.py) on a Ensembl object
 
 Variables:
     TABLE_LIST: list of tables of interest from Ensembl
+    DUMP_ENCODING: encoding used to read and write table dumps
+    DUMP_ESCAPES: characters of the backslash escapes of table dumps
+    IMPORT_SLOTS: semaphore capping concurrent imports in ingest workers
+    WORKER_ARGS: the args of an ingest worker process
 """
 import ftplib
 import json
@@ -20,16 +37,27 @@ import re
 import time
 import os
 import shutil
+import gzip
+import sys
+import subprocess
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
 import mysql.connector
 from check_utilities import SrcClass, compare_versions
 import config_utilities as cf
-from fetch_utilities import download
 import mysql_utilities as db
+import import_utilities as iu
 import redis_utilities as ru
 import fetch_utilities as fu
 
 TABLE_LIST = ['external_db', 'gene', 'object_xref', 'transcript',
               'translation', 'xref', 'external_synonym']
+DUMP_ENCODING = 'latin-1'
+IMPORT_SLOTS = None
+WORKER_ARGS = None
+DUMP_ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
 
 def get_SrcClass(args):
     """Returns an object of the source class.
@@ -47,8 +75,15 @@ def get_SrcClass(args):
 def fetch(version_dict, args=cf.config_args()):
     """Fetches all mysql tables and syntax for alias described by version_json.
 
-    This takes the path to a version_json (source.alias.json) and downloads
-    all relevant tables (see fetch_utilites.download).
+    This takes the path to a version_json (source.alias.json), downloads
+    all relevant tables (see download_tables) and imports them (see db_import
+    and db_direct). In an ingest worker, the import waits for one of the
+    IMPORT_SLOTS, so only args.ens_import_workers species are imported at a
+    time while the other workers keep downloading. The mappings of an
+    earlier release are stashed first, so the import replaces them (see
+    redis_utilities.import_ensembl), and only then are the all_mappings rows
+    of alias deleted before they are loaded again. The release is recorded in raw_file
+    once the species is loaded.
 
     Args:
         version_dict (dict): version dictionary describing the source:alias
@@ -56,22 +91,181 @@ def fetch(version_dict, args=cf.config_args()):
 
     Returns:
     """
-    shutil.move(download(version_dict), 'schema.sql')
-    base_url = version_dict['remote_url']
-    base_url = base_url[:base_url.rfind('/') + 1]
-    for table in TABLE_LIST:
-        version_dict['remote_url'] = base_url + table + '.txt.gz'
-        shutil.move(download(version_dict), table + '.txt')
+    start = time.time()
+    download_tables(version_dict, args)
+    cf.CSVM.writerow(['run info', 'ens_download_seconds',
+                      '{0:.1f}'.format(time.time() - start)])
+    importer = db_direct if args.ens_direct else db_import
+    map_dir = os.path.join(args.working_dir, args.data_path, cf.DEFAULT_MAP_PATH)
+    refresh = bool(ru.stash_mappings(map_dir, version_dict['alias']))
+    if refresh:
+        print('Refreshing the mappings of ' + version_dict['alias'])
+    start = time.time()
+    if IMPORT_SLOTS is not None:
+        IMPORT_SLOTS.acquire()
+        cf.CSVM.writerow(['run info', 'ens_import_wait_seconds',
+                          '{0:.1f}'.format(time.time() - start)])
+        start = time.time()
     try:
-        db_import(version_dict, args)
+        importer(version_dict, args, refresh)
     except mysql.connector.DatabaseError as err:
         print('Encountered error: ' + str(err))
         print('Trying operation again')
-        db_import(version_dict, args)
+        importer(version_dict, args, True)
     except:
         raise
+    finally:
+        if IMPORT_SLOTS is not None:
+            IMPORT_SLOTS.release()
+    cf.CSVM.writerow(['run info', 'ens_import_seconds',
+                      '{0:.1f}'.format(time.time() - start)])
+    version_dict['checksum'] = None
+    iu.update_filemeta(version_dict, args)
+
+def download_tables(version_dict, args=cf.config_args()):
+    """Downloads the schema and TABLE_LIST tables of alias concurrently.
+
+    The schema is saved as schema.sql and each table as table + '.txt', or
+    kept gzipped as table + '.txt.gz' if args.ens_direct is set (see
+    read_dump). args.ens_download_workers files are downloaded at a time.
+
+    Args:
+        version_dict (dict): version dictionary describing the source:alias
+        args: populated namespace from argparse
+    """
+    schema_url = version_dict['remote_url']
+    base_url = schema_url[:schema_url.rfind('/') + 1]
+    files = [(schema_url, 'schema.sql', False)]
+    for table in TABLE_LIST:
+        files.append((base_url + table + '.txt.gz', table + '.txt', args.ens_direct))
+    workers = max(args.ens_download_workers, 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(download_table, *download) for download in files]
+        for future in futures:
+            future.result()
+
+def download_table(url, filename, compressed=False):
+    """Downloads a gzipped file and saves it as filename.
+
+    Args:
+        url (str): the url of the gzipped file
+        filename (str): the name of the uncompressed file
+        compressed (bool): if the file should be kept as filename + '.gz'
+    """
+    print('Downloading ' + url)
+    gzfile = filename + '.gz'
+    openfunc = fu.opener.open if 'http' in url else urllib.request.urlopen
+    fu.openurl(url, gzfile, openfunc, tries=3, sleeptime=10)
+    if compressed:
+        if os.path.isfile(filename):
+            os.remove(filename)
+        return
+    with gzip.open(gzfile) as infile:
+        with open(filename, 'wb') as outfile:
+            shutil.copyfileobj(infile, outfile)
+    os.remove(gzfile)
+
+def ingest(jobs, args=None):
+    """Fetches many ensembl species on a pool of worker processes.
+
+    Each worker runs fetch_utilities.main for one species at a time, so
+    args.ens_workers species are downloaded concurrently. The imports into
+    MySQL and Redis are capped at args.ens_import_workers at a time (see
+    fetch), which pipelines the downloads of some species with the imports
+    of others. Species are queued from the largest to the smallest remote
+    size. The mappings that the refreshed species shared with others are
+    rebuilt once all species are loaded (see
+    redis_utilities.replay_cleared).
+
+    Args:
+        jobs (list): (metadata_json, logfile) tuples to fetch (see
+            ingest_worker)
+        args (Namespace): args as populated namespace or 'None' for defaults,
+            args.ens_workers sets the number of workers, 0 for one per species
+
+    Returns:
+        list: the metadata_json files that failed
+    """
+    if args is None:
+        args = cf.config_args()
+    failed = []
+    if not jobs:
+        return failed
+    sizes = dict()
+    for (metadata_json, _) in jobs:
+        with open(metadata_json) as infile:
+            sizes[metadata_json] = json.load(infile).get('remote_size', 0)
+    jobs = sorted(jobs, key=lambda job: sizes[job[0]], reverse=True)
+    workers = args.ens_workers if args.ens_workers > 0 else len(jobs)
+    workers = min(workers, len(jobs))
+    import_slots = multiprocessing.BoundedSemaphore(max(args.ens_import_workers, 1))
+    print('Fetching {0} species on {1} workers, importing {2} at a time'.format(
+        len(jobs), workers, max(args.ens_import_workers, 1)))
+    start = time.time()
+    with multiprocessing.Pool(workers, init_ingest_worker, (args, import_slots)) as pool:
+        for ctr, (metadata_json, secs, error) in \
+            enumerate(pool.imap_unordered(ingest_worker, jobs, chunksize=1), 1):
+            alias = os.path.basename(os.path.dirname(metadata_json))
+            print('\t'.join([str(ctr), alias, '{0:.1f}s'.format(secs),
+                             'failed: ' + error if error else 'done']))
+            if error:
+                failed.append(metadata_json)
+    cf.CSVM.writerow(['run info', 'ens_ingest_seconds', '{0:.1f}'.format(time.time() - start)])
+    ru.replay_cleared(args)
+    return failed
+
+def init_ingest_worker(args, import_slots):
+    """Sets the args and import semaphore of an ingest worker process.
 
-def db_import(version_dict, args=cf.config_args()):
+    Args:
+        args (Namespace): args as populated namespace
+        import_slots (multiprocessing.BoundedSemaphore): the import cap shared
+            by all workers
+    """
+    global WORKER_ARGS, IMPORT_SLOTS
+    WORKER_ARGS = args
+    IMPORT_SLOTS = import_slots
+
+def ingest_worker(job):
+    """Fetches one species in an ingest worker process.
+
+    Runs fetch_utilities.main in the directory of metadata_json and writes
+    its output to the log file of the job, as a LOCAL fetcher job would.
+
+    Args:
+        job (tuple): the path of the file_metadata.json of the species and
+            the path of its log file
+
+    Returns:
+        tuple: the metadata_json, the seconds it took and the error message
+            or None if it succeeded
+    """
+    metadata_json, logfile = job
+    start = time.time()
+    error = None
+    cwd = os.getcwd()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    with open(logfile, 'w') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            os.chdir(os.path.dirname(metadata_json))
+            fu.main(os.path.basename(metadata_json), WORKER_ARGS)
+        except Exception as ex1:
+            traceback.print_exc(file=sys.stdout)
+            error = repr(ex1)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.chdir(cwd)
+            for (fd, saved_fd) in zip([1, 2], saved):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+    return metadata_json, time.time() - start, error
+
+def db_import(version_dict, args=cf.config_args(), refresh=False):
     """Imports the data into the database and saves local id mapping
     dictionaries.
 
@@ -82,19 +276,258 @@ def db_import(version_dict, args=cf.config_args()):
     Args:
         version_json (dict): path to the version dictionary describing the
             source:alias
+        refresh (bool): if all_mappings may hold rows of alias to replace
 
     Returns:
     """
     db.import_ensembl(version_dict['alias'], args)
-    db.combine_tables(version_dict['alias'], args)
+    db.combine_tables(version_dict['alias'], args, refresh)
     db.query_all_mappings(version_dict, args)
     node_table = db.import_nodes(version_dict, args)
     ru.import_gene_nodes(node_table, args)
-    ru.import_ensembl(version_dict['alias'], args)
+    ru.import_ensembl(version_dict['alias'], args, IMPORT_SLOTS is None)
     db_name = 'ensembl_' + version_dict['alias']
     mysql_db = db.get_database(db_name, args)
     mysql_db.drop_db(db_name)
 
+def db_direct(version_dict, args=cf.config_args(), refresh=False):
+    """Builds the mappings and gene nodes directly from the fetched table
+    dumps and saves local id mapping files.
+
+    This is the same as db_import, but instead of importing the tables into a
+    temporary ensembl_<alias> MySQL database and joining them there, it joins
+    the fetched dumps in memory (see join_mappings). The mapping rows are
+    loaded into KnowNet.all_mappings, alias + '_all.tsv' is written as by
+    mysql_utilities.query_all_mappings and the gene nodes are loaded as by
+    mysql_utilities.import_nodes, before importing both into Redis.
+
+    Args:
+        version_dict (dict): the version dictionary describing the
+            source:alias
+        args (Namespace): args as populated namespace or 'None' for defaults
+        refresh (bool): if all_mappings may hold rows of alias to replace
+    """
+    alias = version_dict['alias']
+    taxid = version_dict['alias_info'].split('::')[0]
+    map_dir = os.path.join(args.working_dir, args.data_path, cf.DEFAULT_MAP_PATH)
+    os.makedirs(map_dir, exist_ok=True)
+    schema = read_schema('schema.sql')
+    columns = ['gene_id', 'stable_id', 'biotype', 'description']
+    genes = dict()
+    for (gene_id, stable_id, biotype, desc) in read_dump('gene', schema, columns):
+        genes[gene_id] = (stable_id, biotype, desc)
+    env = dict(os.environ, LC_ALL='C')
+    rows_file = alias + '_mappings.txt'
+    keys_file = alias + '_keys.txt'
+    lrg_dict = dict()
+    stable_ids = set()
+    with open(rows_file, 'w', encoding=DUMP_ENCODING) as rows_out, \
+            open(keys_file, 'w', encoding=DUMP_ENCODING) as keys_out:
+        for row in join_mappings(schema, genes):
+            (acc, label, db_name, priority, db_display_name, stable_id) = row
+            upper = [None if val is None else val.upper() for val in row]
+            upper[3] = priority
+            rows_out.write('\t'.join(escape_dump(val) for val in upper + [alias]) + '\n')
+            for (raw, rank) in [(label, '0'), (acc, '1')]:
+                raw = str(raw).replace("::", "|")
+                keys_out.write('\t'.join([escape_dump(db_name), escape_dump(raw), rank,
+                                          escape_dump(stable_id)]) + '\n')
+            if db_name.upper() == 'ENS_LRG_GENE':
+                lrg_dict[str(acc)] = max(str(stable_id), lrg_dict.get(str(acc), ''))
+            stable_ids.add(stable_id)
+    cmd = ['sort', '-u', '-T', '.', '-o', rows_file, rows_file]
+    print(' '.join(cmd))
+    subprocess.check_call(cmd, env=env)
+    cmd = ['sort', '-t', '\t', '-k1,2', '-k3,3r', '-k4,4', '-T', '.', '-o',
+           keys_file, keys_file]
+    print(' '.join(cmd))
+    subprocess.check_call(cmd, env=env)
+    mysql_db = db.MySQL(None, args)
+    mysql_db.init_knownet()
+    mysql_db.use_db('KnowNet')
+    if refresh:
+        mysql_db.run("DELETE FROM all_mappings WHERE species='" + alias + "'")
+    mysql_db.load_data(rows_file, 'all_mappings', enc='')
+    map_file = os.path.join(map_dir, alias + '_all.tsv')
+    db.write_all_mappings(map_file, taxid, lrg_dict, sorted(stable_ids, key=str),
+                          ((raw, hint, mapped) for (hint, raw, _, mapped)
+                           in read_rows(keys_file)))
+    node_files = [alias + '_' + table + '.txt' for table in
+                  ['node', 'node_species', 'node_meta']]
+    node_table = set()
+    with open(node_files[0], 'w', encoding=DUMP_ENCODING) as node_out, \
+            open(node_files[1], 'w', encoding=DUMP_ENCODING) as species_out, \
+            open(node_files[2], 'w', encoding=DUMP_ENCODING) as meta_out:
+        for (stable_id, biotype, desc) in genes.values():
+            node_id = None if stable_id is None else stable_id.upper()
+            n_alias = None if desc is None else desc[:512]
+            node_out.write('\t'.join(escape_dump(val) for val in
+                                     [node_id, n_alias, 'Gene']) + '\n')
+            species_out.write('\t'.join([escape_dump(node_id), taxid]) + '\n')
+            meta_out.write('\t'.join(escape_dump(val) for val in
+                                     [node_id, 'biotype', biotype]) + '\n')
+            meta_out.write('\t'.join([escape_dump(node_id), 'taxid', taxid]) + '\n')
+            node_table.add((node_id, desc, 'Gene'))
+    for (node_file, table) in zip(node_files, ['node', 'node_species', 'node_meta']):
+        mysql_db.load_data(node_file, table, enc='')
+    mysql_db.close()
+    for filename in [rows_file, keys_file] + node_files:
+        os.remove(filename)
+    ru.import_gene_nodes(node_table, args)
+    ru.import_ensembl(alias, args, IMPORT_SLOTS is None)
+
+def join_mappings(schema, genes):
+    """Yields the rows of the <alias>_mappings table from the table dumps.
+
+    This performs the joins of each step of mysql_utilities.get_insert_cmd
+    with dictionaries of the gene, transcript, translation, xref,
+    external_db and external_synonym dumps, streaming the object_xref dump
+    once. Rows may repeat.
+
+    Args:
+        schema (dict): the columns of each table (see read_schema)
+        genes (dict): the stable_id, biotype and description of each gene_id
+
+    Yields:
+        tuple: the dbprimary_acc, display_label, db_name, priority,
+            db_display_name and gene stable_id of each mapping
+    """
+    columns = ['external_db_id', 'db_name', 'priority', 'db_display_name']
+    external_dbs = dict()
+    for (external_db_id, db_name, priority, db_display_name) in \
+            read_dump('external_db', schema, columns):
+        external_dbs[external_db_id] = (db_name, priority, db_display_name)
+    columns = ['transcript_id', 'gene_id', 'stable_id']
+    transcripts = dict()
+    for (transcript_id, gene_id, stable_id) in read_dump('transcript', schema, columns):
+        transcripts[transcript_id] = (stable_id, gene_id)
+    columns = ['translation_id', 'transcript_id', 'stable_id']
+    translations = dict()
+    for (translation_id, transcript_id, stable_id) in \
+            read_dump('translation', schema, columns):
+        translations[translation_id] = (stable_id, transcript_id)
+    columns = ['xref_id', 'dbprimary_acc', 'display_label', 'external_db_id']
+    xrefs = dict()
+    for (xref_id, acc, label, external_db_id) in read_dump('xref', schema, columns):
+        if external_db_id in external_dbs:
+            xrefs[xref_id] = (acc, label) + external_dbs[external_db_id]
+    synonyms = defaultdict(list)
+    for (xref_id, synonym) in read_dump('external_synonym', schema, ['xref_id', 'synonym']):
+        synonyms[xref_id].append(synonym)
+    columns = ['ensembl_id', 'ensembl_object_type', 'xref_id']
+    for (ensembl_id, object_type, xref_id) in read_dump('object_xref', schema, columns):
+        gene_id = None
+        if object_type == 'Gene':
+            gene_id = ensembl_id
+        elif object_type == 'Transcript':
+            gene_id = transcripts.get(ensembl_id, (None, None))[1]
+        elif object_type == 'Translation':
+            transcript_id = translations.get(ensembl_id, (None, None))[1]
+            gene_id = transcripts.get(transcript_id, (None, None))[1]
+        if gene_id in genes and xref_id in xrefs:
+            yield xrefs[xref_id] + (genes[gene_id][0], )
+        # the synonyms step joins on gene_id for every object type
+        if xref_id in synonyms and ensembl_id in genes:
+            for synonym in synonyms[xref_id]:
+                yield (synonym, synonym, 'ensembl_external_synonym', '1000',
+                       'ensembl_external_synonym', genes[ensembl_id][0])
+    for (stable_id, gene_id) in transcripts.values():
+        if gene_id in genes:
+            yield (stable_id, stable_id, 'ensembl', '1000', 'ensembl',
+                   genes[gene_id][0])
+    for (stable_id, transcript_id) in translations.values():
+        gene_id = transcripts.get(transcript_id, (None, None))[1]
+        if gene_id in genes:
+            yield (stable_id, stable_id, 'ensembl', '1000', 'ensembl',
+                   genes[gene_id][0])
+
+def read_schema(sqlfile):
+    """Returns the columns of each table created in sqlfile.
+
+    Args:
+        sqlfile (str): the ensembl schema.sql file
+
+    Returns:
+        dict: the list of column names of each table
+    """
+    schema = dict()
+    table = None
+    with open(sqlfile, encoding=DUMP_ENCODING) as infile:
+        for line in infile:
+            match = re.match(r'CREATE TABLE (?:IF NOT EXISTS )?`?(\w+)`?', line)
+            if match is not None:
+                table = match.group(1)
+                schema[table] = list()
+            elif table is not None:
+                match = re.match(r'\s+`(\w+)`', line)
+                if match is not None:
+                    schema[table].append(match.group(1))
+                elif line.startswith(')'):
+                    table = None
+    return schema
+
+def read_dump(table, schema, columns):
+    """Yields the requested columns of each row of a fetched table dump.
+
+    Reads table + '.txt' as written by fetch, or table + '.txt.gz'.
+
+    Args:
+        table (str): the table name
+        schema (dict): the columns of each table (see read_schema)
+        columns (list): the names of the columns to return
+
+    Yields:
+        tuple: the requested columns of a row, None for NULL
+    """
+    idxs = [schema[table].index(column) for column in columns]
+    filename = table + '.txt'
+    if not os.path.isfile(filename) and os.path.isfile(filename + '.gz'):
+        filename += '.gz'
+    for row in read_rows(filename):
+        yield tuple(row[idx] for idx in idxs)
+
+def read_rows(filename):
+    """Yields the fields of each line of a tab separated dump file.
+
+    Args:
+        filename (str): the dump file, which may be gzipped
+
+    Yields:
+        list: the unescaped fields of a line (see unescape_dump)
+    """
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rt', encoding=DUMP_ENCODING) as infile:
+        for line in infile:
+            yield [unescape_dump(val) for val in line.rstrip('\n').split('\t')]
+
+def unescape_dump(field):
+    """Reverses the MySQL escaping of a field of a dump file.
+
+    Args:
+        field (str): the escaped field
+
+    Returns:
+        str: the original value, or None for NULL
+    """
+    if field == '\\N':
+        return None
+    if '\\' not in field:
+        return field
+    return re.sub(r'\\(.)', lambda m: DUMP_ESCAPES.get(m.group(1), m.group(1)), field)
+
+def escape_dump(field):
+    """Escapes a field for a dump file loaded with LOAD DATA.
+
+    Args:
+        field (str): the value, or None for NULL
+
+    Returns:
+        str: the escaped field
+    """
+    if field is None:
+        return '\\N'
+    return str(field).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
 def species_import(alias_dict, args=cf.config_args()):
     """Produces the species.txt file and imports it into the database. Also
     creates a species.json file.
@@ -3,6 +3,7 @@ from datetime import datetime, timezone
 import os
 import sys
 import csv
+import time
 import subprocess
 from collections import defaultdict
 import yaml
@@ -15,23 +16,49 @@ import mysql_utilities as mu
 import sanitize_utilities as su
 
 def get_gg(db, et, taxon):
-    """Get gene-gene nodes.
+    """Get gene-gene nodes, streamed from the server (see MySQL.iterate).
     """
-    return db.run("SELECT s.n1_id, s.n2_id, s.weight, s.et_name, rl.file_id, rl.line_num "
-                  "FROM status s JOIN node_species n1 ON s.n1_id = n1.node_id "
-                  "JOIN node_species n2 ON s.n2_id = n2.node_id "
-                  "JOIN raw_line rl ON s.line_hash = rl.line_hash "
-                  "WHERE s.et_name = '{}' AND n1.taxon = {} AND n2.taxon = {} "
-                  "AND s.status = 'production';".format(et, taxon, taxon))
+    return db.iterate("SELECT s.n1_id, s.n2_id, s.weight, s.et_name, s.file_id, s.line_num "
+                      "FROM status s JOIN node_species n1 ON s.n1_id = n1.node_id "
+                      "JOIN node_species n2 ON s.n2_id = n2.node_id "
+                      "WHERE s.et_name = '{}' AND n1.taxon = {} AND n2.taxon = {} "
+                      "AND s.status = 'production'".format(et, taxon, taxon))
 
 def get_pg(db, et, taxon):
-    """Get property-gene nodes.
+    """Get property-gene nodes, streamed from the server (see MySQL.iterate).
     """
-    return db.run("SELECT s.n1_id, s.n2_id, s.weight, s.et_name, rl.file_id, rl.line_num "
-                  "FROM status s JOIN node_species n2 ON s.n2_id = n2.node_id "
-                  "JOIN raw_line rl ON s.line_hash = rl.line_hash "
-                  "WHERE s.et_name = '{}' AND n2.taxon = {} "
-                  "AND s.status = 'production';".format(et, taxon))
+    return db.iterate("SELECT s.n1_id, s.n2_id, s.weight, s.et_name, s.file_id, s.line_num "
+                      "FROM status s JOIN node_species n2 ON s.n2_id = n2.node_id "
+                      "WHERE s.et_name = '{}' AND n2.taxon = {} "
+                      "AND s.status = 'production'".format(et, taxon))
+
+def benchmark_hashes(db, et, repeats=3):
+    """Reports the size of the tables keyed by hashes and the time of a join
+    of status to edge2line and edge_meta on the hash columns, to compare a
+    binary schema to a hex one.
+    """
+    mode = 'binary' if db.binary_hashes() else 'hex'
+    tables = ['raw_line', 'status', 'edge2line', 'edge_meta', 'edge']
+    for table, (data, index) in sorted(db.table_sizes(tables).items()):
+        print('{0}\t{1}\tdata {2:.1f} MB\tindex {3:.1f} MB'.format(
+            mode, table, data / 1e6, index / 1e6))
+        cf.CSVM.writerow(['run info', 'benchmark_' + table + '_data_mb', '{0:.1f}'.format(data / 1e6)])
+        cf.CSVM.writerow(['run info', 'benchmark_' + table + '_index_mb',
+                          '{0:.1f}'.format(index / 1e6)])
+    cmd = ("SELECT COUNT(*), COUNT(DISTINCT m.line_hash) "
+           "FROM status s JOIN edge2line e "
+           "ON s.edge_hash = e.edge_hash AND s.line_hash = e.line_hash "
+           "LEFT JOIN edge_meta m ON e.line_hash = m.line_hash "
+           "WHERE s.et_name = '{}' AND s.status = 'production'".format(et))
+    times = []
+    for _ in range(repeats):
+        start = time.time()
+        rows, meta_lines = db.run(cmd)[0]
+        times.append(time.time() - start)
+    print('{0}\thash join\t{1} rows\t{2} lines with metadata\tbest of {3}: {4:.2f}s'.format(
+        mode, rows, meta_lines, repeats, min(times)))
+    cf.CSVM.writerow(['run info', 'benchmark_hash_mode', mode])
+    cf.CSVM.writerow(['run info', 'benchmark_join_seconds', '{0:.2f}'.format(min(times))])
 
 def num_connected_components(edges, nodes):
     """Count the number of connected components in a graph given the edges and the nodes.
@@ -157,12 +184,18 @@ def main():
     parser = su.add_config_args(parser)
     parser.add_argument("-e", "--edge_type", help="Edge type")
     parser.add_argument("-s", "--species", help="Species")
+    parser.add_argument("-bh", "--benchmark_hashes", action='store_true', default=False,
+                        help="report table sizes and hash join time instead of exporting")
     args = parser.parse_args()
 
     db = mu.get_database(args=args)
     db.use_db("KnowNet")
 
     cls, bidir = figure_out_class(db, args.edge_type)
+    if args.benchmark_hashes:
+        benchmark_hashes(db, args.edge_type)
+        db.close()
+        return
     edges_fn = '{}.{}.edge'.format(args.species, args.edge_type)
     nodes_fn = '{}.{}.node_map'.format(args.species, args.edge_type)
     meta_fn = '{}.{}.metadata'.format(args.species, args.edge_type)
@@ -177,7 +210,7 @@ def main():
         return
 
     get = get_gg if cls == 'Gene' else get_pg
-    res = get(db, args.edge_type, args.species)
+    res = [list(row) for row in get(db, args.edge_type, args.species)]
 
     print("ProductionLines: " + str(len(res)))
     if not args.force_fetch and should_skip(cls, res):
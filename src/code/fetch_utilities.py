@@ -45,6 +45,7 @@ from argparse import ArgumentParser
 import config_utilities as cf
 import import_utilities as iu
 import table_utilities as tu
+import rawline_utilities as rl
 
 class AppURLopener(urllib.request.FancyURLopener):
     """URLopener to open with a custom user-agent."""
@@ -294,7 +295,9 @@ def main(version_json, args=None):
     (see ensembl.fetch). If the alias is a data file, it then runs raw_line
     (see raw_line) and then runs chunk (see chunk) on the output. If the alias
     is a mapping file, it runs create_mapping_dict (see create_mapping_dict in
-    SRC.py). It also updates version_json to include the total lines in and
+    SRC.py). With args.mysql_raw_store, the lines of the chunks are also
+    written to the raw line store (see rawline_utilities.build_store). It
+    also updates version_json to include the total lines in and
     md5 checksum of the fetched file. It then saves the updated version_json to
     file.
 
@@ -340,6 +343,11 @@ def main(version_json, args=None):
     else:
         #raw_line = format_raw_line(newfile)
         num_chunks = chunk(newfile, line_count, mySrc.chunk_size)
+        if args.mysql_raw_store:
+            path, file = os.path.split(newfile)
+            source_alias, ext = os.path.splitext(file)
+            chunk_file = os.path.join(path, 'chunks', source_alias + '.raw_line.')
+            rl.build_store([chunk_file + str(i) + ext for i in range(1, num_chunks + 1)], args)
     #update version_dict
     version_dict['checksum'] = md5hash
     version_dict['line_count'] = line_count
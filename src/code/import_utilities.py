@@ -1,25 +1,106 @@
 """Utiliites for importing edge, edge_meta, and node_meta into the KnowEnG
 MySQL datatbase.
 
+Contains the class ConnectionPool which lends a bounded number of KnowNet
+connections to the threads of import_files.
+
 Contains module functions::
 
     import_file(file_name, table, ld_cmd='', dup_cmd='', args=None)
+    import_files(jobs, args=None, defer_keys=False)
+    load_file(pool, file_name, table, ld_cmd='')
+    rebuild_keys(pool, dropped, tables)
+    add_keys(pool, table, keys)
     import_filemeta(version_dict, args=None)
     update_filemeta(version_dict, args=None)
     import_edge(edgefile, args=None)
+    import_status(statusfile, args=None)
     import_nodemeta(nmfile, args=None)
     import_pnode(filename, args=None)
+    import_tables(importfiles, args=None)
+    reload_edge_type(et_name, jobs, args=None)
+    import_incremental(args=None)
+    changed_files(db)
+    delete_file_rows(db, file_ids)
+    add_affected_edges(db, file_ids)
+    recompute_edges(db)
+    record_imports(db, file_ids=None)
+    merge(merge_key, args)
+    merge_edges(edge_files, outfile, temppath, args)
+    open_edges(filename)
+    collapse_edges(infiles)
+    sort_keys(table, args)
+    split_file(filename, table, parts, args)
+    get_table(importfile)
+    prepare_import(importfile, args)
+    finish_import(importfile, table, args)
 
 """
 
 import os
-import csv
+import glob
+import time
+import heapq
+import queue
+import resource
+import tempfile
 import subprocess
+import multiprocessing
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from argparse import ArgumentParser
 import config_utilities as cf
 import mysql_utilities as mu
 import redis_utilities as ru
 
+MERGE_KEYS = ['node', 'node_meta', 'edge2line', 'status', 'edge', 'edge_meta',
+              'raw_line', 'table', 'log']
+INCREMENTAL_TABLES = ['raw_line', 'node', 'node_meta', 'edge2line', 'status', 'edge_meta']
+
+class ConnectionPool(object):
+    """Class lending a bounded number of connections to a MySQL database.
+
+    Connections are opened the first time they are needed and are reused by
+    later borrowers, so at most size connections are open at once and a
+    thread asking for one while all are lent waits for one to be returned.
+
+    Attributes:
+        size (int): the number of connections
+        database (str): the database the connections use
+        args (Namespace): args as populated namespace
+        idle (Queue): connections ready to lend, None for one not yet opened
+        opened (list): every connection opened by the pool
+    """
+    def __init__(self, size, database='KnowNet', args=None):
+        """Init a ConnectionPool of size connections to database."""
+        if args is None:
+            args = cf.config_args()
+        self.size = size
+        self.database = database
+        self.args = args
+        self.idle = queue.Queue()
+        self.opened = []
+        for _ in range(size):
+            self.idle.put(None)
+
+    def get(self):
+        """Returns a connection, waiting until one is free."""
+        db = self.idle.get()
+        if db is None:
+            db = mu.get_database(self.database, self.args)
+            self.opened.append(db)
+        return db
+
+    def put(self, db):
+        """Returns a connection from get to the pool."""
+        self.idle.put(db)
+
+    def close(self):
+        """Closes every connection opened by the pool."""
+        for db in self.opened:
+            db.close()
+        self.opened = []
+
 def import_file(file_name, table, ld_cmd='', dup_cmd='', args=None):
     """Imports the provided  file into the KnowEnG MySQL database.
 
@@ -43,6 +124,162 @@ def import_file(file_name, table, ld_cmd='', dup_cmd='', args=None):
     db.load_data(file_name, table, ld_cmd)
     db.close()
 
+def load_file(pool, file_name, table, ld_cmd=''):
+    """Loads one file into its table on a connection borrowed from pool.
+
+    Args:
+        pool (ConnectionPool): the pool to borrow a KnowNet connection from
+        file_name (str): path to the file to be imported
+        table (str): name of the permanent table to import to
+        ld_cmd (str): optional additional command for loading data
+
+    Returns:
+        tuple: the table, the number of rows loaded and the seconds taken
+    """
+    db = pool.get()
+    try:
+        start = time.time()
+        rows = db.load_data(file_name, table, ld_cmd)
+        return table, rows, time.time() - start
+    finally:
+        pool.put(db)
+
+def import_files(jobs, args=None, defer_keys=False):
+    """Imports many files into the KnowEnG MySQL database at once.
+
+    Each file is loaded with LOAD DATA on a thread holding a connection of a
+    ConnectionPool, so at most args.mysql_load_workers files are loaded at a
+    time and independent tables fill concurrently. The files are queued from
+    the largest to the smallest so a large table does not start last. The
+    rows, seconds and throughput of each table are printed and written as
+    run info.
+
+    With defer_keys, the secondary keys of the loaded tables are dropped
+    before the loads and rebuilt after them (see rebuild_keys), so the loads
+    only maintain the primary keys. This is only worth it for a bulk load of
+    whole tables, and must not run in concurrent jobs loading the same
+    tables, so only the IMPORT step sets it (see import_tables and main). With args.mysql_partitions,
+    partitions are first added for any new edge type of the loaded tables
+    (see mysql_utilities.MySQL.partition_tables).
+
+    Args:
+        jobs (list): (file_name, table, ld_cmd) tuples to load
+        args (Namespace): args as populated namespace or 'None' for defaults,
+            args.mysql_load_workers sets the number of connections, 0 for one
+            per core
+        defer_keys (bool): if the secondary keys are rebuilt after the loads
+
+    Returns:
+        dict: the rows, bytes and seconds loaded into each table
+    """
+    if args is None:
+        args = cf.config_args()
+    stats = dict()
+    if not jobs:
+        return stats
+    jobs = sorted(jobs, key=lambda job: os.path.getsize(job[0]), reverse=True)
+    workers = args.mysql_load_workers
+    if workers <= 0:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(jobs))
+    print('Importing {0} files on {1} connections'.format(len(jobs), workers))
+    pool = ConnectionPool(workers, 'KnowNet', args)
+    start = time.time()
+    tables = sorted(set(job[1] for job in jobs))
+    dropped = dict()
+    try:
+        if defer_keys or args.mysql_partitions:
+            db = pool.get()
+            try:
+                if args.mysql_partitions:
+                    db.partition_tables(tables)
+                if defer_keys:
+                    dropped = db.drop_secondary_keys(tables)
+            finally:
+                pool.put(db)
+        with ThreadPoolExecutor(workers) as executor:
+            futures = dict()
+            for file_name, table, ld_cmd in jobs:
+                future = executor.submit(load_file, pool, file_name, table, ld_cmd)
+                futures[future] = file_name
+            for future in as_completed(futures):
+                table, rows, secs = future.result()
+                size = os.path.getsize(futures[future])
+                print('\t'.join([table, os.path.basename(futures[future]),
+                                 '{0} rows'.format(rows), '{0:.1f}s'.format(secs)]))
+                table_stats = stats.setdefault(table, {'rows': 0, 'bytes': 0, 'seconds': 0})
+                table_stats['rows'] += rows
+                table_stats['bytes'] += size
+                table_stats['seconds'] += secs
+    finally:
+        try:
+            if defer_keys:
+                rebuild_keys(pool, dropped, tables)
+        finally:
+            pool.close()
+    for table in sorted(stats):
+        table_stats = stats[table]
+        secs = max(table_stats['seconds'], 0.001)
+        mb_per_sec = table_stats['bytes'] / 1e6 / secs
+        rows_per_sec = table_stats['rows'] / secs
+        print('{0}: {1} rows, {2:.1f} MB in {3:.1f}s ({4:.1f} MB/s, {5:.0f} rows/s)'.format(
+            table, table_stats['rows'], table_stats['bytes'] / 1e6,
+            table_stats['seconds'], mb_per_sec, rows_per_sec))
+        cf.CSVM.writerow(['run info', 'import_' + table + '_rows', table_stats['rows']])
+        cf.CSVM.writerow(['run info', 'import_' + table + '_seconds',
+                          '{0:.1f}'.format(table_stats['seconds'])])
+        cf.CSVM.writerow(['run info', 'import_' + table + '_mb_per_sec',
+                          '{0:.1f}'.format(mb_per_sec)])
+    cf.CSVM.writerow(['run info', 'import_files_seconds', '{0:.1f}'.format(time.time() - start)])
+    return stats
+
+def rebuild_keys(pool, dropped, tables):
+    """Rebuilds the secondary keys dropped for a bulk load and checks the
+    schema of their tables.
+
+    The keys of each table are added with a single ALTER TABLE (see
+    add_keys) and the tables are rebuilt concurrently on the connections of
+    pool. The loaded tables are then checked against KnowNet.sql (see
+    mysql_utilities.MySQL.verify_schema).
+
+    Args:
+        pool (ConnectionPool): the pool to borrow KnowNet connections from
+        dropped (dict): the list of dropped key names of each table, as
+            returned by mysql_utilities.MySQL.drop_secondary_keys
+        tables (list): the loaded tables
+    """
+    start = time.time()
+    if dropped:
+        with ThreadPoolExecutor(min(pool.size, len(dropped))) as executor:
+            for table, secs in executor.map(lambda table: add_keys(pool, table, dropped[table]),
+                                            sorted(dropped)):
+                print('{0}: rebuilt keys in {1:.1f}s'.format(table, secs))
+    db = pool.get()
+    try:
+        db.verify_schema(tables)
+    finally:
+        pool.put(db)
+    cf.CSVM.writerow(['run info', 'import_keys_seconds', '{0:.1f}'.format(time.time() - start)])
+
+def add_keys(pool, table, keys):
+    """Adds keys to table on a connection borrowed from pool.
+
+    Args:
+        pool (ConnectionPool): the pool to borrow a KnowNet connection from
+        table (str): the table to add the keys to
+        keys (list): the key names to add from KnowNet.sql
+
+    Returns:
+        tuple: the table and the seconds taken
+    """
+    db = pool.get()
+    try:
+        start = time.time()
+        db.add_secondary_keys(table, keys)
+        return table, time.time() - start
+    finally:
+        pool.put(db)
+
 def import_file_nokeys(file_name, table, ld_cmd='', args=None):
     """Imports the provided  file into the KnowEnG MySQL database using optimal
     settings.
@@ -91,7 +328,9 @@ def enable_keys(args=None):
 def import_filemeta(version_dict, args=None):
     """Imports the provided version_dict into the KnowEnG MySQL database.
 
-    Loads the data from an version dictionary into the raw_file table.
+    Loads the data from an version dictionary into the raw_file table. The
+    checksum of an unchanged file (see check_utilities.compare_versions) is
+    kept, so import_incremental only reloads the sources fetched again.
 
     Args:
         version_dict (dict): version dictionary describing a downloaded file
@@ -105,7 +344,8 @@ def import_filemeta(version_dict, args=None):
               version_dict["remote_version"], version_dict["remote_size"],
               version_dict["source_url"], version_dict["image"], version_dict["reference"],
               version_dict["pmid"], version_dict["license"],
-              'CURRENT_TIMESTAMP', version_dict["local_file_name"], 'NULL']
+              'CURRENT_TIMESTAMP', version_dict["local_file_name"],
+              version_dict.get("checksum") or 'NULL']
     cmd = 'VALUES( ' + ','.join('%s' for i in values) + ')'
     db.replace_safe('raw_file', cmd, values)
     db.close()
@@ -139,7 +379,8 @@ def import_edge(edgefile, args=None):
     Loads the data into a temporary table in MySQL. It then queries from the
     temporary table into the corresponding permanent table. If a duplication
     occurs during the query, it updates to the maximum edge score if it is an
-    edge file, and ignores if it is metadata.
+    edge file, and ignores if it is metadata. The tables are loaded
+    concurrently (see import_files).
 
     Args:
         edgefile (str): path to the file to be imported
@@ -150,9 +391,9 @@ def import_edge(edgefile, args=None):
     imports = ['node', 'node_meta', 'edge2line', 'edge', 'edge_meta']
     #uedge_cmd  = ('edge.weight = IF(edge.weight > {0}.weight, edge.weight, '
     #                '{0}.weight)')
+    jobs = []
     for table in imports:
         ld_cmd = ''
-        dup_cmd = ''
         if table == 'edge':
             filename = edgefile
         else:
@@ -162,7 +403,8 @@ def import_edge(edgefile, args=None):
             filename = ufile
         if not os.path.isfile(filename):
             continue
-        import_file(filename, table, ld_cmd, dup_cmd, args)
+        jobs.append((filename, table, ld_cmd))
+    import_files(jobs, args)
 
 def import_production_edges(args=None):
     """Query production edges from status table into the edge table.
@@ -192,18 +434,19 @@ def import_status(statusfile, args=None):
     Loads the data into a temporary table in MySQL. It then queries from the
     temporary table into the corresponding permanent table. If a duplication
     occurs during the query, it updates to the maximum edge score if it is an
-    edge file, and ignores if it is metadata.
+    edge file, and ignores if it is metadata. The tables are loaded
+    concurrently (see import_files).
 
     Args:
-        status (str): path to the file to be imported
+        statusfile (str): path to the file to be imported
         args (Namespace): args as populated namespace or 'None' for defaults
     """
     if args is None:
         args = cf.config_args()
     imports = ['node', 'node_meta', 'edge2line', 'status', 'edge_meta']
+    jobs = []
     for table in imports:
         ld_cmd = ''
-        dup_cmd = ''
         if table == 'status':
             filename = statusfile
         else:
@@ -213,7 +456,8 @@ def import_status(statusfile, args=None):
             filename = ufile
         if not os.path.isfile(filename):
             continue
-        import_file(filename, table, ld_cmd, dup_cmd, args)
+        jobs.append((filename, table, ld_cmd))
+    import_files(jobs, args)
 
 def import_nodemeta(nmfile, args=None):
     """Imports the provided node_meta file and any corresponding meta files into
@@ -260,7 +504,11 @@ def merge(merge_key, args):
 
     This takes a table type (one of: node, node_meta, edge2line, status, or
     edge_meta) and merges them using the unix sort command while removing any
-    duplicate elements.
+    duplicate elements. The rows of a table with a primary key in KnowNet.sql
+    are written in primary key order (see sort_keys), so InnoDB appends to
+    its clustered index instead of splitting pages during the load. The edge
+    files are merged keeping the highest weight of each edge (see
+    merge_edges).
 
     Args:
         merge_key (str): table type (one of: node, node_meta, edge2line, status,
@@ -274,60 +522,206 @@ def merge(merge_key, args):
     else:
         searchpath = os.path.join(args.working_dir, args.data_path)
     outpath = os.path.join(args.working_dir, args.data_path)
-    if merge_key == 'edge':
-        outfile = os.path.join(outpath, 'unique-sort.' + merge_key + '.txt')
-    else:
-        outfile = os.path.join(outpath, 'unique.' + merge_key + '.txt')
+    outfile = os.path.join(outpath, 'unique.' + merge_key + '.txt')
     searchpath = os.path.join(searchpath, '*', '*', '*')
+    temppath = os.path.join(outpath, 'tmp')
+    if not os.path.isdir(temppath):
+        os.makedirs(temppath)
+    cmd1 = ['find', searchpath, '-type', 'f',
+            '-name', '*.unique.'+merge_key+'.*', '-print0']
+    print(' '.join(cmd1))
+    if merge_key == 'edge':
+        found = subprocess.check_output(' '.join(cmd1), shell=True)
+        edge_files = sorted(name.decode() for name in found.split(b'\0') if name)
+        return merge_edges(edge_files, outfile, temppath, args)
+    keys = sort_keys(merge_key, args)
     with open(outfile, 'w') as out:
-        cmd1 = ['find', searchpath, '-type', 'f',
-                '-name', '*.unique.'+merge_key+'.*', '-print0']
-        temppath = os.path.join(outpath, 'tmp')
-        if not os.path.isdir(temppath):
-            os.makedirs(temppath)
-        cmd2 = ['xargs', '-0', 'sort', '-mu', '-T', temppath]
-        print(' '.join(cmd1))
-        print(' '.join(cmd2))
+        if keys:
+            # the files are sorted by whole line, so they are sorted again
+            # rather than merged
+            cmd2 = ['sort', '--files0-from=-', '-T', temppath] + keys
+            cmd3 = ['uniq']
+        else:
+            cmd2 = ['xargs', '-0', 'sort', '-mu', '-T', temppath]
+            cmd3 = []
+        print(' '.join(cmd2 + cmd3))
+        env = dict(os.environ, LC_ALL='C') if keys else None
         p1 = subprocess.Popen(' '.join(cmd1), stdout=subprocess.PIPE, shell=True)
-        subprocess.Popen(cmd2, stdin=p1.stdout, stdout=out).communicate()
+        if cmd3:
+            p2 = subprocess.Popen(cmd2, stdin=p1.stdout, stdout=subprocess.PIPE, env=env)
+            subprocess.Popen(cmd3, stdin=p2.stdout, stdout=out).communicate()
+        else:
+            subprocess.Popen(cmd2, stdin=p1.stdout, stdout=out).communicate()
+    return outfile
 
-    if merge_key != 'edge':
-        return outfile
-
-    us_file = outfile
-    ud_file = os.path.join(outpath, 'unique-dup.edge.txt')
-    ue_file = os.path.join(outpath, 'unique.edge.txt')
-    with open(us_file, 'r') as infile, \
-        open(ud_file, 'w') as edge:
-        reader = csv.reader(infile, delimiter='\t')
-        writer = csv.writer(edge, delimiter='\t', lineterminator='\n')
-        prev = False
-        for line in reader:
-            line = line[1:] + [line[0]]
-            e_chksum = line[4]
-            weight = line[3]
-            if not prev:
-                prev = line
-            if e_chksum != prev[4]:
-                writer.writerow(prev)
-                prev = line
-            elif float(weight) > float(prev[3]):
-                prev = line
-        if prev:
-            writer.writerow(prev)
-    os.remove(us_file)
-    with open(ue_file, 'w') as out:
-        cmd1 = ['cat', ud_file]
-        temppath = os.path.join(outpath, 'tmp')
-        if not os.path.isdir(temppath):
-            os.makedirs(temppath)
-        cmd2 = ['sort', '-u', '-T', temppath]
-        print(' '.join(cmd1))
-        print(' '.join(cmd2))
-        p1 = subprocess.Popen(cmd1, stdout=subprocess.PIPE)
-        subprocess.Popen(cmd2, stdin=p1.stdout, stdout=out).communicate()
-    os.remove(ud_file)
-    return ue_file
+def merge_edges(edge_files, outfile, temppath, args):
+    """Merges the unique edge files of the map step into outfile in one pass.
+
+    The edge files are sorted by edge hash, so they are merged with a heap
+    that keeps the line of highest weight of each edge hash (see
+    collapse_edges). The collapsed edges are moved into the column order of
+    the edge table and streamed to sort, which writes them to outfile in
+    primary key order (see sort_keys). If there are more edge files than can
+    be open at once, groups of them are first collapsed into temporary files.
+
+    Args:
+        edge_files (list): the unique edge files of the map step
+        outfile (str): the file to write, e.g. unique.edge.txt
+        temppath (str): directory for temporary files
+        args (Namespace): args as populated namespace
+
+    Returns:
+        str: outfile
+    """
+    fan_in = max(2, resource.getrlimit(resource.RLIMIT_NOFILE)[0] - 64)
+    tmp_files = []
+    try:
+        while len(edge_files) > fan_in:
+            group, edge_files = edge_files[:fan_in], edge_files[fan_in:]
+            with tempfile.NamedTemporaryFile('w', dir=temppath, suffix='.edge.txt',
+                                             encoding='utf-8', errors='surrogateescape',
+                                             delete=False) as out:
+                tmp_files.append(out.name)
+                with ExitStack() as stack:
+                    infiles = [stack.enter_context(open_edges(name)) for name in group]
+                    out.writelines(collapse_edges(infiles))
+            edge_files.append(tmp_files[-1])
+        cmd = ['sort', '-T', temppath] + sort_keys('edge', args) + ['-o', outfile]
+        print('merge ' + str(len(edge_files)) + ' edge files | ' + ' '.join(cmd))
+        num_edges = 0
+        with ExitStack() as stack:
+            infiles = [stack.enter_context(open_edges(name)) for name in edge_files]
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, encoding='utf-8',
+                                    errors='surrogateescape', env=dict(os.environ, LC_ALL='C'))
+            with proc.stdin as out:
+                for line in collapse_edges(infiles):
+                    e_chksum, edge = line.rstrip('\n').split('\t', 1)
+                    out.write(edge + '\t' + e_chksum + '\n')
+                    num_edges += 1
+            if proc.wait():
+                raise subprocess.CalledProcessError(proc.returncode, cmd)
+    finally:
+        for tmp_file in tmp_files:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+    print('Merged ' + str(num_edges) + ' edges into ' + outfile)
+    return outfile
+
+def open_edges(filename):
+    """Opens an edge file of the map step for collapse_edges.
+
+    Args:
+        filename (str): the edge file
+
+    Returns:
+        file: the open edge file
+    """
+    return open(filename, 'r', encoding='utf-8', errors='surrogateescape')
+
+def collapse_edges(infiles):
+    """Yields the line of highest weight of each edge hash of the merged
+    infiles.
+
+    Each line holds the edge hash, node 1, node 2, edge type and weight of
+    an edge. When several lines of an edge hash share the highest weight,
+    the smallest line is kept so the result does not depend on the order of
+    infiles.
+
+    Args:
+        infiles (list): open edge files, each sorted by edge hash
+
+    Yields:
+        str: the kept line of each edge hash in edge hash order
+    """
+    prev = None
+    best = None
+    best_weight = None
+    for line in heapq.merge(*infiles, key=lambda line: line[:line.find('\t')]):
+        if not line.endswith('\n'):
+            line += '\n'
+        e_chksum = line[:line.find('\t')]
+        weight = float(line.rstrip('\n').rsplit('\t', 1)[1])
+        if e_chksum != prev:
+            if best is not None:
+                yield best
+            prev, best, best_weight = e_chksum, line, weight
+        elif weight > best_weight or (weight == best_weight and line < best):
+            best, best_weight = line, weight
+    if best is not None:
+        yield best
+
+def sort_keys(table, args):
+    """Returns the sort options ordering the rows of table by its primary
+    key in KnowNet.sql.
+
+    The options fold lower case to upper case, which with LC_ALL=C matches
+    the order of the case insensitive latin1 collation of the tables for
+    ASCII keys. The files of the merge step hold the columns of their table
+    in order, so each key column is the field at its position.
+
+    Args:
+        table (str): table type (one of: node, node_meta, edge2line, status,
+            edge, edge_meta or raw_line)
+        args (Namespace): args as populated namespace
+
+    Returns:
+        list: the options for sort, or an empty list if table has no
+            primary key
+    """
+    schema = mu.read_schema(os.path.join(args.code_path, 'mysql', 'KnowNet.sql'))
+    if table not in schema or 'PRIMARY' not in schema[table]['keys']:
+        return []
+    columns = schema[table]['columns']
+    keys = ['-f', '-t', '\t']
+    for column in schema[table]['keys']['PRIMARY']:
+        field = columns.index(column) + 1
+        keys.append('-k{0},{0}'.format(field))
+    return keys
+
+def split_file(filename, table, parts, args):
+    """Splits a file sorted by sort_keys into key range files.
+
+    The ranges hold about the same number of bytes and a row never starts a
+    new file while its key equals the key of the row before it, so the
+    files can be loaded at the same time (see import_files) as if the whole
+    file was loaded. filename is removed.
+
+    Args:
+        filename (str): the merged file of table, e.g. unique.edge.txt
+        table (str): the table of filename
+        parts (int): the number of files to split into
+        args (Namespace): args as populated namespace
+
+    Returns:
+        list: the key range files, e.g. unique.edge.1.txt, unique.edge.2.txt
+    """
+    schema = mu.read_schema(os.path.join(args.code_path, 'mysql', 'KnowNet.sql'))
+    columns = schema[table]['columns']
+    fields = [columns.index(col) for col in schema[table]['keys']['PRIMARY']]
+    target = os.path.getsize(filename) / parts + 1
+    base = filename[:-len('.txt')] if filename.endswith('.txt') else filename
+    outfiles = []
+    out = None
+    written = 0
+    prev = None
+    with open(filename, 'rb') as infile:
+        for line in infile:
+            row = line.rstrip(b'\n').split(b'\t')
+            key = [row[idx].upper() if idx < len(row) else b'' for idx in fields]
+            if out is None or (written >= target and key != prev):
+                if out is not None:
+                    out.close()
+                outfiles.append(base + '.' + str(len(outfiles) + 1) + '.txt')
+                out = open(outfiles[-1], 'wb')
+                written = 0
+            out.write(line)
+            written += len(line)
+            prev = key
+    if out is not None:
+        out.close()
+    os.remove(filename)
+    print('Split ' + filename + ' into ' + str(len(outfiles)) + ' key ranges')
+    return outfiles
 
 
 def merge_logs(args):
@@ -363,36 +757,316 @@ def main_parse_args():
     parser.add_argument('importfile', help='import file produced from map step, \
                         or merged files, and must contain the table name e.g. \
                         kegg/ath/kegg.ath.unique.status.1.txt or \
-                        unique.status.txt')
+                        unique.status.txt, or incremental to import only \
+                        the changed sources')
+    parser.add_argument('-ret', '--reload_edge_type', default='',
+                        help='replace the partition of this edge type with the rows of \
+                        importfile, which must only hold that edge type')
     parser = cf.add_config_args(parser)
     args = parser.parse_args()
     return args
 
-def main():
-    """Imports according to the given arguments.
+def get_table(importfile):
+    """Returns the table filled by importfile.
+
+    Args:
+        importfile (str): a file whose name contains a table name in
+            MERGE_KEYS, e.g. unique.status.txt
+
+    Returns:
+        str: the first table name of MERGE_KEYS in the name of importfile
+
+    Raises:
+        ValueError: if the name of importfile contains no table name
+    """
+    for key in importfile.split('.'):
+        if key in MERGE_KEYS:
+            return key
+    raise ValueError("ERROR: 'importfile' must contain one of "+\
+                     ','.join(MERGE_KEYS))
+
+def prepare_import(importfile, args):
+    """Returns the files to import for importfile and the table they fill.
+
+    A table name in MERGE_KEYS is first merged from the files of the map step
+    (see merge and merge_logs) and, if args.mysql_load_splits is more than 1,
+    split into that many key range files (see split_file).
+
+    Args:
+        importfile (str): a table name in MERGE_KEYS or a file whose name
+            contains one
+        args (Namespace): args as populated namespace
+
+    Returns:
+        tuple: the list of paths of the files to import and their table
+    """
+    merged = False
+    if importfile == 'log':
+        importfile = merge_logs(args)
+    elif importfile in MERGE_KEYS:
+        importfile = merge(importfile, args)
+        merged = True
+    table = get_table(importfile)
+    if merged and args.mysql_load_splits > 1 and sort_keys(table, args):
+        return split_file(importfile, table, args.mysql_load_splits, args), table
+    return [importfile], table
+
+def finish_import(importfile, table, args):
+    """Runs the steps that follow the import of a table.
+
+    After node_meta is imported, the table is dumped and loaded into the
+    Redis mapping db (see redis_utilities.import_node_meta).
+
+    Args:
+        importfile (str): an imported file of table
+        table (str): the table importfile was imported to
+        args (Namespace): args as populated namespace
     """
-    args = main_parse_args()
-    merge_keys = ['node', 'node_meta', 'edge2line', 'status', 'edge', \
-                  'edge_meta', 'raw_line', 'table', 'log']
-    if args.importfile == 'log':
-        args.importfile = merge_logs(args)
-    elif args.importfile in merge_keys:
-        args.importfile = merge(args.importfile, args)
-    table = ''
-    ld_cmd = ''
-    dup_cmd = ''
-    for key in args.importfile.split('.'):
-        if key in merge_keys:
-            table = key
-            break
-    if not table:
-        raise ValueError("ERROR: 'importfile' must contain one of "+\
-                         ','.join(merge_keys))
-    import_file(args.importfile, table, ld_cmd, dup_cmd, args)
     if table == 'node_meta':
-        filename = args.importfile.replace("node_meta", "node_meta_table")
+        filename = importfile.replace("node_meta", "node_meta_table")
         mu.get_database("KnowNet", args).dump_table(table, filename)
         ru.import_node_meta(filename, args)
 
+def import_tables(importfiles, args=None):
+    """Merges and imports many tables at once.
+
+    Up to args.mysql_load_workers merges run at the same time and the merged
+    files are then loaded concurrently (see import_files), which replaces one
+    import job per table (see main).
+
+    Args:
+        importfiles (list): table names in MERGE_KEYS or files whose names
+            contain one
+        args (Namespace): args as populated namespace or 'None' for defaults
+    """
+    if args is None:
+        args = cf.config_args()
+    workers = args.mysql_load_workers
+    if workers <= 0:
+        workers = multiprocessing.cpu_count()
+    workers = max(1, min(workers, len(importfiles)))
+    with ThreadPoolExecutor(workers) as executor:
+        imports = list(executor.map(lambda importfile: prepare_import(importfile, args),
+                                    importfiles))
+    import_files([(filename, table, '') for filenames, table in imports
+                  for filename in filenames], args, args.mysql_defer_keys)
+    for filenames, table in imports:
+        finish_import(filenames[0], table, args)
+    if 'status' in [table for _, table in imports]:
+        db = mu.get_database('KnowNet', args)
+        record_imports(db)
+        db.close()
+
+def reload_edge_type(et_name, jobs, args=None):
+    """Replaces the rows of one edge type in partitioned tables.
+
+    Each file is loaded into an unpartitioned copy of its table, which is
+    then swapped with the partition of et_name (see
+    mysql_utilities.MySQL.exchange_partition), so the rows of the other edge
+    types are not touched and readers never see a partly loaded edge type.
+    The copies are named after et_name, so reloads of different edge types
+    can run at the same time. The files must only hold rows of et_name.
+
+    Args:
+        et_name (str): the edge type to reload
+        jobs (list): (file_name, table) tuples with table in
+            mysql_utilities.PARTITION_TABLES
+        args (Namespace): args as populated namespace or 'None' for defaults
+
+    Raises:
+        ValueError: if a table is not one of PARTITION_TABLES, is not
+            partitioned and args.mysql_partitions is not set, or has a
+            primary key without et_name
+    """
+    if args is None:
+        args = cf.config_args()
+    db = mu.get_database('KnowNet', args)
+    try:
+        tables = sorted(set(table for _, table in jobs))
+        for table in tables:
+            if table not in mu.PARTITION_TABLES:
+                raise ValueError('ERROR: cannot reload an edge type of ' + table +
+                                 ', only of ' + ', '.join(mu.PARTITION_TABLES))
+            if not args.mysql_partitions and not db.table_partitions(table):
+                raise ValueError('ERROR: ' + table + ' is not partitioned by et_name, '
+                                 'rerun with --mysql_partitions to partition it')
+            if 'et_name' not in db.table_keys(table).get('PRIMARY', []):
+                raise ValueError('ERROR: the primary key of ' + table + ' does not include '
+                                 'et_name, so it cannot be partitioned by edge type')
+        db.partition_tables(tables)
+        for file_name, table in jobs:
+            swap_table = table + '_swap_' + mu.partition_name(et_name)[2:]
+            db.run('DROP TABLE IF EXISTS ' + swap_table)
+            db.run('CREATE TABLE ' + swap_table + ' LIKE ' + table)
+            db.run('ALTER TABLE ' + swap_table + ' REMOVE PARTITIONING')
+            start = time.time()
+            rows = db.load_data(file_name, swap_table, db.table_load_cmd(table))
+            print('\t'.join([swap_table, os.path.basename(file_name), '{0} rows'.format(rows),
+                             '{0:.1f}s'.format(time.time() - start)]))
+            db.exchange_partition(table, et_name, swap_table)
+            db.run('DROP TABLE ' + swap_table)
+    finally:
+        db.close()
+
+def import_incremental(args=None):
+    """Imports only the sources whose files changed since their last import.
+
+    The files whose raw_file checksum differs from the one recorded in
+    imported_file by the last import are found (see changed_files). Their
+    raw_line, status, edge2line and edge_meta rows are deleted and the
+    unique files of their map step are loaded instead of the merged files
+    of every source. The edges of the deleted and loaded status rows are
+    then recomputed from the status table (see recompute_edges), so the
+    rest of KnowNet is left untouched. Nodes of the old files are kept.
+
+    Args:
+        args (Namespace): args as populated namespace or 'None' for defaults
+    """
+    if args is None:
+        args = cf.config_args()
+    if args.storage_dir:
+        searchpath = os.path.join(args.storage_dir, args.data_path)
+    else:
+        searchpath = os.path.join(args.working_dir, args.data_path)
+    db = mu.get_database('KnowNet', args)
+    file_ids = changed_files(db)
+    if not file_ids:
+        print('No source has changed since the last import')
+        db.close()
+        return
+    print('Reimporting ' + ', '.join(file_ids))
+    start = time.time()
+    db.create_temp_table('affected_edge', '(edge_hash ' + db.hash_type() + ' NOT NULL, '
+                         'PRIMARY KEY (edge_hash))')
+    add_affected_edges(db, file_ids)
+    delete_file_rows(db, file_ids)
+    jobs = []
+    for file_id in file_ids:
+        source, alias = file_id.split('.', 1)
+        for table in INCREMENTAL_TABLES:
+            pattern = os.path.join(searchpath, source, alias, '**', '*.unique.' + table + '.*')
+            for filename in sorted(glob.glob(pattern, recursive=True)):
+                jobs.append((filename, table, ''))
+    import_files(jobs, args)
+    add_affected_edges(db, file_ids)
+    recompute_edges(db)
+    record_imports(db, file_ids)
+    db.close()
+    if 'node_meta' in [table for _, table, _ in jobs]:
+        filename = os.path.join(args.working_dir, args.data_path, 'unique.node_meta.txt')
+        finish_import(filename, 'node_meta', args)
+    cf.CSVM.writerow(['run info', 'import_incremental_files', len(file_ids)])
+    cf.CSVM.writerow(['run info', 'import_incremental_seconds',
+                      '{0:.1f}'.format(time.time() - start)])
+
+def changed_files(db):
+    """Returns the file_ids whose raw_file checksum changed since their last
+    import.
+
+    Args:
+        db (MySQL): a KnowNet connection
+
+    Returns:
+        list: the changed file_ids, including files never imported
+    """
+    cmd = ('SELECT r.file_id FROM raw_file r LEFT JOIN imported_file i '
+           'ON r.file_id = i.file_id WHERE i.file_id IS NULL '
+           'OR NOT (r.checksum <=> i.checksum) ORDER BY r.file_id')
+    return [row[0] for row in db.run(cmd)]
+
+def delete_file_rows(db, file_ids):
+    """Deletes the rows of file_ids from the tables filled by their lines.
+
+    Args:
+        db (MySQL): a KnowNet connection
+        file_ids (list): the file_ids whose rows to delete
+    """
+    id_list = ','.join('"' + file_id + '"' for file_id in file_ids)
+    cmd = 'DELETE FROM status WHERE file_id IN (' + id_list + ')'
+    print(cmd)
+    db.run(cmd)
+    for table in ['edge2line', 'edge_meta']:
+        cmd = ('DELETE t FROM ' + table + ' t JOIN raw_line r '
+               'ON t.line_hash = r.line_hash WHERE r.file_id IN (' + id_list + ')')
+        print(cmd)
+        db.run(cmd)
+    cmd = 'DELETE FROM raw_line WHERE file_id IN (' + id_list + ')'
+    print(cmd)
+    db.run(cmd)
+
+def add_affected_edges(db, file_ids):
+    """Adds the edge hashes of the status rows of file_ids to the
+    affected_edge temporary table.
+
+    This is run before the rows of file_ids are deleted and after the new
+    rows are loaded, so it collects the edges that lost or gained a row.
+
+    Args:
+        db (MySQL): the KnowNet connection holding affected_edge
+        file_ids (list): the file_ids whose edges are affected
+    """
+    id_list = ','.join('"' + file_id + '"' for file_id in file_ids)
+    db.insert_ignore('affected_edge', 'SELECT DISTINCT edge_hash FROM status '
+                     'WHERE file_id IN (' + id_list + ')')
+
+def recompute_edges(db):
+    """Recomputes the edges listed in the affected_edge temporary table.
+
+    The affected edges are deleted and inserted again from their production
+    status rows with the maximum weight, like the merge of the full import
+    (see merge_edges). An edge without any production row is left deleted.
+
+    Args:
+        db (MySQL): the KnowNet connection holding affected_edge
+    """
+    db.run('DELETE e FROM edge e JOIN affected_edge a ON e.edge_hash = a.edge_hash')
+    cmd = ('SELECT s.n1_id, s.n2_id, s.et_name, MAX(s.weight), s.edge_hash '
+           'FROM status s JOIN affected_edge a ON s.edge_hash = a.edge_hash '
+           'WHERE s.status = "production" '
+           'GROUP BY s.edge_hash, s.n1_id, s.n2_id, s.et_name '
+           'ON DUPLICATE KEY UPDATE edge.weight = '
+           'IF(edge.weight > VALUES(weight), edge.weight, VALUES(weight))')
+    db.insert('edge', cmd)
+    num_edges = db.run('SELECT COUNT(*) FROM affected_edge')[0][0]
+    print('Recomputed ' + str(num_edges) + ' edges')
+    cf.CSVM.writerow(['run info', 'import_recomputed_edges', num_edges])
+
+def record_imports(db, file_ids=None):
+    """Records the raw_file checksums of imported files in imported_file.
+
+    Args:
+        db (MySQL): a KnowNet connection
+        file_ids (list): the imported file_ids, or None for every raw_file
+    """
+    cmd = 'SELECT file_id, checksum, CURRENT_TIMESTAMP FROM raw_file'
+    if file_ids is not None:
+        cmd += ' WHERE file_id IN (' + ','.join('"' + file_id + '"' for file_id in file_ids) + ')'
+    db.replace('imported_file', cmd)
+
+def main():
+    """Imports according to the given arguments.
+
+    A full import of the status table records the checksums of the imported
+    files (see record_imports), as import_tables does. With
+    --reload_edge_type, importfile replaces the rows of one edge type of a
+    partitioned table instead (see reload_edge_type).
+    """
+    args = main_parse_args()
+    if args.importfile == 'incremental':
+        import_incremental(args)
+        return
+    if args.reload_edge_type:
+        reload_edge_type(args.reload_edge_type,
+                         [(args.importfile, get_table(args.importfile))], args)
+        return
+    filenames, table = prepare_import(args.importfile, args)
+    import_files([(filename, table, '') for filename in filenames], args,
+                 args.mysql_defer_keys)
+    finish_import(filenames[0], table, args)
+    if table == 'status':
+        db = mu.get_database('KnowNet', args)
+        record_imports(db)
+        db.close()
+
 if __name__ == "__main__":
     main()
@@ -8,7 +8,8 @@ CREATE TABLE IF NOT EXISTS `all_mappings` (
   `priority` int(11) NOT NULL,
   `db_display_name` varchar(255) DEFAULT NULL,
   `stable_id` varchar(128) DEFAULT NULL,
-  `species` varchar(255) DEFAULT NULL
+  `species` varchar(255) DEFAULT NULL,
+  KEY (`species`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
 
 CREATE TABLE IF NOT EXISTS `edge` (
@@ -93,6 +94,13 @@ CREATE TABLE IF NOT EXISTS `raw_file` (
   PRIMARY KEY (`file_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
 
+CREATE TABLE IF NOT EXISTS `imported_file` (
+  `file_id` varchar(80) NOT NULL,
+  `checksum` varchar(80) DEFAULT NULL,
+  `date_imported` varchar(40) DEFAULT NULL,
+  PRIMARY KEY (`file_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
 CREATE TABLE IF NOT EXISTS `log` (
   `filename` varchar(255) NOT NULL,
   `info_type` varchar(255) NOT NULL,
@@ -126,8 +134,10 @@ CREATE TABLE IF NOT EXISTS `status` (
   `line_hash` varchar(40) NOT NULL,
   `status` varchar(80) NOT NULL,
   `status_desc` varchar(255) NOT NULL,
+  `file_id` varchar(80) DEFAULT NULL,
+  `line_num` int(11) DEFAULT NULL,
   PRIMARY KEY (`table_hash`),
   KEY (`status_desc`),
-  KEY (`et_name`)
+  KEY `et_name_status` (`et_name`,`status`)
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
 
@@ -7,23 +7,45 @@ MySQL database
 
 Contains module functions::
 
-    combine_tables(alias, args=None)
+    combine_tables(alias, args=None, refresh=False)
     create_dictionary(results)
     import_nodes(version_dict, args=None)
     query_all_mappings(version_dict, args=None)
+    write_all_mappings(map_file, taxid, lrg_dict, stable_ids, mappings)
+    remap_lrg(lrg_dict, raw, mapped)
     create_mapping_dicts(version_dict, args=None)
     get_database(db=None, args=None)
     get_insert_cmd(step)
     import_ensembl(alias, args=None)
+    read_schema(sqlfile)
+    binary_schema(sqlfile, outfile)
+    partitioned_schema(sqlfile, outfile)
+    partition_name(et_name)
+
+Attributes:
+    HASH_COLUMNS (list): the md5 checksum columns of the KnowNet tables
+    PARTITION_TABLES (list): the KnowNet tables partitioned by et_name
+    SCHEMA_TABLE (Pattern): matches the name and body of a CREATE TABLE
+    SCHEMA_KEY (Pattern): matches a key definition in a CREATE TABLE body
 """
 import os
+import re
+import csv
 import json
+import hashlib
+import itertools
 import subprocess
 import shutil
+import tempfile
 from argparse import ArgumentParser
 import config_utilities as cf
 import mysql.connector as sql
 
+SCHEMA_TABLE = re.compile(r'CREATE TABLE IF NOT EXISTS `(\w+)`\s*\((.*?)\)\s*ENGINE', re.S)
+HASH_COLUMNS = ['table_hash', 'edge_hash', 'line_hash']
+PARTITION_TABLES = ['status', 'edge']
+SCHEMA_KEY = re.compile(r'^(PRIMARY )?KEY\s*(?:`(\w+)`)?\s*\((.*)\)$')
+
 def deploy_container(args=None):
     """Deplays a container with marathon running MySQL using the specified
     args.
@@ -84,17 +106,19 @@ def deploy_container(args=None):
         print(job)
 
 
-def combine_tables(alias, args=None):
+def combine_tables(alias, args=None, refresh=False):
     """Combine all of the data imported from ensembl for the provided alias
     into a single database.
 
     This combines the imported tables into a single table knownet_mappings with
     information from genes, transcripts, and translations. It then merges this
-    table into the KnowNet database for use in gene identifier mapping.
+    table into the KnowNet database for use in gene identifier mapping,
+    replacing the rows of an earlier release of alias if refresh is set.
 
     Args:
         alias (str): An alias defined in ensembl.aliases.
         args (Namespace): args as populated namespace or 'None' for defaults
+        refresh (bool): if all_mappings may hold rows of alias to delete
     """
     if args is None:
         args = cf.config_args()
@@ -118,6 +142,8 @@ def combine_tables(alias, args=None):
            "UCASE(db_display_name) AS db_display_name, "
            "UCASE(stable_id) AS stable_id, '" + alias + "' AS species FROM " +
            alias_db + '.' + alias + "_mappings")
+    if refresh:
+        db.run("DELETE FROM " + all_table + " WHERE species='" + alias + "'")
     db.insert(all_table, cmd)
     db.close()
 
@@ -150,6 +176,10 @@ def import_nodes(version_dict, args=None):
         version_dict (dict): the version dictionary describing the
             source:alias
         args (Namespace): args as populated namespace or 'None' for defaults
+
+    Returns:
+        generator: the (node_id, n_alias, n_type_id) rows of the gene nodes,
+            streamed from the server (see MySQL.iterate)
     """
     if args is None:
         args = cf.config_args()
@@ -183,24 +213,32 @@ def import_nodes(version_dict, args=None):
            "gene.description AS n_alias, "
            "'Gene' AS n_type_id "
            "FROM gene")
-    return db.run(cmd)
+    return db.iterate(cmd)
 
 def query_all_mappings(version_dict, args=None):
-    """Creates the all mappings dictionary for the provided alias.
+    """Creates the all mappings file for the provided alias.
 
-    Produces a dictionary of ensembl stable mappings and the all unique mappings
-    the provided alias. It then saves them as json objects to
-    file.
+    Streams the ensembl stable mappings and all unique mappings of the
+    provided alias from the server into alias + '_all.tsv' (see
+    write_all_mappings and redis_utilities.read_mappings). Rows are read
+    through MySQL.iterate, so only the LRG remapping dictionary is held in
+    memory. The mappings are ordered by hint and
+    foreign key on the server, and the first row of each hint and foreign key
+    is kept, preferring dbprimary_acc over display_label and then the lowest
+    stable id.
 
     Args:
         version_dict (dict): the version dictionary describing the
             source:alias
         args (Namespace): args as populated namespace or 'None' for defaults
+
+    Returns:
+        int: the number of mappings written
     """
     if args is None:
         args = cf.config_args()
     alias = version_dict['alias']
-    taxid = version_dict['alias_info']
+    taxid = version_dict['alias_info'].split('::')[0]
     database = 'ensembl_' + alias
     table = alias + '_mappings'
     map_dir = os.path.join(args.data_path, cf.DEFAULT_MAP_PATH)
@@ -209,38 +247,85 @@ def query_all_mappings(version_dict, args=None):
     if not os.path.isdir(map_dir):
         os.mkdir(map_dir)
     db = MySQL(database, args)
-    cmd = "WHERE db_name='ENS_LRG_GENE'"
-    results = db.query_distinct('dbprimary_acc, stable_id', table, cmd)
-    lrg_dict = create_dictionary(results)
-    results = db.query_distinct('stable_id, stable_id', table)
-    map_dict = dict()
-    for (raw, mapped) in results:
-        raw = raw.replace("::","|")
-        if str(raw) in lrg_dict:
-            mapped = lrg_dict[str(raw)]
-        if str(mapped) in lrg_dict:
-            mapped = lrg_dict[str(mapped)]
-        map_dict[taxid + '::ENSEMBL_STABLE_ID::' + str(raw)] = str(mapped)
-    results = db.query_distinct('display_label AS dbprimary_acc, db_name, stable_id',
-                                table)
-    results.extend(db.query_distinct('dbprimary_acc, db_name, stable_id',
-                                     table))
-    for (raw, hint, mapped) in results:
-        raw = raw.replace("::","|")
-        if str(raw) in lrg_dict:
-            mapped = lrg_dict[str(raw)]
-        if str(mapped) in lrg_dict:
-            mapped = lrg_dict[str(mapped)]
-        map_dict['::'.join([taxid, str(hint), str(raw)])] = str(mapped)
-    with open(os.path.join(map_dir, alias + '_all.json'), 'w') as outfile:
-        json.dump(map_dict, outfile, indent=4)
+    cmd = "WHERE db_name='ENS_LRG_GENE' ORDER BY CAST(stable_id AS BINARY)"
+    lrg_dict = create_dictionary(db.iterate_distinct('dbprimary_acc, stable_id', table, cmd))
+    map_file = os.path.join(map_dir, alias + '_all.tsv')
+    cmd = ('SELECT raw, db_name, stable_id FROM ('
+           'SELECT display_label AS raw, db_name, stable_id, 0 AS rank_id '
+           'FROM ' + table + ' UNION '
+           'SELECT dbprimary_acc AS raw, db_name, stable_id, 1 AS rank_id '
+           'FROM ' + table + ') AS mappings '
+           'ORDER BY CAST(db_name AS BINARY), CAST(raw AS BINARY), '
+           'rank_id DESC, CAST(stable_id AS BINARY)')
+    stable_ids = (row[0] for row in db.iterate_distinct('stable_id', table))
+    num_rows = write_all_mappings(map_file, taxid, lrg_dict, stable_ids,
+                                  db.iterate(cmd))
+    db.close()
+    return num_rows
+
+def write_all_mappings(map_file, taxid, lrg_dict, stable_ids, mappings):
+    """Writes the all mappings file of an alias.
+
+    Writes one taxid, hint, foreign key and stable id row for each stable id
+    and for the first mapping of each hint and foreign key, after replacing
+    '::' in foreign keys and remapping LRG genes (see remap_lrg). The file is
+    written to a temporary name and moved into place when complete.
+
+    Args:
+        map_file (str): the path of the all mappings file
+        taxid (str): the taxid of the alias
+        lrg_dict (dict): the ENS_LRG_GENE dbprimary_acc to stable_id mappings
+        stable_ids (iterable): the distinct stable ids of the alias
+        mappings (iterable): (foreign key, hint, stable id) rows, grouped by
+            hint and foreign key with the preferred row of each group first
+
+    Returns:
+        int: the number of mappings written
+    """
+    num_rows = 0
+    with open(map_file + '.tmp', 'w', newline='') as outfile:
+        writer = csv.writer(outfile, delimiter='\t', lineterminator='\n')
+        for mapped in stable_ids:
+            raw = str(mapped).replace("::", "|")
+            writer.writerow([taxid, 'ENSEMBL_STABLE_ID', raw,
+                             remap_lrg(lrg_dict, raw, mapped)])
+            num_rows += 1
+        prev = None
+        for (raw, hint, mapped) in mappings:
+            raw = str(raw).replace("::", "|")
+            if (hint, raw) == prev:
+                continue
+            prev = (hint, raw)
+            writer.writerow([taxid, str(hint), raw,
+                             remap_lrg(lrg_dict, raw, mapped)])
+            num_rows += 1
+    os.replace(map_file + '.tmp', map_file)
+    print('Wrote {0} mappings to {1}'.format(num_rows, map_file))
+    return num_rows
+
+def remap_lrg(lrg_dict, raw, mapped):
+    """Returns the stable id a mapping resolves to after LRG remapping.
+
+    Args:
+        lrg_dict (dict): the ENS_LRG_GENE dbprimary_acc to stable_id mappings
+        raw (str): the foreign key of the mapping
+        mapped (str): the stable id of the mapping
+
+    Returns:
+        str: the remapped stable id
+    """
+    if str(raw) in lrg_dict:
+        mapped = lrg_dict[str(raw)]
+    if str(mapped) in lrg_dict:
+        mapped = lrg_dict[str(mapped)]
+    return str(mapped)
 
 def create_mapping_dicts(version_dict, args=None):
     """Creates the mapping dictionaries for the provided alias.
 
     Produces the ensembl stable mappings dictionary and the all unique mappings
-    dictionary for the provided alias. It then saves them as json objects to
-    file.
+    dictionary for the provided alias, streaming the rows of each query (see
+    MySQL.iterate). It then saves them as json objects to file.
 
     Args:
         version_dict (dict): the version dictionary describing the
@@ -260,15 +345,15 @@ def create_mapping_dicts(version_dict, args=None):
     if not os.path.isdir(map_dir):
         os.mkdir(map_dir)
     db = MySQL(database, args)
-    results = db.query_distinct('stable_id, stable_id', table, cmd)
+    results = db.iterate_distinct('stable_id, stable_id', table, cmd)
     with open(os.path.join(map_dir, alias + '_stable.json'), 'w') as outfile:
         map_dict = create_dictionary(results)
         json.dump(map_dict, outfile, indent=4)
-    results = db.query_distinct('display_label AS dbprimary_acc, stable_id',
-                                table, cmd)
-    results.extend(db.query_distinct('dbprimary_acc, stable_id', table, cmd))
-    cmd += " AND db_name='ENS_LRG_gene'"
-    results.extend(db.query_distinct('dbprimary_acc, stable_id', table, cmd))
+    lrg_cmd = cmd + " AND db_name='ENS_LRG_gene'"
+    results = itertools.chain(
+        db.iterate_distinct('display_label AS dbprimary_acc, stable_id', table, cmd),
+        db.iterate_distinct('dbprimary_acc, stable_id', table, cmd),
+        db.iterate_distinct('dbprimary_acc, stable_id', table, lrg_cmd))
     with open(os.path.join(map_dir, alias + '_unique.json'), 'w') as outfile:
         map_dict = create_dictionary(results)
         json.dump(map_dict, outfile, indent=4)
@@ -423,6 +508,109 @@ def import_ensembl(alias, args=None):
     db.import_table(database, '*.txt')
     db.close()
 
+def read_schema(sqlfile):
+    """Returns the columns and keys of each table created by sqlfile.
+
+    A key defined without a name is named after its first column, as MySQL
+    does.
+
+    Args:
+        sqlfile (str): name of the sql file specifying the format for the
+            database, e.g. mysql/KnowNet.sql
+
+    Returns:
+        dict: for each table, a dictionary with the list of its 'columns' and
+            its 'keys' as a dictionary of key name (PRIMARY for the primary
+            key) to the list of key columns
+    """
+    with open(sqlfile) as infile:
+        text = infile.read()
+    schema = dict()
+    for table, body in SCHEMA_TABLE.findall(text):
+        columns = []
+        keys = dict()
+        for line in body.split('\n'):
+            line = line.strip().rstrip(',')
+            if line.startswith('`'):
+                columns.append(line.split('`')[1])
+                continue
+            match = SCHEMA_KEY.match(line)
+            if not match:
+                continue
+            key_cols = re.findall(r'`(\w+)`', match.group(3))
+            if match.group(1):
+                keys['PRIMARY'] = key_cols
+            else:
+                keys[match.group(2) or key_cols[0]] = key_cols
+        schema[table] = {'columns': columns, 'keys': keys}
+    return schema
+
+def binary_schema(sqlfile, outfile):
+    """Writes sqlfile with its hash columns stored as BINARY(16).
+
+    The md5 checksums in HASH_COLUMNS are 32 hex digits held in varchar(40)
+    columns. As BINARY(16) they take half the space in every key holding
+    them, and MySQL.load_data converts them from hex when loading.
+
+    Args:
+        sqlfile (str): name of the sql file specifying the format for the
+            database, e.g. mysql/KnowNet.sql
+        outfile (str): the sql file to write
+
+    Returns:
+        str: outfile
+    """
+    with open(sqlfile) as infile:
+        text = infile.read()
+    pattern = r'(`(?:' + '|'.join(HASH_COLUMNS) + r')`) varchar\(40\)'
+    with open(outfile, 'w') as out:
+        out.write(re.sub(pattern, r'\1 binary(16)', text))
+    return outfile
+
+def partitioned_schema(sqlfile, outfile):
+    """Writes sqlfile with et_name in the primary key of PARTITION_TABLES.
+
+    MySQL only partitions a table by columns of every unique key, so
+    et_name is added to the primary keys that lack it before the tables are
+    partitioned by et_name (see MySQL.partition_tables).
+
+    Args:
+        sqlfile (str): name of the sql file specifying the format for the
+            database, e.g. mysql/KnowNet.sql
+        outfile (str): the sql file to write
+
+    Returns:
+        str: outfile
+    """
+    with open(sqlfile) as infile:
+        text = infile.read()
+    for table, body in SCHEMA_TABLE.findall(text):
+        if table not in PARTITION_TABLES:
+            continue
+        new_body = re.sub(r'PRIMARY KEY \((?!.*`et_name`)(.*)\)', r'PRIMARY KEY (\1, `et_name`)',
+                          body)
+        text = text.replace(body, new_body)
+    with open(outfile, 'w') as out:
+        out.write(text)
+    return outfile
+
+def partition_name(et_name):
+    """Returns the name of the partition holding the rows of et_name.
+
+    The name ends with a hash of et_name, so edge types that only differ in
+    characters that are not allowed in a name, or after the first 29
+    characters, get different partitions.
+
+    Args:
+        et_name (str): an edge type name
+
+    Returns:
+        str: p_, et_name as a MySQL identifier and a hash of et_name, at most
+            40 characters
+    """
+    digest = hashlib.md5(et_name.encode()).hexdigest()[:8]
+    return 'p_' + re.sub(r'\W', '_', et_name)[:29] + '_' + digest
+
 def get_file_meta(file_id, args=None):
     """Returns the metadata for the provided file_id if it exists.
 
@@ -439,6 +627,7 @@ def get_file_meta(file_id, args=None):
     'date' (float):         time of last modification time of file in \
                             seconds since the epoch
     'version' (str):        the remote version of the source
+    'checksum' (str):       the md5 checksum of the fetched file
 
     Args:
         file_id (str):  The file_id for the raw_file in the format of \
@@ -451,7 +640,7 @@ def get_file_meta(file_id, args=None):
         args = cf.config_args()
     file_meta = {'file_id':file_id}
     db = get_database('KnowNet', args)
-    results = db.query_distinct('remote_date, remote_size, remote_version',
+    results = db.query_distinct('remote_date, remote_size, remote_version, checksum',
                                 'raw_file', 'WHERE file_id="'+file_id+'"')
     if not results:
         file_meta['file_exists'] = False
@@ -460,6 +649,7 @@ def get_file_meta(file_id, args=None):
         file_meta['date'] = float(results[0][0])
         file_meta['size'] = int(results[0][1])
         file_meta['version'] = str(results[0][2])
+        file_meta['checksum'] = results[0][3]
     return file_meta
 
 class MySQL(object):
@@ -475,6 +665,8 @@ class MySQL(object):
         database (str): the MySQL database to connect to
         conn (object): connection object for the database
         cursor (object): cursor object for the database
+        binary (bool): if the KnowNet hash columns are BINARY(16), None until
+            checked by binary_hashes
     """
     def __init__(self, database=None, args=None):
         """Init a MySQL object with the provided parameters.
@@ -494,15 +686,18 @@ class MySQL(object):
         self.passw = args.mysql_pass
         self.database = database
         self.args = args
+        self.binary = None
         if self.database is None:
             self.conn = sql.connect(host=self.host, port=self.port,
                                     user=self.user, password=self.passw,
-                                    client_flags=[sql.ClientFlag.LOCAL_FILES])
+                                    client_flags=[sql.ClientFlag.LOCAL_FILES],
+                                    allow_local_infile=True)
         else:
             self.conn = sql.connect(host=self.host, port=self.port,
                                     user=self.user, password=self.passw,
                                     db=self.database,
-                                    client_flags=[sql.ClientFlag.LOCAL_FILES])
+                                    client_flags=[sql.ClientFlag.LOCAL_FILES],
+                                    allow_local_infile=True)
         self.cursor = self.conn.cursor()
 
     def drop_db(self, database):
@@ -522,14 +717,36 @@ class MySQL(object):
         Creates the KnowNet database and all of its tables if they do not
         already exist. Also imports the edge_type, node_type, and species
         files, but ignores any lines that have the same unique key as those
-        already in the tables.
+        already in the tables. With args.mysql_binary_hashes, new tables store
+        their hash columns as BINARY(16) (see binary_schema). With
+        args.mysql_partitions, the PARTITION_TABLES are partitioned by et_name
+        (see partitioned_schema and partition_tables). A status table created
+        before it carried provenance is upgraded (see upgrade_status).
         """
         import_tables = ['node_type.txt', 'edge_type.txt']
         mysql_dir = os.path.join(self.args.code_path, 'mysql')
-        self.import_schema('KnowNet', os.path.join(mysql_dir, 'KnowNet.sql'))
+        sqlfile = os.path.join(mysql_dir, 'KnowNet.sql')
+        if self.args.mysql_binary_hashes or self.args.mysql_partitions:
+            handle, tmpfile = tempfile.mkstemp(suffix='.sql')
+            os.close(handle)
+            try:
+                if self.args.mysql_binary_hashes:
+                    sqlfile = binary_schema(sqlfile, tmpfile)
+                if self.args.mysql_partitions:
+                    sqlfile = partitioned_schema(sqlfile, tmpfile)
+                self.import_schema('KnowNet', sqlfile)
+            finally:
+                os.remove(tmpfile)
+        else:
+            self.import_schema('KnowNet', sqlfile)
         for table in import_tables:
             tablefile = os.path.join(mysql_dir, table)
             self.import_table('KnowNet', tablefile, '--ignore')
+        knownet = get_database('KnowNet', self.args)
+        knownet.upgrade_status()
+        if self.args.mysql_partitions:
+            knownet.partition_tables()
+        knownet.close()
         #self.cursor.execute("SET @@GLOBAL.SQL_MODE = REPLACE(@@SQL_MODE, " + \
         #                    "'NO_ZERO_DATE', '')")
         self.conn.commit()
@@ -595,14 +812,21 @@ class MySQL(object):
             tablename (str): name of the table to import into
             sep (str): separator for fields in file
             enc (str): enclosing character for fields in file
-            cmd (str): optional additional command
+            cmd (str): optional additional command, by default the conversion
+                of the columns of table (see table_load_cmd)
+
+        Returns:
+            int: the number of rows loaded
         """
+        if not cmd:
+            cmd = self.table_load_cmd(tablename.split('.')[-1])
         self.cursor.execute("LOAD DATA LOCAL INFILE '" + filename +
                             "' INTO TABLE " + tablename +
                             " FIELDS TERMINATED BY '" + sep + "'" +
                             " OPTIONALLY ENCLOSED BY '" + enc + "' " +
                             cmd + ";")
         self.conn.commit()
+        return self.cursor.rowcount
 
     def drop_temp_table(self, tablename):
         """Remove a temporary table from the MySQL database
@@ -751,6 +975,52 @@ class MySQL(object):
         self.conn.commit()
         return results
 
+    def iterate(self, cmd, size=None):
+        """Run the provided query in MySQL and stream the results.
+
+        This runs the provided command on an unbuffered cursor and yields the
+        rows as they are fetched from the server in chunks of size rows, so
+        the whole result is never held in memory. No other command may be run
+        on the connection until the results are exhausted.
+
+        Args:
+            cmd (str): the SQL query to run on the MySQL server
+            size (int): the number of rows to fetch at a time, by default
+                args.mysql_fetch_size
+
+        Yields:
+            tuple: each row of the results
+        """
+        if size is None:
+            size = self.args.mysql_fetch_size
+        cursor = self.conn.cursor(buffered=False)
+        try:
+            cursor.execute(cmd + ';')
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def iterate_distinct(self, query, table, cmd=''):
+        """Run the provided query distinct in MySQL and stream the results.
+
+        This is query_distinct on an unbuffered cursor (see iterate).
+
+        Args:
+            query (str): the SQL query to run on the MySQL server
+            table (str): the table to query from
+            cmd (str): the addtional SQL command to run on the MySQL server
+                (optional)
+
+        Yields:
+            tuple: each row of the results
+        """
+        return self.iterate('SELECT DISTINCT ' + query + ' FROM ' + table + ' ' + cmd)
+
     def query_distinct(self, query, table, cmd=''):
         """Run the provided query distinct in MySQL.
 
@@ -835,6 +1105,284 @@ class MySQL(object):
         self.cursor.execute('SET foreign_key_checks=1;')
         self.conn.commit()
 
+    def binary_hashes(self):
+        """Returns if the KnowNet hash columns are stored as BINARY(16).
+
+        Returns:
+            bool: True for a schema written by binary_schema
+        """
+        if self.binary is None:
+            cmd = ('SELECT DATA_TYPE FROM information_schema.COLUMNS '
+                   'WHERE TABLE_SCHEMA = "KnowNet" AND TABLE_NAME = "status" '
+                   'AND COLUMN_NAME = "line_hash"')
+            results = self.run(cmd)
+            self.binary = bool(results) and results[0][0].lower() == 'binary'
+        return self.binary
+
+    def hash_type(self):
+        """Returns the column type of the KnowNet hash columns.
+
+        Returns:
+            str: binary(16) or varchar(40)
+        """
+        return 'binary(16)' if self.binary_hashes() else 'varchar(40)'
+
+    def table_load_cmd(self, table):
+        """Returns the LOAD DATA command converting the columns of table.
+
+        The hex hash columns are converted for a binary schema, and with
+        args.mysql_raw_store the line_str of raw_line is left empty as the
+        line text is kept in the raw line store (see rawline_utilities).
+
+        Args:
+            table (str): the KnowNet table to load
+
+        Returns:
+            str: the column list and SET clause, or '' if there is nothing to
+                convert
+        """
+        schema = read_schema(os.path.join(self.args.code_path, 'mysql', 'KnowNet.sql'))
+        columns = schema.get(table, {}).get('columns', [])
+        hashes = [col for col in columns if col in HASH_COLUMNS]
+        if not self.binary_hashes():
+            hashes = []
+        sets = [col + ' = UNHEX(@' + col + ')' for col in hashes]
+        if table == 'raw_line' and self.args.mysql_raw_store:
+            hashes.append('line_str')
+            sets.append("line_str = ''")
+        if not sets:
+            return ''
+        return '(' + ', '.join('@' + col if col in hashes else col for col in columns) + \
+            ') SET ' + ', '.join(sets)
+
+    def table_sizes(self, tables):
+        """Returns the data and index size of tables in KnowNet.
+
+        The data of an InnoDB table is its primary key, and its index size
+        is the size of its secondary keys.
+
+        Args:
+            tables (list): the tables to measure
+
+        Returns:
+            dict: the (data bytes, index bytes) of each table
+        """
+        cmd = ('SELECT TABLE_NAME, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES '
+               'WHERE TABLE_SCHEMA = "KnowNet" AND TABLE_NAME IN (' +
+               ','.join('"' + table + '"' for table in tables) + ')')
+        return {table: (int(data), int(index)) for table, data, index in self.run(cmd)}
+
+    def table_columns(self, table):
+        """Returns the columns of table in the current database in order.
+
+        Args:
+            table (str): the table to describe
+
+        Returns:
+            list: the column names
+        """
+        cmd = ('SELECT COLUMN_NAME FROM information_schema.COLUMNS '
+               'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = "' + table + '" '
+               'ORDER BY ORDINAL_POSITION')
+        return [row[0] for row in self.run(cmd)]
+
+    def table_keys(self, table):
+        """Returns the keys of table in the current database.
+
+        Args:
+            table (str): the table to describe
+
+        Returns:
+            dict: the list of columns of each key by key name, PRIMARY for the
+                primary key
+        """
+        cmd = ('SELECT INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS '
+               'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = "' + table + '" '
+               'ORDER BY INDEX_NAME, SEQ_IN_INDEX')
+        keys = dict()
+        for key, column in self.run(cmd):
+            keys.setdefault(key, []).append(column)
+        return keys
+
+    def drop_secondary_keys(self, tables):
+        """Drops the secondary keys of tables defined in KnowNet.sql.
+
+        The keys of each table are dropped with a single ALTER TABLE, and can
+        be rebuilt with add_secondary_keys after a bulk load, which sorts each
+        key once instead of updating it for every loaded row. Keys that are
+        already missing, e.g. after an interrupted load, are returned with
+        the dropped keys so they are rebuilt too.
+
+        Args:
+            tables (list): the tables to drop the keys of
+
+        Returns:
+            dict: the list of missing key names of each table
+        """
+        schema = read_schema(os.path.join(self.args.code_path, 'mysql', 'KnowNet.sql'))
+        dropped = dict()
+        for table in tables:
+            if table not in schema:
+                continue
+            current = self.table_keys(table)
+            keys = [key for key in sorted(schema[table]['keys']) if key != 'PRIMARY']
+            drop = [key for key in keys if key in current]
+            if drop:
+                cmd = 'ALTER TABLE ' + table + ' ' + \
+                    ', '.join('DROP KEY `' + key + '`' for key in drop)
+                print(cmd)
+                self.run(cmd)
+            if keys:
+                dropped[table] = keys
+        return dropped
+
+    def add_secondary_keys(self, table, keys):
+        """Adds keys of table as defined in KnowNet.sql with a single ALTER
+        TABLE.
+
+        Keys that already exist, e.g. rebuilt by another load, are skipped.
+
+        Args:
+            table (str): the table to add the keys to
+            keys (list): the names of the keys to add
+        """
+        schema = read_schema(os.path.join(self.args.code_path, 'mysql', 'KnowNet.sql'))
+        table_keys = schema[table]['keys']
+        current = self.table_keys(table)
+        keys = [key for key in keys if key not in current]
+        if not keys:
+            return
+        cmd = 'ALTER TABLE ' + table + ' ' + \
+            ', '.join('ADD KEY `' + key + '` (' +
+                      ', '.join('`' + col + '`' for col in table_keys[key]) + ')'
+                      for key in keys)
+        print(cmd)
+        self.run(cmd)
+
+    def verify_schema(self, tables=None):
+        """Checks that tables match their definition in KnowNet.sql.
+
+        Args:
+            tables (list): the tables to check, or None for every table of
+                KnowNet.sql
+
+        Raises:
+            ValueError: if a table is missing or its columns or keys differ
+        """
+        schema = read_schema(os.path.join(self.args.code_path, 'mysql', 'KnowNet.sql'))
+        if tables is None:
+            tables = sorted(schema)
+        if self.args.mysql_partitions:
+            for table in PARTITION_TABLES:
+                primary = schema[table]['keys']['PRIMARY']
+                if 'et_name' not in primary:
+                    primary.append('et_name')
+        errors = []
+        for table in tables:
+            if table not in schema:
+                continue
+            columns = self.table_columns(table)
+            if not columns:
+                errors.append(table + ': missing')
+                continue
+            if columns != schema[table]['columns']:
+                errors.append(table + ': columns ' + ','.join(columns))
+            keys = self.table_keys(table)
+            for key, key_cols in sorted(schema[table]['keys'].items()):
+                if keys.get(key) != key_cols:
+                    errors.append(table + ': key ' + key + ' ' +
+                                  ','.join(keys.get(key, ['missing'])))
+            for key in sorted(set(keys) - set(schema[table]['keys'])):
+                errors.append(table + ': extra key ' + key)
+        if errors:
+            raise ValueError('ERROR: schema does not match KnowNet.sql: ' + '; '.join(errors))
+        print('Schema of ' + ', '.join(tables) + ' matches KnowNet.sql')
+
+    def upgrade_status(self):
+        """Upgrades a status table created without the file_id and line_num
+        columns to the current KnowNet.sql definition.
+
+        CREATE TABLE IF NOT EXISTS leaves an existing status table unchanged,
+        so the provenance columns and the et_name_status key are added here,
+        and the file_id and line_num of the existing rows are filled in from
+        raw_line. Does nothing if status already has the columns.
+        """
+        columns = self.table_columns('status')
+        if not columns or 'file_id' in columns:
+            return
+        keys = self.table_keys('status')
+        print('Upgrading status with ' + str(len(columns)) + ' columns to KnowNet.sql')
+        alters = ['ADD COLUMN file_id varchar(80) DEFAULT NULL',
+                  'ADD COLUMN line_num int(11) DEFAULT NULL']
+        if keys.get('et_name') == ['et_name']:
+            alters.append('DROP KEY et_name')
+        if 'et_name_status' not in keys:
+            alters.append('ADD KEY et_name_status (et_name, status)')
+        self.run('ALTER TABLE status ' + ', '.join(alters))
+        self.run('UPDATE status s JOIN raw_line r ON s.line_hash = r.line_hash '
+                 'SET s.file_id = r.file_id, s.line_num = r.line_num')
+
+    def table_partitions(self, table):
+        """Returns the partitions of table in the current database.
+
+        Args:
+            table (str): the table to describe
+
+        Returns:
+            dict: the list of values of each partition by partition name,
+                empty if table is not partitioned
+        """
+        cmd = ('SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS '
+               'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = "' + table + '" '
+               'AND PARTITION_NAME IS NOT NULL')
+        return {name: [value.strip().strip("'") for value in desc.split(',')]
+                for name, desc in self.run(cmd)}
+
+    def partition_tables(self, tables=None):
+        """Partitions tables by LIST COLUMNS(et_name) with one partition per
+        edge type of the edge_type table.
+
+        A table that is already partitioned only gets partitions for the
+        edge types added since. Rows of an edge type missing from edge_type
+        cannot be loaded into a partitioned table.
+
+        Args:
+            tables (list): the tables to partition, or None for every table of
+                PARTITION_TABLES
+        """
+        if tables is None:
+            tables = PARTITION_TABLES
+        et_names = sorted(row[0] for row in self.run('SELECT et_name FROM edge_type'))
+        for table in [table for table in tables if table in PARTITION_TABLES]:
+            current = self.table_partitions(table)
+            missing = [et_name for et_name in et_names
+                       if partition_name(et_name) not in current]
+            if not missing:
+                continue
+            parts = ', '.join('PARTITION `' + partition_name(et_name) + "` VALUES IN ('" +
+                              et_name + "')" for et_name in missing)
+            if current:
+                cmd = 'ALTER TABLE ' + table + ' ADD PARTITION (' + parts + ')'
+            else:
+                cmd = 'ALTER TABLE ' + table + ' PARTITION BY LIST COLUMNS(et_name) (' + \
+                    parts + ')'
+            print(cmd)
+            self.run(cmd)
+
+    def exchange_partition(self, table, et_name, swap_table):
+        """Swaps the partition of et_name in table with swap_table.
+
+        Args:
+            table (str): the partitioned table
+            et_name (str): the edge type of the partition to swap
+            swap_table (str): an unpartitioned table like table holding only
+                rows of et_name, which gets the old rows of the partition
+        """
+        cmd = 'ALTER TABLE ' + table + ' EXCHANGE PARTITION `' + partition_name(et_name) + \
+            '` WITH TABLE ' + swap_table
+        print(cmd)
+        self.run(cmd)
+
     def close(self):
         """Close connection to the MySQL server.
 
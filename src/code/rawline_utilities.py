@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+"""Utiliites for keeping the original source lines of the KnowEnG MySQL
+raw_line table in compressed files outside of the database.
+
+With --mysql_raw_store, the raw_line table keeps only the line_hash, line_num
+and file_id of each line (see mysql_utilities.MySQL.table_load_cmd) and the
+line text is written at FETCH time into a store of two files per file_id:
+
+    <file_id>.lines:    zlib compressed blocks of 'line_num\\tline_str' lines
+    <file_id>.index:    the first line_num, offset and length of each block
+
+A line is read back by decompressing the one block holding it, so the
+provenance of an edge can be shown without keeping every line in MySQL.
+
+Contains the class BlockWriter which writes the two files of one file_id.
+
+Contains module functions::
+
+    get_store_dir(args)
+    build_store(raw_line_files, args=None)
+    read_index(file_id, args)
+    read_lines(file_id, line_nums, args=None)
+    get_lines(line_hashes, args=None)
+    main_parse_args()
+    main()
+
+Attributes:
+    STORE_PATH (str): the directory of the store in the data path
+    BLOCK_SIZE (int): the uncompressed bytes of lines in a block
+    INDEX_ENTRY (Struct): the first line_num, offset and length of a block
+
+Examples:
+    To print the original lines of raw_line hashes::
+
+        $ python3 code/rawline_utilities.py 0b8ed7c4a1c9b4a7f2e1d4c3b2a19080
+"""
+
+import os
+import re
+import zlib
+import bisect
+import struct
+from argparse import ArgumentParser
+import config_utilities as cf
+import mysql_utilities as mu
+
+STORE_PATH = 'raw_line_store'
+BLOCK_SIZE = 1 << 16
+INDEX_ENTRY = struct.Struct('<QQI')
+
+def get_store_dir(args):
+    """Returns the directory of the raw line store.
+
+    Args:
+        args (Namespace): args as populated namespace
+
+    Returns:
+        str: the store directory in the data path of the shared storage if
+            there is one, else of the working directory
+    """
+    if args.storage_dir:
+        return os.path.join(args.storage_dir, args.data_path, STORE_PATH)
+    return os.path.join(args.working_dir, args.data_path, STORE_PATH)
+
+def build_store(raw_line_files, args=None):
+    """Writes the lines of raw_line_files into the store.
+
+    The raw_line files (line_hash, line_num, file_id, line_str) must be given
+    in line order, e.g. the chunks of fetch_utilities.chunk from first to
+    last. The files of each file_id are replaced atomically.
+
+    Args:
+        raw_line_files (list): paths of raw_line files
+        args (Namespace): args as populated namespace or 'None' for defaults
+
+    Returns:
+        dict: the number of lines stored for each file_id
+    """
+    if args is None:
+        args = cf.config_args()
+    store_dir = get_store_dir(args)
+    os.makedirs(store_dir, exist_ok=True)
+    outfiles = dict()
+    counts = dict()
+    try:
+        for raw_line_file in raw_line_files:
+            with open(raw_line_file, 'rb') as infile:
+                for line in infile:
+                    fields = line.rstrip(b'\r\n').split(b'\t', 3)
+                    if len(fields) < 4:
+                        continue
+                    file_id = fields[2].decode()
+                    line_str = fields[3]
+                    if len(line_str) > 1 and line_str[:1] == b'"' and line_str[-1:] == b'"':
+                        line_str = line_str[1:-1]
+                    if file_id not in outfiles:
+                        outfiles[file_id] = BlockWriter(os.path.join(store_dir, file_id))
+                        counts[file_id] = 0
+                    outfiles[file_id].add(int(fields[1]), line_str)
+                    counts[file_id] += 1
+    finally:
+        for writer in outfiles.values():
+            writer.close()
+    for file_id, writer in outfiles.items():
+        writer.commit()
+        print('Stored {0} lines of {1}'.format(counts[file_id], file_id))
+    return counts
+
+class BlockWriter(object):
+    """Class writing the lines and index files of one file_id.
+
+    Attributes:
+        path (str): the store path of the file_id without extension
+        lines (file): the temporary lines file
+        index (file): the temporary index file
+        block (list): the lines of the current block
+        block_size (int): the bytes of the current block
+        first (int): the line_num of the first line of the current block
+        offset (int): the offset of the next block in the lines file
+    """
+    def __init__(self, path):
+        """Init a BlockWriter writing path.lines and path.index."""
+        self.path = path
+        self.lines = open(path + '.lines.tmp', 'wb')
+        self.index = open(path + '.index.tmp', 'wb')
+        self.block = []
+        self.block_size = 0
+        self.first = None
+        self.offset = 0
+
+    def add(self, line_num, line_str):
+        """Adds a line, writing the current block once it is full."""
+        if self.first is None:
+            self.first = line_num
+        line = str(line_num).encode() + b'\t' + line_str + b'\n'
+        self.block.append(line)
+        self.block_size += len(line)
+        if self.block_size >= BLOCK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Writes the current block and its index entry."""
+        if not self.block:
+            return
+        data = zlib.compress(b''.join(self.block))
+        self.lines.write(data)
+        self.index.write(INDEX_ENTRY.pack(self.first, self.offset, len(data)))
+        self.offset += len(data)
+        self.block = []
+        self.block_size = 0
+        self.first = None
+
+    def close(self):
+        """Writes the last block and closes the temporary files."""
+        if not self.lines.closed:
+            self.flush()
+            self.lines.close()
+            self.index.close()
+
+    def commit(self):
+        """Replaces the files of the store by the temporary files."""
+        os.replace(self.path + '.lines.tmp', self.path + '.lines')
+        os.replace(self.path + '.index.tmp', self.path + '.index')
+
+def read_index(file_id, args):
+    """Returns the index of the blocks of file_id.
+
+    Args:
+        file_id (str): the file_id of the lines, e.g. dip.PPI
+        args (Namespace): args as populated namespace
+
+    Returns:
+        list: (first line_num, offset, length) of each block in line order
+    """
+    with open(os.path.join(get_store_dir(args), file_id + '.index'), 'rb') as infile:
+        return list(INDEX_ENTRY.iter_unpack(infile.read()))
+
+def read_lines(file_id, line_nums, args=None):
+    """Returns the original lines of file_id with the given line numbers.
+
+    Each block holding a requested line is decompressed once.
+
+    Args:
+        file_id (str): the file_id of the lines, e.g. dip.PPI
+        line_nums (iterable): line numbers as in the raw_line table
+        args (Namespace): args as populated namespace or 'None' for defaults
+
+    Returns:
+        dict: the line_str of each line number found
+    """
+    if args is None:
+        args = cf.config_args()
+    index = read_index(file_id, args)
+    firsts = [entry[0] for entry in index]
+    blocks = dict()
+    for line_num in set(int(num) for num in line_nums):
+        idx = bisect.bisect_right(firsts, line_num) - 1
+        if idx >= 0:
+            blocks.setdefault(idx, set()).add(line_num)
+    lines = dict()
+    with open(os.path.join(get_store_dir(args), file_id + '.lines'), 'rb') as infile:
+        for idx in sorted(blocks):
+            _, offset, length = index[idx]
+            infile.seek(offset)
+            for line in zlib.decompress(infile.read(length)).split(b'\n'):
+                num, _, line_str = line.partition(b'\t')
+                if num and int(num) in blocks[idx]:
+                    lines[int(num)] = line_str.decode('ascii', 'ignore')
+    return lines
+
+def get_lines(line_hashes, args=None):
+    """Returns the original lines of raw_line hashes for provenance.
+
+    The file_id and line_num of each hash are read from the raw_line table
+    and the lines from the store.
+
+    Args:
+        line_hashes (list): md5 line hashes as hex strings
+        args (Namespace): args as populated namespace or 'None' for defaults
+
+    Returns:
+        dict: the (file_id, line_num, line_str) of each line_hash found
+    """
+    if args is None:
+        args = cf.config_args()
+    line_hashes = [line_hash.lower() for line_hash in line_hashes]
+    for line_hash in line_hashes:
+        if not re.match('^[0-9a-f]{32}$', line_hash):
+            raise ValueError('ERROR: not an md5 line hash: ' + line_hash)
+    if not line_hashes:
+        return dict()
+    db = mu.get_database('KnowNet', args)
+    if db.binary_hashes():
+        values = ','.join("UNHEX('" + line_hash + "')" for line_hash in line_hashes)
+        cmd = 'SELECT LOWER(HEX(line_hash)), file_id, line_num FROM raw_line '
+    else:
+        values = ','.join("'" + line_hash + "'" for line_hash in line_hashes)
+        cmd = 'SELECT line_hash, file_id, line_num FROM raw_line '
+    rows = db.run(cmd + 'WHERE line_hash IN (' + values + ')')
+    db.close()
+    by_file = dict()
+    for line_hash, file_id, line_num in rows:
+        by_file.setdefault(file_id, []).append((line_hash, int(line_num)))
+    results = dict()
+    for file_id, hashes in by_file.items():
+        lines = read_lines(file_id, [num for _, num in hashes], args)
+        for line_hash, line_num in hashes:
+            results[line_hash] = (file_id, line_num, lines.get(line_num))
+    return results
+
+def main_parse_args():
+    """Processes command line arguments.
+
+    Expects one or more positional arguments (line_hashes) and a number of
+    optional arguments. If arguments are missing, supplies default values.
+
+    Returns:
+        Namespace: args as populated namespace
+    """
+    parser = ArgumentParser()
+    parser.add_argument('line_hashes', nargs='+', help='raw_line hashes to print')
+    parser = cf.add_config_args(parser)
+    args = parser.parse_args()
+    return args
+
+def main():
+    """Prints the original lines of the raw_line hashes given as arguments.
+    """
+    args = main_parse_args()
+    results = get_lines(args.line_hashes, args)
+    for line_hash in args.line_hashes:
+        file_id, line_num, line_str = results.get(line_hash.lower(), ('', '', None))
+        print('\t'.join([line_hash, file_id, str(line_num),
+                         line_str if line_str is not None else 'not found']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+
+"""Utiliites for building the KnowEnG Redis mapping db offline as RDB files.
+
+Instead of replaying the commands of redis_utilities.import_ensembl,
+import_gene_nodes and import_node_meta against a running Redis, this writes
+the keys those functions would produce straight into Redis RDB files, one
+per shard of the mapping store. A Redis started on a directory holding the
+file loads the whole mapping db at startup.
+
+The mapping keys (unique::, hint::, taxon::, triplet::) do not depend on the
+order they are loaded in, so they are reduced with an external sort. The
+stable:: node keys depend on the load order, so they are built in a
+MemoryStore by the same redis_utilities functions used by the live load.
+
+Contains the class MemoryStore which holds keys in a dictionary with the
+redis connection functions used by redis_utilities.
+
+Contains module functions::
+
+    build_rdb(node_file, node_meta_file, args=None, outfile='')
+    write_mapping_pairs(alias, taxid_alias, map_dir, pairs, store)
+    reduce_pairs(sorted_file)
+    get_rdb_files(args, outfile='')
+    write_rdb(rdb_files, items)
+    encode_length(length)
+    encode_string(value)
+    main_parse_args()
+    main()
+
+Attributes:
+    RDB_HEADER (bytes): the magic and version written at the start of a file
+    RDB_SELECTDB (bytes): opcode selecting the db of the following keys
+    RDB_STRING (bytes): value type of a string key
+    RDB_EOF (bytes): opcode ending the file
+
+Examples:
+    To build the RDB file from the id_map files and dumps of the node and
+    node_meta tables::
+
+        $ python3 code/rdb_utilities.py -nf node.txt -nmf node_meta.txt
+
+    Redis only loads the RDB file if it starts without an append only file.
+    With --redis_from_rdb, redis_utilities starts it that way and turns the
+    append only file on once the file is loaded (see
+    redis_utilities.bulk_load_finish), as does build_status::
+
+        $ python3 code/redis_utilities.py --local --redis_from_rdb
+"""
+
+import os
+import csv
+import sys
+import json
+import shutil
+import struct
+import subprocess
+import tempfile
+from argparse import ArgumentParser
+import config_utilities as cf
+import redis_utilities as ru
+import mysql_utilities as mu
+import snapshot_utilities as sn
+
+csv.field_size_limit(sys.maxsize)
+
+RDB_HEADER = b'REDIS0009'
+RDB_SELECTDB = b'\xfe'
+RDB_STRING = b'\x00'
+RDB_EOF = b'\xff'
+
+class MemoryStore(object):
+    """Class holding Redis keys in a dictionary.
+
+    This class provides the get, set and getset functions of a redis
+    connection, storing values as bytes like Redis does, so it can be passed
+    as the rdb argument of the redis_utilities import functions.
+
+    Attributes:
+        data (dict): the value of each key
+    """
+    def __init__(self):
+        """Init an empty MemoryStore."""
+        self.data = dict()
+
+    def get(self, key):
+        """Returns the value of key, or None if it is not set."""
+        return self.data.get(key)
+
+    def set(self, key, value):
+        """Sets key to value."""
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+
+    def getset(self, key, value):
+        """Sets key to value and returns its old value."""
+        old = self.data.get(key)
+        self.set(key, value)
+        return old
+
+def build_rdb(node_file, node_meta_file, args=None, outfile=''):
+    """Writes the RDB files of the mapping db for every species in
+    species.json.
+
+    This follows the order of the live load: the gene nodes of node_file
+    (see redis_utilities.import_gene_nodes), then the mappings of each alias
+    (see redis_utilities.import_ensembl), then node_meta_file (see
+    redis_utilities.import_node_meta). It also writes the FKFilter of each
+    alias, like import_ensembl.
+
+    Args:
+        node_file (str): tab separated dump of the KnowNet node table
+        node_meta_file (str): tab separated dump of the KnowNet node_meta table
+        args (Namespace): args as populated namespace or 'None' for defaults
+        outfile (str): path of the RDB file of shard 0 (see get_rdb_files)
+
+    Returns:
+        int: the number of keys written
+    """
+    if args is None:
+        args = cf.config_args()
+    map_dir = os.path.join(args.working_dir, args.data_path, cf.DEFAULT_MAP_PATH)
+    with open(os.path.join(map_dir, 'species', 'species.json')) as infile:
+        species_dict = json.load(infile)
+    store = MemoryStore()
+    with open(node_file) as infile:
+        node_table = [row for row in csv.reader(infile, delimiter='\t')
+                      if len(row) == 3 and row[2] == 'Gene' and row[1] != 'NULL']
+    ru.import_gene_nodes(node_table, args, store)
+    del node_table
+    tmpdir = tempfile.mkdtemp(dir=map_dir)
+    pairs_file = os.path.join(tmpdir, 'pairs.txt')
+    sorted_file = os.path.join(tmpdir, 'sorted.txt')
+    try:
+        with open(pairs_file, 'wb') as pairs:
+            for alias in sorted(species_dict):
+                write_mapping_pairs(alias, species_dict[alias], map_dir, pairs, store)
+        ru.import_node_meta(node_meta_file, args, store)
+        env = dict(os.environ, LC_ALL='C')
+        cmd = ['sort', '-u', '-T', tmpdir, '-o', sorted_file, pairs_file]
+        print(' '.join(cmd))
+        subprocess.check_call(cmd, env=env)
+        os.remove(pairs_file)
+        items = reduce_pairs(sorted_file)
+        num_keys = write_rdb(get_rdb_files(args, outfile), items)
+        num_keys += write_rdb(get_rdb_files(args, outfile), store.data.items(), append=True)
+    finally:
+        shutil.rmtree(tmpdir)
+    print('Wrote {0} keys'.format(num_keys))
+    return num_keys
+
+def write_mapping_pairs(alias, taxid_alias, map_dir, pairs, store):
+    """Writes the mapping key value pairs of one alias for sorting.
+
+    Each key of redis_utilities.mapping_keys is written as an escaped key,
+    tab and stable id line. The WIKIGENE aliases are set in store.
+
+    Args:
+        alias (str): An alias defined in ensembl.aliases
+        taxid_alias (str): the taxid of alias from species.json
+        map_dir (str): the id_map directory holding the mappings of alias
+        pairs (file): binary file to write the pairs to
+        store (MemoryStore): the store of the stable:: keys
+    """
+    print('Reading mappings of ' + alias + ' (' + str(taxid_alias) + ')')
+    foreign_keys = set()
+    for (taxid, hint, foreign_key, ens_id) in ru.read_mappings(map_dir, alias):
+        hint = hint.upper()
+        ens_id = ens_id.upper()
+        foreign_key = foreign_key.upper()
+        foreign_keys.add(foreign_key)
+        value = sn.escape_key(ens_id.encode())
+        for keystr in ru.mapping_keys(taxid, hint, foreign_key):
+            pairs.write(sn.escape_key(keystr.encode()) + b'\t' + value + b'\n')
+        if hint == 'WIKIGENE':
+            ru.set_wikigene_alias(store, ens_id, foreign_key)
+    fk_filter = ru.FKFilter()
+    fk_filter.add_keys(foreign_keys)
+    fk_filter.dump(os.path.join(map_dir, alias + ru.FILTER_SUFFIX))
+
+def reduce_pairs(sorted_file):
+    """Yields the final value of each mapping key.
+
+    A key mapped to a single stable id keeps it and a key mapped to several
+    is unmapped-many, as when import_ensembl replays GETSET for each pair.
+
+    Args:
+        sorted_file (str): unique escaped key value pairs sorted by key
+
+    Yields:
+        tuple: the key and its value as bytes
+    """
+    prev = None
+    value = None
+    with open(sorted_file, 'rb') as infile:
+        for line in infile:
+            key, val = line.rstrip(b'\n').split(b'\t', 1)
+            if key == prev:
+                value = b'unmapped-many'
+                continue
+            if prev is not None:
+                yield sn.unescape_key(prev), value
+            prev = key
+            value = sn.unescape_key(val)
+    if prev is not None:
+        yield sn.unescape_key(prev), value
+
+def get_rdb_files(args, outfile=''):
+    """Returns the RDB file of each shard of the mapping store.
+
+    Args:
+        args (Namespace): args as populated namespace
+        outfile (str): path of the RDB file of shard 0, which is followed by
+            outfile.1, outfile.2, ... for the other shards. If empty, the
+            dump.rdb file in the redis_dir of each shard.
+
+    Returns:
+        list: the RDB file path of each shard
+    """
+    rdb_files = []
+    for idx in range(args.redis_shards):
+        if outfile:
+            rdb_files.append(outfile if idx == 0 else outfile + '.' + str(idx))
+        else:
+            rdb_files.append(os.path.join(ru.shard_args(args, idx).redis_dir, 'dump.rdb'))
+    return rdb_files
+
+def write_rdb(rdb_files, items, append=False):
+    """Writes string keys into RDB files, routing each key to its shard.
+
+    The files hold db 0 only and are written without a checksum, which Redis
+    accepts. A call with append=True adds items to the files of an earlier
+    call and completes them; keys must not repeat across calls.
+
+    Args:
+        rdb_files (list): the RDB file path of each shard
+        items (iterable): (key, value) pairs as str or bytes
+        append (bool): if the files were started by an earlier call
+
+    Returns:
+        int: the number of keys written
+    """
+    outfiles = []
+    for rdb_file in rdb_files:
+        os.makedirs(os.path.dirname(os.path.abspath(rdb_file)), exist_ok=True)
+        if append:
+            outfiles.append(open(rdb_file + '.tmp', 'ab'))
+        else:
+            outfile = open(rdb_file + '.tmp', 'wb')
+            outfile.write(RDB_HEADER + RDB_SELECTDB + encode_length(0))
+            outfiles.append(outfile)
+    num_keys = 0
+    try:
+        for key, value in items:
+            outfile = outfiles[ru.shard_idx(key, len(outfiles))]
+            outfile.write(RDB_STRING + encode_string(key) + encode_string(value))
+            num_keys += 1
+    finally:
+        for outfile in outfiles:
+            if append:
+                outfile.write(RDB_EOF + struct.pack('<Q', 0))
+            outfile.close()
+    if append:
+        for rdb_file in rdb_files:
+            os.replace(rdb_file + '.tmp', rdb_file)
+    return num_keys
+
+def encode_length(length):
+    """Returns the RDB length encoding of length.
+
+    Args:
+        length (int): a string length or db number
+
+    Returns:
+        bytes: the encoded length
+    """
+    if length < 1 << 6:
+        return struct.pack('B', length)
+    if length < 1 << 14:
+        return struct.pack('>H', (1 << 14) | length)
+    if length < 1 << 32:
+        return b'\x80' + struct.pack('>I', length)
+    return b'\x81' + struct.pack('>Q', length)
+
+def encode_string(value):
+    """Returns the RDB encoding of a string.
+
+    Args:
+        value (str or bytes): the string to encode
+
+    Returns:
+        bytes: the length encoded raw string
+    """
+    if isinstance(value, str):
+        value = value.encode()
+    return encode_length(len(value)) + value
+
+def main_parse_args():
+    """Processes command line arguments.
+
+    Expects a number of optional arguments. If arguments are missing,
+    supplies default values.
+
+    Returns:
+        Namespace: args as populated namespace
+    """
+    parser = ArgumentParser()
+    parser.add_argument('-o', '--outfile', default='',
+                        help='RDB file of the first shard, default dump.rdb in redis_dir')
+    parser.add_argument('-nf', '--node_file', default='',
+                        help='dump of the node table, default dump it from MySQL')
+    parser.add_argument('-nmf', '--node_meta_file', default='',
+                        help='dump of the node_meta table, default dump it from MySQL')
+    parser = cf.add_config_args(parser)
+    args = parser.parse_args()
+    return args
+
+def main():
+    """Builds the RDB files of the mapping db described by the command line
+    arguments.
+    """
+    args = main_parse_args()
+    map_dir = os.path.join(args.working_dir, args.data_path, cf.DEFAULT_MAP_PATH)
+    for table in ['node', 'node_meta']:
+        if not getattr(args, table + '_file'):
+            filename = os.path.join(map_dir, table + '_table.txt')
+            mu.get_database('KnowNet', args).dump_table(table, filename)
+            setattr(args, table + '_file', filename)
+    build_rdb(args.node_file, args.node_meta_file, args, args.outfile)
+
+if __name__ == "__main__":
+    main()
@@ -2,31 +2,313 @@
 
 """Utiliites for interacting with the KnowEnG Redis db through python.
 
+Contains the class ConvCache which stores recent gene conversions, the
+class FKFilter which tells which foreign keys can never be mapped and the
+classes ShardedRedis and AsyncShardedRedis which route keys to the shards of
+the mapping store.
+
 Contains module functions::
 
+    deploy_container(args=None)
+    deploy_local(args=None)
+    appendonly(args)
+    shard_args(args, idx)
+    shard_idx(key, num_shards)
     get_database(args=None)
-    import_ensembl(alias, args=None)
-    conv_gene(rdb, foreign_key, hint, taxid)
+    get_pool(args)
+    connection_kwargs(args)
+    async_supported()
+    get_async_database(args=None)
+    close_async_database(ardb)
+    get_shards(rdb)
+    bulk_load_start(args=None)
+    bulk_load_finish(args=None, interval=5)
+    wait_for_persistence(shard, in_progress, interval=5)
+    bulk_load_report(shard, idx, stage)
+    import_ensembl(alias, args=None, replay=True)
+    read_mappings(map_dir, alias, suffix='')
+    mapping_aliases(map_dir)
+    stash_mappings(map_dir, alias)
+    prev_mappings(map_dir, alias)
+    mapping_db_empty(rdb)
+    clear_mappings(rdb, map_dir, alias)
+    replay_mappings(rdb, map_dir, alias, foreign_keys)
+    replay_cleared(args=None)
+    set_mapping(rdb, keystr, ens_id)
+    set_mappings(rdb, mappings)
+    mapping_keys(taxid, hint, foreign_key)
+    set_wikigene_alias(rdb, ens_id, foreign_key)
+    import_gene_nodes(node_table, args=None, rdb=None)
+    import_node_meta(nmfile, args=None, rdb=None)
+    conv_gene(rdb, foreign_key, hint, taxid, cache=None, fk_filter=None)
+    filter_idxs(fk_array, fk_filter=None)
+    conv_patterns(hint, taxid)
+    get_node_info(rdb, fk_array, ntype, hint, taxid)
+    node_types(rdb, fk_array)
+    pick_node_type(types)
+    node_desc(rdb, stable_array)
+    conv_gene_async(ardb, fk_array, hint, taxid, cache=None, fk_filter=None)
 
 
 """
 
 import json
 import os
+import sys
+import glob
 from argparse import ArgumentParser
 import subprocess
 import csv
+import time
+import copy
+import zlib
+import math
+import socket
+import struct
+import hashlib
+import asyncio
+from collections import OrderedDict
 import redis
 import config_utilities as cf
 
 MGET_CHUNK = 5000
+REDIS_POOLS = dict()
+BULK_LOAD_KEY = 'bulk_load::state'
+MAPPINGS_SUFFIX = '_all.tsv'
+PREV_SUFFIX = '.prev'
+CLEARED_SUFFIX = '_cleared.txt'
+FILTER_SUFFIX = '_fk.bloom'
+FILTER_FP_RATE = 0.001
+FILTER_MAGIC = b'KNBLOOM1'
+FILTER_HEADER = struct.Struct('<QQ')
+FILTER_HASH = struct.Struct('<QQ')
+
+class ConvCache(object):
+    """Bounded least recently used cache of gene conversions.
+
+    This stores the result of conv_gene keyed by (foreign_key, hint, taxid)
+    so that identifiers seen in earlier chunks of the same worker process are
+    not looked up in Redis again.
+
+    Attributes:
+        size (int): maximum number of conversions to keep
+        entries (OrderedDict): cached conversions in least recent first order
+        hits (int): number of lookups answered from the cache
+        misses (int): number of lookups not found in the cache
+    """
+    def __init__(self, size):
+        """Init a ConvCache holding at most size conversions.
+
+        Args:
+            size (int): maximum number of conversions to keep
+        """
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached stable id for key, or None if it is not cached.
+
+        Args:
+            key (tuple): (foreign_key, hint, taxid) as normalized by conv_gene
+
+        Returns:
+            str: the cached stable id or None
+        """
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Stores the stable id for key, evicting the least recently used
+        conversion if the cache is full.
+
+        Args:
+            key (tuple): (foreign_key, hint, taxid) as normalized by conv_gene
+            value (str): the stable id or unmapped-* result of conv_gene
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def load(self, cachefile):
+        """Warms the cache from a file written by dump.
+
+        Args:
+            cachefile (str): tab separated (foreign_key, hint, taxid, stable_id)
+        """
+        with open(cachefile, 'r') as infile:
+            reader = csv.reader(infile, delimiter='\t')
+            for foreign_key, hint, taxid, stable in reader:
+                self.put((foreign_key, hint or None, taxid or None), stable)
+
+    def dump(self, cachefile):
+        """Writes the cached conversions to cachefile for warming a later
+        build. The file is replaced atomically.
+
+        Args:
+            cachefile (str): path to write the conversions to
+        """
+        tmpfile = cachefile + '.' + str(os.getpid())
+        with open(tmpfile, 'w') as outfile:
+            writer = csv.writer(outfile, delimiter='\t', lineterminator='\n')
+            for (foreign_key, hint, taxid), stable in self.entries.items():
+                writer.writerow([foreign_key, hint or '', taxid or '', stable])
+        os.replace(tmpfile, cachefile)
+
+    def report(self):
+        """Writes the hit and miss statistics as run info log lines."""
+        cf.CSVM.writerow(['run info', 'conv_cache_hits', self.hits])
+        cf.CSVM.writerow(['run info', 'conv_cache_misses', self.misses])
+        cf.CSVM.writerow(['run info', 'conv_cache_entries', len(self.entries)])
+
+class FKFilter(object):
+    """Bloom filters of the foreign keys loaded into the mapping db.
+
+    Every mapping key written by import_ensembl contains its foreign key, so
+    a foreign key that is in none of the filters can never be mapped and
+    conv_gene does not need to look it up. Each filter is built for the
+    foreign keys of one ensembl alias, so false positives only cost the
+    Redis lookups that would have been made anyway. A key is hashed once
+    and its bit positions in every filter are derived from that hash, and
+    the false positive rate of the filters together is about
+    len(blooms) * FILTER_FP_RATE.
+
+    Attributes:
+        blooms (list): (num_bits, num_hashes, bits) of each filter
+        checked (int): number of foreign keys checked
+        skipped (int): number of foreign keys found in none of the filters
+    """
+    def __init__(self):
+        """Init an FKFilter without any filters, which skips no keys."""
+        self.blooms = []
+        self.checked = 0
+        self.skipped = 0
+
+    @staticmethod
+    def key_hashes(key):
+        """Returns the two 64 bit hashes all bit positions of key derive from.
+
+        Args:
+            key (str): an upper case foreign key
+
+        Returns:
+            tuple: (hash1, hash2) of key
+        """
+        return FILTER_HASH.unpack(hashlib.blake2b(key.encode(), digest_size=16).digest())
+
+    @staticmethod
+    def positions(hashes, num_bits, num_hashes):
+        """Returns the bit positions of a key in a filter.
+
+        Args:
+            hashes (tuple): the key_hashes of the key
+            num_bits (int): number of bits in the filter
+            num_hashes (int): number of hash functions of the filter
+
+        Returns:
+            list: the bit positions to set or test
+        """
+        hash1, hash2 = hashes
+        return [(hash1 + i * hash2) % num_bits for i in range(num_hashes)]
+
+    def add_keys(self, keys, fp_rate=FILTER_FP_RATE):
+        """Builds a new filter holding keys.
+
+        Args:
+            keys (set): the upper case foreign keys to add
+            fp_rate (float): the false positive rate the filter is sized for
+        """
+        num_bits = max(8, int(math.ceil(-len(keys) * math.log(fp_rate) / math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / max(1, len(keys)) * math.log(2))))
+        bits = bytearray((num_bits + 7) // 8)
+        for key in keys:
+            for pos in self.positions(self.key_hashes(key), num_bits, num_hashes):
+                bits[pos >> 3] |= 1 << (pos & 7)
+        self.blooms.append((num_bits, num_hashes, bits))
+
+    def contains(self, key):
+        """Returns False if key is in none of the filters.
+
+        Args:
+            key (str): an upper case foreign key
+
+        Returns:
+            bool: True if key may have been loaded into the mapping db
+        """
+        if not self.blooms:
+            return True
+        hashes = self.key_hashes(key)
+        for num_bits, num_hashes, bits in self.blooms:
+            if all(bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self.positions(hashes, num_bits, num_hashes)):
+                return True
+        return False
+
+    def check(self, keys):
+        """Returns contains for each of keys and counts the skipped keys.
+
+        Args:
+            keys (list): the upper case foreign keys to check
+
+        Returns:
+            list: contains(key) for each key
+        """
+        found = [self.contains(key) for key in keys]
+        self.checked += len(found)
+        self.skipped += found.count(False)
+        return found
+
+    def load(self, filterfile):
+        """Adds the filters in a file written by dump.
+
+        Args:
+            filterfile (str): path to a filter file
+        """
+        with open(filterfile, 'rb') as infile:
+            if infile.read(len(FILTER_MAGIC)) != FILTER_MAGIC:
+                raise ValueError(filterfile + ' is not a foreign key filter')
+            num_bits, num_hashes = FILTER_HEADER.unpack(infile.read(FILTER_HEADER.size))
+            bits = bytearray(infile.read((num_bits + 7) // 8))
+        self.blooms.append((num_bits, num_hashes, bits))
+
+    def dump(self, filterfile):
+        """Writes the last built filter to filterfile. The file is replaced
+        atomically.
+
+        Args:
+            filterfile (str): path to write the filter to
+        """
+        num_bits, num_hashes, bits = self.blooms[-1]
+        tmpfile = filterfile + '.' + str(os.getpid())
+        with open(tmpfile, 'wb') as outfile:
+            outfile.write(FILTER_MAGIC)
+            outfile.write(FILTER_HEADER.pack(num_bits, num_hashes))
+            outfile.write(bits)
+        os.replace(tmpfile, filterfile)
+
+    def report(self):
+        """Writes the checked and skipped counts as run info log lines."""
+        cf.CSVM.writerow(['run info', 'fk_filter_checked', self.checked])
+        cf.CSVM.writerow(['run info', 'fk_filter_skipped', self.skipped])
 
 def deploy_container(args=None):
     """Deplays a container with marathon running Redis using the specified
     args.
 
     This replaces the placeholder args in the json describing how to deploy a
-    container running Redis with those supplied in the users arguements.
+    container running Redis with those supplied in the users arguements. If
+    args.redis_shards is more than one, a container is deployed for each
+    shard (see shard_args). With args.redis_from_rdb, Redis starts without
+    the append only file so it loads the dump.rdb of its redis_dir (see
+    rdb_utilities), and bulk_load_finish must be run once it is up.
 
     Args:
         args (Namespace): args as populated namespace or 'None' for defaults
@@ -37,36 +319,210 @@ def deploy_container(args=None):
     if not os.path.exists(deploy_dir):
         os.makedirs(deploy_dir)
     template_job = os.path.join(args.code_path, 'marathon', 'redis.json')
-    with open(template_job, 'r') as infile:
-        deploy_dict = json.load(infile)
-    deploy_dict["id"] = os.path.basename(args.redis_dir)
-    deploy_dict["cmd"] = "redis-server --appendonly yes --requirepass " + \
-                        args.redis_pass + " --port " + args.redis_port
-    deploy_dict["cpus"] = float(args.redis_cpu)
-    deploy_dict["mem"] = int(args.redis_mem)
-    if args.redis_host is not cf.DEFAULT_REDIS_URL:
-        deploy_dict["constraints"] = [["hostname", "CLUSTER", args.redis_host]]
-    else:
-        deploy_dict["constraints"] = []
-    deploy_dict["container"]["volumes"][0]["hostPath"] = args.redis_dir
-    out_path = os.path.join(deploy_dir, "kn_redis-" + args.redis_port +'.json')
-    with open(out_path, 'w') as outfile:
-        outfile.write(json.dumps(deploy_dict))
-    job = 'curl -fX POST -H "Content-type: application/json" ' + args.marathon + "/v2/apps -d '"
-    job += json.dumps(deploy_dict) + "'"
-    if not args.test_mode:
-        try:
-            subprocess.check_output(job, shell=True)
-        except subprocess.CalledProcessError as ex1:
-            print(ex1.output)
-    else:
-        print(job)
+    for idx in range(args.redis_shards):
+        sargs = shard_args(args, idx)
+        with open(template_job, 'r') as infile:
+            deploy_dict = json.load(infile)
+        deploy_dict["id"] = os.path.basename(sargs.redis_dir)
+        deploy_dict["cmd"] = "redis-server --appendonly " + appendonly(sargs) + \
+                            " --requirepass " + \
+                            sargs.redis_pass + " --port " + sargs.redis_port
+        if sargs.redis_socket:
+            deploy_dict["cmd"] += " --unixsocket " + sargs.redis_socket + \
+                                  " --unixsocketperm 777"
+        deploy_dict["cpus"] = float(sargs.redis_cpu)
+        deploy_dict["mem"] = int(sargs.redis_mem)
+        if sargs.redis_host is not cf.DEFAULT_REDIS_URL:
+            deploy_dict["constraints"] = [["hostname", "CLUSTER", sargs.redis_host]]
+        else:
+            deploy_dict["constraints"] = []
+        deploy_dict["container"]["volumes"][0]["hostPath"] = sargs.redis_dir
+        out_path = os.path.join(deploy_dir, "kn_redis-" + sargs.redis_port +'.json')
+        with open(out_path, 'w') as outfile:
+            outfile.write(json.dumps(deploy_dict))
+        job = 'curl -fX POST -H "Content-type: application/json" ' + sargs.marathon
+        job += "/v2/apps -d '" + json.dumps(deploy_dict) + "'"
+        if not sargs.test_mode:
+            try:
+                subprocess.check_output(job, shell=True)
+            except subprocess.CalledProcessError as ex1:
+                print(ex1.output)
+        else:
+            print(job)
+
+def deploy_local(args=None):
+    """Starts a redis-server process on this host for each shard of the
+    mapping store, for running and testing without marathon.
+
+    With args.redis_from_rdb, the servers load the dump.rdb of their
+    redis_dir (see rdb_utilities) and the append only file is turned on
+    once they are loaded (see bulk_load_finish).
+
+    Args:
+        args (Namespace): args as populated namespace or 'None' for defaults
+    """
+    if args is None:
+        args = cf.config_args()
+    for idx in range(args.redis_shards):
+        sargs = shard_args(args, idx)
+        if not os.path.exists(sargs.redis_dir):
+            os.makedirs(sargs.redis_dir)
+        cmd = ['redis-server', '--daemonize', 'yes', '--appendonly', appendonly(sargs),
+               '--requirepass', sargs.redis_pass, '--port', sargs.redis_port,
+               '--dir', sargs.redis_dir]
+        if sargs.redis_socket:
+            cmd.extend(['--unixsocket', sargs.redis_socket, '--unixsocketperm', '777'])
+        print(' '.join(cmd))
+        if not sargs.test_mode:
+            subprocess.check_call(cmd)
+    if args.redis_from_rdb and not args.test_mode:
+        bulk_load_finish(args)
+
+def appendonly(args):
+    """Returns the --appendonly option Redis is started with.
+
+    Redis ignores dump.rdb at startup if the append only file is on, so it
+    is off when starting from an RDB file built by rdb_utilities.
+
+    Args:
+        args (Namespace): args as populated namespace
+
+    Returns:
+        str: 'no' with args.redis_from_rdb, else 'yes'
+    """
+    return 'no' if args.redis_from_rdb else 'yes'
+
+def shard_args(args, idx):
+    """Returns the args describing shard idx of the mapping store.
+
+    Shard 0 is the Redis db given by args. Shard idx uses port
+    args.redis_port + idx, directory args.redis_dir-idx and, if a unix socket
+    is used, socket args.redis_socket.idx.
+
+    Args:
+        args (Namespace): args as populated namespace
+        idx (int): the shard number
+
+    Returns:
+        Namespace: args with the Redis location of the shard
+    """
+    if idx == 0:
+        return args
+    sargs = copy.copy(args)
+    sargs.redis_port = str(int(args.redis_port) + idx)
+    sargs.redis_dir = args.redis_dir.rstrip('/') + '-' + str(idx)
+    if args.redis_socket:
+        sargs.redis_socket = args.redis_socket + '.' + str(idx)
+    return sargs
+
+def shard_idx(key, num_shards):
+    """Returns the shard of the mapping store that holds key.
+
+    Args:
+        key (str or bytes): a Redis key
+        num_shards (int): the number of shards
+
+    Returns:
+        int: the shard number
+    """
+    if isinstance(key, str):
+        key = key.encode()
+    return zlib.crc32(key) % num_shards
+
+class ShardedRedis(object):
+    """Client side router for a mapping store split across Redis dbs.
+
+    Each key is stored on the shard given by shard_idx. This class provides
+    the redis connection functions used by the pipeline, so it can be used
+    wherever get_database is.
+
+    Attributes:
+        shards (list): the redis connection of each shard
+    """
+    def __init__(self, shards):
+        """Init a ShardedRedis object.
+
+        Args:
+            shards (list): the redis connection of each shard, in shard order
+        """
+        self.shards = shards
+
+    def shard(self, key):
+        """Returns the redis connection holding key."""
+        return self.shards[shard_idx(key, len(self.shards))]
+
+    def get(self, key):
+        """Returns the value of key."""
+        return self.shard(key).get(key)
+
+    def set(self, key, value):
+        """Sets key to value."""
+        return self.shard(key).set(key, value)
+
+    def getset(self, key, value):
+        """Sets key to value and returns its old value."""
+        return self.shard(key).getset(key, value)
+
+    def delete(self, *keys):
+        """Deletes keys and returns the number deleted."""
+        return sum(self.shards[idx].delete(*[keys[i] for i in idxs])
+                   for idx, idxs in self.group(keys).items())
+
+    def group(self, keys):
+        """Returns the positions in keys of the keys on each shard.
+
+        Args:
+            keys (list): Redis keys
+
+        Returns:
+            dict: the list of positions for each shard number
+        """
+        groups = dict()
+        for i, key in enumerate(keys):
+            groups.setdefault(shard_idx(key, len(self.shards)), []).append(i)
+        return groups
+
+    def mget(self, keys):
+        """Returns the values of keys, with one MGET per shard."""
+        keys = list(keys)
+        vals = [None] * len(keys)
+        for idx, idxs in self.group(keys).items():
+            for i, val in zip(idxs, self.shards[idx].mget([keys[i] for i in idxs])):
+                vals[i] = val
+        return vals
+
+    def scan_iter(self, match=None, count=None):
+        """Yields the keys matching match from every shard."""
+        for shard in self.shards:
+            for key in shard.scan_iter(match=match, count=count):
+                yield key
+
+class AsyncShardedRedis(ShardedRedis):
+    """ShardedRedis for asyncio redis connections.
+
+    Attributes:
+        shards (list): the asyncio redis connection of each shard
+    """
+    async def mget(self, keys):
+        """Returns the values of keys, with the MGETs of all shards sent
+        concurrently."""
+        keys = list(keys)
+        vals = [None] * len(keys)
+        groups = self.group(keys)
+        results = await asyncio.gather(*[self.shards[idx].mget([keys[i] for i in idxs])
+                                         for idx, idxs in groups.items()])
+        for idxs, res in zip(groups.values(), results):
+            for i, val in zip(idxs, res):
+                vals[i] = val
+        return vals
 
 def get_database(args=None):
     """Returns a Redis database connection.
 
     This returns a Redis database connection access to its functions if the
-    module is imported.
+    module is imported. All connections to the same Redis db in a process
+    share one connection pool (see get_pool). If args.redis_shards is more
+    than one, this returns a ShardedRedis router over all of the shards.
 
     Args:
         args (Namespace): args as populated namespace or 'None' for defaults
@@ -75,85 +531,561 @@ def get_database(args=None):
     """
     if args is None:
         args = cf.config_args()
-    return redis.StrictRedis(host=args.redis_host, port=args.redis_port,
-                             password=args.redis_pass)
+    if args.redis_shards > 1:
+        return ShardedRedis([redis.StrictRedis(connection_pool=get_pool(shard_args(args, idx)))
+                             for idx in range(args.redis_shards)])
+    return redis.StrictRedis(connection_pool=get_pool(args))
+
+def get_pool(args):
+    """Returns the connection pool of this process for the Redis db in args.
+
+    Pools are keyed by host, port, db and unix socket and hold at most
+    args.redis_pool_size connections. A caller that finds every connection
+    in use waits up to args.redis_timeout seconds for one to be released.
+
+    Args:
+        args (Namespace): args as populated namespace
+
+    Returns:
+        BlockingConnectionPool: the shared connection pool
+    """
+    key = (args.redis_host, str(args.redis_port), int(args.redis_db), args.redis_socket)
+    if key not in REDIS_POOLS:
+        conn_class = redis.UnixDomainSocketConnection if args.redis_socket \
+            else redis.Connection
+        REDIS_POOLS[key] = redis.BlockingConnectionPool(
+            connection_class=conn_class, max_connections=args.redis_pool_size,
+            timeout=args.redis_timeout or None, **connection_kwargs(args))
+    return REDIS_POOLS[key]
+
+def connection_kwargs(args):
+    """Returns the connection options for the Redis db in args.
+
+    Connects through args.redis_socket if it is set and otherwise through
+    TCP to args.redis_host and args.redis_port, with keepalive probes after
+    args.redis_keepalive idle seconds unless it is 0.
+
+    Args:
+        args (Namespace): args as populated namespace
+
+    Returns:
+        dict: keyword arguments for a redis connection class
+    """
+    kwargs = {'db': int(args.redis_db), 'password': args.redis_pass,
+              'socket_timeout': args.redis_timeout or None}
+    if args.redis_socket:
+        kwargs['path'] = args.redis_socket
+        return kwargs
+    kwargs.update({'host': args.redis_host, 'port': int(args.redis_port),
+                   'socket_connect_timeout': args.redis_timeout or None})
+    if args.redis_keepalive > 0:
+        kwargs['socket_keepalive'] = True
+        kwargs['socket_keepalive_options'] = {
+            getattr(socket, opt): val for opt, val in
+            [('TCP_KEEPIDLE', args.redis_keepalive), ('TCP_KEEPINTVL', args.redis_keepalive),
+             ('TCP_KEEPCNT', 3)] if hasattr(socket, opt)}
+    return kwargs
+
+def async_supported():
+    """Returns if the asyncio Redis connections can be used.
+
+    They need Python 3.9 for asyncio.to_thread and redis-py 4.2 for
+    redis.asyncio, which older images may not have.
+
+    Returns:
+        bool: True if get_async_database can be used
+    """
+    if sys.version_info < (3, 9):
+        return False
+    try:
+        from redis import asyncio as aioredis
+    except ImportError:
+        return False
+    return aioredis is not None
+
+def get_async_database(args=None):
+    """Returns an asyncio Redis database connection.
+
+    The connection must be created and used inside a running event loop (see
+    conv_utilities.map_async). It uses the same options and shards as
+    get_database, but its pool is bound to the event loop, so it is not
+    shared and must be closed with close_async_database.
+
+    Args:
+        args (Namespace): args as populated namespace or 'None' for defaults
+    Returns:
+        redis.asyncio.StrictRedis: an asyncio redis connection object
+    """
+    if args is None:
+        args = cf.config_args()
+    if args.redis_shards > 1:
+        shards = []
+        for idx in range(args.redis_shards):
+            sargs = copy.copy(shard_args(args, idx))
+            sargs.redis_shards = 1
+            shards.append(get_async_database(sargs))
+        return AsyncShardedRedis(shards)
+    from redis import asyncio as aioredis
+    conn_class = aioredis.UnixDomainSocketConnection if args.redis_socket \
+        else aioredis.Connection
+    pool = aioredis.BlockingConnectionPool(
+        connection_class=conn_class, max_connections=args.redis_pool_size,
+        timeout=args.redis_timeout or None, **connection_kwargs(args))
+    return aioredis.StrictRedis(connection_pool=pool)
+
+async def close_async_database(ardb):
+    """Closes an asyncio Redis connection from get_async_database and its pool.
 
-def import_ensembl(alias, args=None):
+    Args:
+        ardb (redis.asyncio object): asyncio redis connection to close
+    """
+    for shard in getattr(ardb, 'shards', [ardb]):
+        await shard.close()
+        await shard.connection_pool.disconnect()
+
+def get_shards(rdb):
+    """Returns the redis connection of each shard of rdb.
+
+    Args:
+        rdb (redis object): a connection from get_database
+
+    Returns:
+        list: the redis connections of the shards, or [rdb] if not sharded
+    """
+    return getattr(rdb, 'shards', [rdb])
+
+def bulk_load_start(args=None):
+    """Turns off persistence of the Redis mapping store before a bulk load.
+
+    This disables the append only file and RDB save points on every shard
+    so that the many writes of import_ensembl and import_node_meta are not
+    logged. The previous save points and the start time are kept in the
+    BULK_LOAD_KEY of each shard for bulk_load_finish.
+
+    Args:
+        args (Namespace): args as populated namespace or 'None' for defaults
+    """
+    if args is None:
+        args = cf.config_args()
+    for idx, shard in enumerate(get_shards(get_database(args))):
+        if shard.get(BULK_LOAD_KEY) is not None:
+            print('Bulk load of Redis shard {0} already started'.format(idx))
+            continue
+        bulk_load_report(shard, idx, 'start')
+        state = {'start': time.time(), 'save': shard.config_get('save').get('save', ''),
+                 'appendonly': shard.config_get('appendonly').get('appendonly', 'yes')}
+        shard.config_set('appendonly', 'no')
+        shard.config_set('save', '')
+        shard.set(BULK_LOAD_KEY, json.dumps(state))
+
+def bulk_load_finish(args=None, interval=5):
+    """Saves the Redis mapping store after a bulk load and turns persistence
+    back on.
+
+    On every shard this waits for a Redis started from an RDB file to load
+    it, then runs BGSAVE and waits for the RDB snapshot to finish,
+    raising an error if it failed. It then restores the save points and, if
+    it was on before bulk_load_start, the append only file, and waits for
+    the append only file rewrite to finish.
+
+    Args:
+        args (Namespace): args as populated namespace or 'None' for defaults
+        interval (int): seconds between checks of the background saves
+    """
+    if args is None:
+        args = cf.config_args()
+    for idx, shard in enumerate(get_shards(get_database(args))):
+        wait_for_persistence(shard, 'loading', interval)
+        state = shard.get(BULK_LOAD_KEY)
+        state = json.loads(state.decode()) if state is not None else \
+            {'start': None, 'save': '', 'appendonly': 'yes'}
+        shard.delete(BULK_LOAD_KEY)
+        if state['start'] is not None:
+            cf.CSVM.writerow(['run info', 'redis_{0}_load_seconds'.format(idx),
+                              '{0:.1f}'.format(time.time() - state['start'])])
+        save_start = time.time()
+        shard.bgsave()
+        persistence = wait_for_persistence(shard, 'rdb_bgsave_in_progress', interval)
+        if persistence['rdb_last_bgsave_status'] != 'ok' or \
+            persistence['rdb_last_save_time'] < int(save_start):
+            raise RuntimeError('RDB snapshot of Redis shard {0} failed'.format(idx))
+        cf.CSVM.writerow(['run info', 'redis_{0}_rdb_seconds'.format(idx),
+                          '{0:.1f}'.format(time.time() - save_start)])
+        shard.config_set('save', state['save'])
+        if state['appendonly'] == 'yes':
+            aof_start = time.time()
+            shard.config_set('appendonly', 'yes')
+            persistence = wait_for_persistence(shard, 'aof_rewrite_in_progress', interval)
+            if persistence['aof_last_bgrewrite_status'] != 'ok':
+                raise RuntimeError('AOF rewrite of Redis shard {0} failed'.format(idx))
+            cf.CSVM.writerow(['run info', 'redis_{0}_aof_seconds'.format(idx),
+                              '{0:.1f}'.format(time.time() - aof_start)])
+        bulk_load_report(shard, idx, 'finish')
+
+def wait_for_persistence(shard, in_progress, interval=5):
+    """Waits until a background save of a Redis shard is done.
+
+    Args:
+        shard (redis object): redis connection to one shard
+        in_progress (str): the INFO persistence field that is 1 while saving
+        interval (int): seconds between checks
+
+    Returns:
+        dict: the INFO persistence fields once the save is done
+    """
+    while True:
+        persistence = shard.info('persistence')
+        if not persistence[in_progress] and not persistence.get('aof_rewrite_scheduled'):
+            return persistence
+        time.sleep(interval)
+
+def bulk_load_report(shard, idx, stage):
+    """Writes the size and persistence settings of a Redis shard as run info
+    log lines.
+
+    Args:
+        shard (redis object): redis connection to one shard
+        idx (int): the shard number
+        stage (str): 'start' or 'finish'
+    """
+    prefix = 'redis_{0}_{1}_'.format(idx, stage)
+    cf.CSVM.writerow(['run info', prefix + 'time', time.strftime("%y/%m/%d %H:%M:%S")])
+    cf.CSVM.writerow(['run info', prefix + 'keys', shard.dbsize()])
+    cf.CSVM.writerow(['run info', prefix + 'used_memory',
+                      shard.info('memory')['used_memory_human']])
+    cf.CSVM.writerow(['run info', prefix + 'appendonly',
+                      shard.config_get('appendonly').get('appendonly')])
+
+def import_ensembl(alias, args=None, replay=True):
     """Imports the ensembl data for the provided alias into the Redis database.
 
     This stores the foreign key to ensembl stable ids in the Redis database.
-    It uses the all mappings dictionary created by mysql.query_all_mappings
-    for alias. This then iterates through each foreign_key. If the foreign_key
+    It uses the all mappings file created by mysql.query_all_mappings
+    for alias (see read_mappings). This then iterates through each foreign_key. If the foreign_key
     has not been seen before, it sets unique:foreign_key as the stable id. If
     the key has been seen before and maps to a different ensembl stable id, it
     sets the value for unique:foreign_key as unmapped:many. In each case, it
     sets the value of taxid:hint:foreign_key as the stable_id, and appends
-    taxid:hint to the set with foreign_key as the key.
+    taxid:hint to the set with foreign_key as the key. Finally it writes the
+    FKFilter of all foreign keys of alias to alias + FILTER_SUFFIX.
+
+    If the mappings of an earlier release of alias were stashed (see
+    stash_mappings), their keys are deleted first (see clear_mappings) and
+    the keys shared with the other species are rebuilt afterwards (see
+    replay_mappings), so a refreshed species leaves no stale mappings. If
+    replay is False, the cleared foreign keys are instead added to
+    alias + CLEARED_SUFFIX, so that one replay_cleared after many species
+    rebuilds them all at once. Nothing is cleared if the mapping db was
+    empty.
 
     Args:
         alias (str): An alias defined in ensembl.aliases.
         args (Namespace): args as populated namespace or 'None' for defaults
+        replay (bool): rebuild the cleared keys now instead of leaving them
+            to replay_cleared
     """
     if args is None:
         args = cf.config_args()
     rdb = get_database(args)
     map_dir = os.path.join(args.working_dir, args.data_path, cf.DEFAULT_MAP_PATH)
-    with open(os.path.join(map_dir, alias + '_all.json')) as infile:
+    prev_file = prev_mappings(map_dir, alias)
+    if prev_file and mapping_db_empty(rdb):
+        os.remove(prev_file)
+        prev_file = ''
+    affected = set()
+    if prev_file:
+        affected = clear_mappings(rdb, map_dir, alias)
+        print('Cleared the mappings of {0} foreign keys of {1}'.format(len(affected), alias))
+        if not replay:
+            with open(os.path.join(map_dir, alias + CLEARED_SUFFIX), 'a') as outfile:
+                outfile.writelines(key + '\n' for key in sorted(affected))
+    foreign_keys = set()
+    for (taxid, hint, foreign_key, ens_id) in read_mappings(map_dir, alias):
+        hint = hint.upper()
+        ens_id = ens_id.upper()
+        foreign_key = foreign_key.upper()
+        foreign_keys.add(foreign_key)
+
+        for keystr in mapping_keys(taxid, hint, foreign_key):
+            set_mapping(rdb, keystr, ens_id)
+
+        if hint == 'WIKIGENE':
+            set_wikigene_alias(rdb, ens_id, foreign_key)
+
+    if prev_file:
+        if replay:
+            replay_mappings(rdb, map_dir, alias, affected)
+        os.remove(prev_file)
+    fk_filter = FKFilter()
+    fk_filter.add_keys(foreign_keys)
+    fk_filter.dump(os.path.join(map_dir, alias + FILTER_SUFFIX))
+
+def read_mappings(map_dir, alias, suffix=''):
+    """Yields the mappings of alias written by mysql.query_all_mappings.
+
+    Reads the rows of alias + MAPPINGS_SUFFIX one at a time. If it does not
+    exist, falls back to the alias + '_all.json' dictionary of older id_map
+    directories.
+
+    Args:
+        map_dir (str): the id_map directory
+        alias (str): An alias defined in ensembl.aliases.
+        suffix (str): added to the file names, PREV_SUFFIX to read the
+            stashed mappings
+
+    Yields:
+        tuple: the taxid, hint, foreign key and stable id of each mapping
+    """
+    map_file = os.path.join(map_dir, alias + MAPPINGS_SUFFIX + suffix)
+    if os.path.isfile(map_file):
+        with open(map_file, newline='') as infile:
+            for row in csv.reader(infile, delimiter='\t'):
+                yield tuple(row)
+        return
+    with open(os.path.join(map_dir, alias + '_all.json' + suffix)) as infile:
         map_dict = json.load(infile)
     for key in map_dict:
         (taxid, _, _, hint, foreign_key) = key.split('::')
-        hint = hint.upper()
-        ens_id = map_dict[key].upper()
+        yield (taxid, hint, foreign_key, map_dict[key])
+
+def mapping_aliases(map_dir):
+    """Returns the aliases with a mappings file in map_dir.
+
+    Args:
+        map_dir (str): the id_map directory
+
+    Returns:
+        list: the sorted aliases
+    """
+    aliases = set()
+    for suffix in [MAPPINGS_SUFFIX, '_all.json']:
+        for path in glob.glob(os.path.join(map_dir, '*' + suffix)):
+            aliases.add(os.path.basename(path)[:-len(suffix)])
+    return sorted(aliases)
+
+def stash_mappings(map_dir, alias):
+    """Keeps the loaded mappings of alias before a new release is imported.
+
+    Renames the mappings file of alias by adding PREV_SUFFIX, so
+    import_ensembl can delete its keys after the new file is written. A
+    stash left by a failed import is kept, as it still describes what was
+    loaded.
+
+    Args:
+        map_dir (str): the id_map directory
+        alias (str): An alias defined in ensembl.aliases.
+
+    Returns:
+        str: the path of the stashed mappings, or '' if there are none
+    """
+    prev_file = prev_mappings(map_dir, alias)
+    if prev_file:
+        return prev_file
+    for name in [alias + MAPPINGS_SUFFIX, alias + '_all.json']:
+        map_file = os.path.join(map_dir, name)
+        if os.path.isfile(map_file):
+            os.replace(map_file, map_file + PREV_SUFFIX)
+            return map_file + PREV_SUFFIX
+    return ''
+
+def prev_mappings(map_dir, alias):
+    """Returns the path of the stashed mappings of alias, or '' if there are
+    none (see stash_mappings).
+    """
+    for name in [alias + MAPPINGS_SUFFIX, alias + '_all.json']:
+        prev_file = os.path.join(map_dir, name + PREV_SUFFIX)
+        if os.path.isfile(prev_file):
+            return prev_file
+    return ''
+
+def mapping_db_empty(rdb):
+    """Returns True if no shard of the mapping db holds any mappings.
+
+    Args:
+        rdb (redis object): redis connection to the mapping db
+
+    Returns:
+        bool: True if the only key of every shard is its BULK_LOAD_KEY
+    """
+    return all(shard.dbsize() <= shard.exists(BULK_LOAD_KEY) for shard in get_shards(rdb))
+
+def clear_mappings(rdb, map_dir, alias):
+    """Deletes the mapping keys of the stashed mappings of alias.
+
+    Args:
+        rdb (redis object): redis connection to the mapping db
+        map_dir (str): the id_map directory
+        alias (str): An alias defined in ensembl.aliases.
+
+    Returns:
+        set: the upper case foreign keys of the stashed mappings
+    """
+    foreign_keys = set()
+    keys = list()
+    for (taxid, hint, foreign_key, _) in read_mappings(map_dir, alias, PREV_SUFFIX):
         foreign_key = foreign_key.upper()
+        foreign_keys.add(foreign_key)
+        keys.extend(mapping_keys(taxid, hint.upper(), foreign_key))
+        if len(keys) >= MGET_CHUNK:
+            rdb.delete(*keys)
+            keys = list()
+    if keys:
+        rdb.delete(*keys)
+    return foreign_keys
 
-        keystr = 'unique::' + foreign_key
-        rkey = rdb.getset(keystr, ens_id)
-        if rkey is not None and rkey.decode() != ens_id:
-            rdb.set(keystr, 'unmapped-many')
+def replay_mappings(rdb, map_dir, alias, foreign_keys):
+    """Reloads the mappings of the other species for cleared foreign keys.
 
-        keystr = 'hint::' + foreign_key + '::' + hint
-        rkey = rdb.getset(keystr, ens_id)
-        if rkey is not None and rkey.decode() != ens_id:
-            rdb.set(keystr, 'unmapped-many')
+    The unique:: and hint:: keys are shared by all species and the taxon::
+    and triplet:: keys by the aliases of a taxid, so after clear_mappings
+    the mappings of every other alias with one of foreign_keys are set
+    again. Each mappings file is read once and the keys are set in batches
+    (see set_mappings).
 
-        keystr = 'taxon::' + foreign_key + '::' + taxid
-        rkey = rdb.getset(keystr, ens_id)
-        if rkey is not None and rkey.decode() != ens_id:
-            rdb.set(keystr, 'unmapped-many')
+    Args:
+        rdb (redis object): redis connection to the mapping db
+        map_dir (str): the id_map directory
+        alias (str): the alias that was cleared, or None to replay every
+            alias
+        foreign_keys (set): the upper case foreign keys that were cleared
+    """
+    if not foreign_keys:
+        return
+    mappings = list()
+    for other in mapping_aliases(map_dir):
+        if other == alias:
+            continue
+        for (taxid, hint, foreign_key, ens_id) in read_mappings(map_dir, other):
+            foreign_key = foreign_key.upper()
+            if foreign_key not in foreign_keys:
+                continue
+            ens_id = ens_id.upper()
+            mappings.extend((keystr, ens_id) for keystr in
+                            mapping_keys(taxid, hint.upper(), foreign_key))
+            if len(mappings) >= MGET_CHUNK:
+                set_mappings(rdb, mappings)
+                mappings = list()
+    if mappings:
+        set_mappings(rdb, mappings)
 
-        keystr = 'triplet::' + foreign_key + '::' + taxid + '::' + hint
-        rkey = rdb.getset(keystr, ens_id)
-        if rkey is not None and rkey.decode() != ens_id:
-            rdb.set(keystr, 'unmapped-many')
+def replay_cleared(args=None):
+    """Reloads the mappings of every alias for the foreign keys cleared by
+    import_ensembl with replay False.
 
-        if hint == 'WIKIGENE': # to replace integer aliases with strings
-            try:
-                int(rdb.get('::'.join(['stable', ens_id, 'alias'])))
-            except TypeError:
-                rdb.set('::'.join(['stable', ens_id, 'alias']), foreign_key)
-            except ValueError:
-                pass
-            else:
-                rdb.set('::'.join(['stable', ens_id, 'alias']), foreign_key)
+    The CLEARED_SUFFIX files of all refreshed species are combined, so the
+    mappings files are read once however many species were refreshed, and
+    the files are removed once the keys are set.
+
+    Args:
+        args (Namespace): args as populated namespace or 'None' for defaults
+    """
+    if args is None:
+        args = cf.config_args()
+    map_dir = os.path.join(args.working_dir, args.data_path, cf.DEFAULT_MAP_PATH)
+    cleared_files = sorted(glob.glob(os.path.join(map_dir, '*' + CLEARED_SUFFIX)))
+    if not cleared_files:
+        return
+    foreign_keys = set()
+    for cleared_file in cleared_files:
+        with open(cleared_file) as infile:
+            foreign_keys.update(line.rstrip('\n') for line in infile)
+    start = time.time()
+    replay_mappings(get_database(args), map_dir, None, foreign_keys)
+    print('Replayed the mappings of {0} foreign keys cleared from {1} species'.format(
+        len(foreign_keys), len(cleared_files)))
+    cf.CSVM.writerow(['run info', 'replay_seconds', '{0:.1f}'.format(time.time() - start)])
+    for cleared_file in cleared_files:
+        os.remove(cleared_file)
+
+def set_mapping(rdb, keystr, ens_id):
+    """Sets a mapping key to ens_id, or to unmapped-many if it already maps
+    to another stable id.
+
+    Args:
+        rdb (redis object): redis connection to the mapping db
+        keystr (str): the mapping key
+        ens_id (str): the upper case stable id
+    """
+    rkey = rdb.getset(keystr, ens_id)
+    if rkey is not None and rkey.decode() != ens_id:
+        rdb.set(keystr, 'unmapped-many')
+
+def set_mappings(rdb, mappings):
+    """Sets many mapping keys as set_mapping does, with one pipeline of
+    GETSETs per shard.
+
+    Args:
+        rdb (redis object): redis connection to the mapping db
+        mappings (list): (keystr, ens_id) pairs with upper case stable ids
+    """
+    shards = get_shards(rdb)
+    groups = dict()
+    for mapping in mappings:
+        groups.setdefault(shard_idx(mapping[0], len(shards)), []).append(mapping)
+    for idx, group in groups.items():
+        pipe = shards[idx].pipeline(transaction=False)
+        for keystr, ens_id in group:
+            pipe.getset(keystr, ens_id)
+        conflicts = [keystr for (keystr, ens_id), rkey in zip(group, pipe.execute())
+                     if rkey is not None and rkey.decode() != ens_id]
+        for keystr in conflicts:
+            pipe.set(keystr, 'unmapped-many')
+        pipe.execute()
+
+def mapping_keys(taxid, hint, foreign_key):
+    """Returns the Redis keys that map foreign_key to its stable id.
+
+    Args:
+        taxid (str): the species taxid
+        hint (str): the upper case source of the foreign key
+        foreign_key (str): the upper case foreign key
+
+    Returns:
+        list: the unique::, hint::, taxon:: and triplet:: keys
+    """
+    return ['unique::' + foreign_key,
+            'hint::' + foreign_key + '::' + hint,
+            'taxon::' + foreign_key + '::' + taxid,
+            'triplet::' + foreign_key + '::' + taxid + '::' + hint]
+
+def set_wikigene_alias(rdb, ens_id, foreign_key):
+    """Uses a WIKIGENE foreign key as the alias of ens_id, to replace integer
+    aliases with strings.
+
+    Args:
+        rdb (redis object): redis connection to the mapping db
+        ens_id (str): the upper case stable id
+        foreign_key (str): the upper case WIKIGENE foreign key
+    """
+    try:
+        int(rdb.get('::'.join(['stable', ens_id, 'alias'])))
+    except TypeError:
+        rdb.set('::'.join(['stable', ens_id, 'alias']), foreign_key)
+    except ValueError:
+        pass
+    else:
+        rdb.set('::'.join(['stable', ens_id, 'alias']), foreign_key)
 
-def import_gene_nodes(node_table, args=None):
+def import_gene_nodes(node_table, args=None, rdb=None):
     """Import gene node metadata into redis.
     """
     if args is None:
         args = cf.config_args()
-    rdb = get_database(args)
+    if rdb is None:
+        rdb = get_database(args)
     for row in node_table:
         node_id, node_desc, node_type = row
         node_id = node_id.upper()
         rdb.set('::'.join(['stable', node_id, 'desc']), node_desc)
         rdb.set('::'.join(['stable', node_id, 'type']), node_type)
 
-def import_node_meta(nmfile, args=None):
+def import_node_meta(nmfile, args=None, rdb=None):
     """Import node metadata into redis.
     """
     if args is None:
         args = cf.config_args()
-    rdb = get_database(args)
+    if rdb is None:
+        rdb = get_database(args)
     with open(nmfile) as infile:
         reader = csv.reader(infile, delimiter='\t')
         for row in reader:
@@ -208,14 +1140,7 @@ def get_node_info(rdb, fk_array, ntype, hint, taxid):
         ntype = None
 
     if ntype is None:
-        res_arr = rdb.mget(['::'.join(['stable', str(fk), 'type']) for fk in fk_array])
-        fk_prop = [fk for fk, res in zip(fk_array, res_arr) if res is not None
-                   and res.decode() == 'Property']
-        fk_gene = [fk for fk, res in zip(fk_array, res_arr) if res is not None
-                   and res.decode() == 'Gene']
-        if fk_prop and fk_gene:
-            raise ValueError("Mixture of property and gene nodes.")
-        ntype = 'Property' if fk_prop else 'Gene'
+        ntype = pick_node_type(node_types(rdb, fk_array))
 
     if ntype == "Gene":
         stable_array = conv_gene(rdb, fk_array, hint, taxid)
@@ -226,36 +1151,79 @@ def get_node_info(rdb, fk_array, ntype, hint, taxid):
 
     return list(zip(fk_array, *node_desc(rdb, stable_array)))
 
+def node_types(rdb, fk_array):
+    """Returns the node types stored for the identifiers in fk_array.
 
-def conv_gene(rdb, fk_array, hint, taxid):
+    Args:
+        rdb (redis object): redis connection to the mapping db
+        fk_array (list): the array of foreign gene identifers
+
+    Returns:
+        set: the 'Gene' and 'Property' types found
+    """
+    types = set()
+    for start in range(0, len(fk_array), MGET_CHUNK):
+        res_arr = rdb.mget(['::'.join(['stable', str(fk), 'type'])
+                            for fk in fk_array[start:start+MGET_CHUNK]])
+        types.update(res.decode() for res in res_arr if res is not None)
+    return types & {'Gene', 'Property'}
+
+def pick_node_type(types):
+    """Returns the ntype for get_node_info from the types found by node_types.
+
+    Args:
+        types (set): the node types found for a list of identifiers
+
+    Returns:
+        str: 'Property' if property nodes were found and 'Gene' otherwise
+    """
+    if 'Property' in types and 'Gene' in types:
+        raise ValueError("Mixture of property and gene nodes.")
+    return 'Property' if 'Property' in types else 'Gene'
+
+
+def conv_gene(rdb, fk_array, hint, taxid, cache=None, fk_filter=None):
     """Uses the redis database to convert a gene to ensembl stable id
 
     This checks first if there is a unique name for the provided foreign key.
     If not it uses the hint and taxid to try and filter the foreign key
-    possiblities to find a matching stable id.
+    possiblities to find a matching stable id. If a cache is provided, only
+    the identifiers missing from it are looked up and their results are added
+    to it. If an fk_filter is provided, identifiers it does not contain are
+    returned as unmapped-none without any lookup.
 
     Args:
         rdb (redis object): redis connection to the mapping db
         fk_array (list): the foreign gene identifers to be translated
         hint (str): a hint for conversion
         taxid (str): the species taxid, 'unknown' if unknown
+        cache (ConvCache): optional cache of previous conversions
+        fk_filter (FKFilter): optional filter of the loaded foreign keys
 
     Returns:
         str: result of searching for gene in redis DB
     """
-    hint = None if hint == '' or hint is None else hint.upper()
-    taxid = None if taxid == '' or taxid is None else str(taxid)
+    hint, taxid, patterns = conv_patterns(hint, taxid)
 
-    #use ensembl internal uniprot mappings
-    if hint == 'UNIPROT' or hint == 'UNIPROTKB':
-        hint = 'UNIPROT_GN'
+    if cache is not None:
+        keys = [(str(fk).upper(), hint, taxid) for fk in fk_array]
+        ret_stable = [cache.get(key) for key in keys]
+        miss_idxs = [i for i, st in enumerate(ret_stable) if st is None]
+        if miss_idxs:
+            miss_stable = conv_gene(rdb, [fk_array[i] for i in miss_idxs], hint, taxid,
+                                    fk_filter=fk_filter)
+            for i, stable in zip(miss_idxs, miss_stable):
+                ret_stable[i] = stable
+                cache.put(keys[i], stable)
+        return ret_stable
 
     ret_stable = ['unmapped-none'] * len(fk_array)
+    to_search = filter_idxs(fk_array, fk_filter)
 
     def replace_none(ret_st, pattern):
         """Search redis for genes that still are unmapped
         """
-        curr_none = [i for i in range(len(fk_array)) if ret_st[i] == 'unmapped-none']
+        curr_none = [i for i in to_search if ret_st[i] == 'unmapped-none']
         while curr_none:
             temp_curr_none = curr_none[:MGET_CHUNK]
             curr_none = curr_none[MGET_CHUNK:]
@@ -266,21 +1234,108 @@ def conv_gene(rdb, fk_array, hint, taxid):
                     continue
                 ret_st[i] = val.decode()
 
+    for pattern in patterns:
+        replace_none(ret_stable, pattern)
+    return ret_stable
+
+def filter_idxs(fk_array, fk_filter=None):
+    """Returns the indexes of fk_array that may be in the mapping db.
+
+    Args:
+        fk_array (list): the foreign gene identifers to be translated
+        fk_filter (FKFilter): optional filter of the loaded foreign keys
+
+    Returns:
+        list: the indexes of the identifiers to look up
+    """
+    if fk_filter is None:
+        return list(range(len(fk_array)))
+    found = fk_filter.check([str(fk).upper() for fk in fk_array])
+    return [i for i, found_fk in enumerate(found) if found_fk]
+
+def conv_patterns(hint, taxid):
+    """Normalizes the hint and taxid used by conv_gene and returns the Redis
+    key patterns to search, in order of preference.
+
+    Args:
+        hint (str): a hint for conversion
+        taxid (str): the species taxid, 'unknown' if unknown
+
+    Returns:
+        tuple: the normalized hint, the normalized taxid and the list of key
+            patterns, formatted with (foreign_key, taxid, hint)
+    """
+    hint = None if hint == '' or hint is None else hint.upper()
+    taxid = None if taxid == '' or taxid is None else str(taxid)
+
+    #use ensembl internal uniprot mappings
+    if hint == 'UNIPROT' or hint == 'UNIPROTKB':
+        hint = 'UNIPROT_GN'
+
+    patterns = []
     if hint is not None and taxid is not None:
-        replace_none(ret_stable, 'triplet::{0}::{1}::{2}')
+        patterns.append('triplet::{0}::{1}::{2}')
     if taxid is not None:
-        replace_none(ret_stable, 'taxon::{0}::{1}')
+        patterns.append('taxon::{0}::{1}')
     if hint is not None:
-        replace_none(ret_stable, 'hint::{0}::{2}')
+        patterns.append('hint::{0}::{2}')
     if taxid is None:
-        replace_none(ret_stable, 'unique::{0}')
+        patterns.append('unique::{0}')
+    return hint, taxid, patterns
+
+async def conv_gene_async(ardb, fk_array, hint, taxid, cache=None, fk_filter=None):
+    """Coroutine version of conv_gene using an asyncio Redis connection.
+
+    The results are identical to conv_gene. The MGET_CHUNK sized lookups for
+    each key pattern are sent concurrently, so a large fk_array waits for
+    about one Redis round trip per pattern.
+
+    Args:
+        ardb (redis.asyncio object): asyncio redis connection to the mapping db
+        fk_array (list): the foreign gene identifers to be translated
+        hint (str): a hint for conversion
+        taxid (str): the species taxid, 'unknown' if unknown
+        cache (ConvCache): optional cache of previous conversions
+        fk_filter (FKFilter): optional filter of the loaded foreign keys
+
+    Returns:
+        list: result of searching for each gene in redis DB
+    """
+    hint, taxid, patterns = conv_patterns(hint, taxid)
+
+    if cache is not None:
+        keys = [(str(fk).upper(), hint, taxid) for fk in fk_array]
+        ret_stable = [cache.get(key) for key in keys]
+        miss_idxs = [i for i, st in enumerate(ret_stable) if st is None]
+        if miss_idxs:
+            miss_stable = await conv_gene_async(ardb, [fk_array[i] for i in miss_idxs],
+                                                hint, taxid, fk_filter=fk_filter)
+            for i, stable in zip(miss_idxs, miss_stable):
+                ret_stable[i] = stable
+                cache.put(keys[i], stable)
+        return ret_stable
+
+    ret_stable = ['unmapped-none'] * len(fk_array)
+    to_search = filter_idxs(fk_array, fk_filter)
+    for pattern in patterns:
+        curr_none = [i for i in to_search if ret_stable[i] == 'unmapped-none']
+        chunks = [curr_none[i:i+MGET_CHUNK] for i in range(0, len(curr_none), MGET_CHUNK)]
+        vals_arrays = await asyncio.gather(*[
+            ardb.mget([pattern.format(str(fk_array[i]).upper(), taxid, hint) for i in chunk])
+            for chunk in chunks])
+        for chunk, vals_array in zip(chunks, vals_arrays):
+            for i, val in zip(chunk, vals_array):
+                if val is None:
+                    continue
+                ret_stable[i] = val.decode()
     return ret_stable
 
 
 def node_desc(rdb, stable_array):
     """Uses the redis database to find metadata about node given its stable id
 
-    Return all metadata for each element of stable_array
+    Return all metadata for each element of stable_array. The four metadata
+    keys of each stable id are fetched together, MGET_CHUNK keys at a time.
 
     Args:
         rdb (redis object): redis connection to the mapping db
@@ -293,28 +1348,18 @@ def node_desc(rdb, stable_array):
     ret_alias = ["unmapped-none"] * len(stable_array)
     ret_desc = ["unmapped-none"] * len(stable_array)
     ret_biotype = ["unmapped-none"] * len(stable_array)
+    rets = [ret_type, ret_alias, ret_desc, ret_biotype]
+    fields = ['type', 'alias', 'desc', 'biotype']
     st_map_idxs = [idx for idx, st in enumerate(stable_array) if not st.startswith('unmapped')]
-    if st_map_idxs:
-        vals_array = rdb.mget(['::'.join(['stable', stable_array[i], 'type']) for i in st_map_idxs])
-        for i, val in zip(st_map_idxs, vals_array):
+    step = MGET_CHUNK // len(fields)
+    for start in range(0, len(st_map_idxs), step):
+        idxs = st_map_idxs[start:start+step]
+        vals_array = rdb.mget(['::'.join(['stable', stable_array[i], field])
+                               for i in idxs for field in fields])
+        for pos, val in enumerate(vals_array):
             if val is None:
                 continue
-            ret_type[i] = val.decode()
-        vals_array = rdb.mget(['::'.join(['stable', stable_array[i], 'alias']) for i in st_map_idxs])
-        for i, val in zip(st_map_idxs, vals_array):
-            if val is None:
-                continue
-            ret_alias[i] = val.decode()
-        vals_array = rdb.mget(['::'.join(['stable', stable_array[i], 'desc']) for i in st_map_idxs])
-        for i, val in zip(st_map_idxs, vals_array):
-            if val is None:
-                continue
-            ret_desc[i] = val.decode()
-        vals_array = rdb.mget(['::'.join(['stable', stable_array[i], 'biotype']) for i in st_map_idxs])
-        for i, val in zip(st_map_idxs, vals_array):
-            if val is None:
-                continue
-            ret_biotype[i] = val.decode()
+            rets[pos % len(fields)][idxs[pos // len(fields)]] = val.decode()
     return stable_array, ret_type, ret_alias, ret_desc, ret_biotype
 
 
@@ -323,12 +1368,29 @@ def main():
     arguements.
 
     This uses the provided command line arguments and the defaults found in
-    config_utilities to launch a Redis docker container using marathon.
+    config_utilities to launch a Redis docker container using marathon, or
+    to start redis-server processes on this host if --local is given. One
+    Redis db is started for each of args.redis_shards, from the RDB files of
+    rdb_utilities with --redis_from_rdb (see appendonly). With --bulk_load, it
+    instead starts or finishes a bulk load of the running Redis dbs (see
+    bulk_load_start and bulk_load_finish).
     """
     parser = ArgumentParser()
+    parser.add_argument('-l', '--local', action='store_true', default=False,
+                        help='start redis-server on this host instead of with marathon')
+    parser.add_argument('-bl', '--bulk_load', choices=['start', 'finish'], default=None,
+                        help='turn persistence off before, or save and turn it back on \
+                        after, loading the mapping store')
     parser = cf.add_config_args(parser)
     args = parser.parse_args()
-    deploy_container(args)
+    if args.bulk_load == 'start':
+        bulk_load_start(args)
+    elif args.bulk_load == 'finish':
+        bulk_load_finish(args)
+    elif args.local:
+        deploy_local(args)
+    else:
+        deploy_container(args)
 
 if __name__ == "__main__":
     main()
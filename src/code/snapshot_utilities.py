@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""Utiliites for building and reading offline snapshots of the KnowEnG Redis
+mapping db.
+
+A snapshot is an immutable file holding every gene mapping key (unique::,
+hint::, taxon::, triplet::) and node metadata key (stable::) of the Redis db
+as a sorted array index. It is memory-mapped when read, so many map jobs on
+the same host share a single copy and never contact Redis.
+
+Contains the class Snapshot which provides read only lookups into a snapshot
+file with the same mget interface used by redis_utilities.
+
+Contains module functions::
+
+    build_snapshot(outfile, args=None)
+    get_snapshot(snapfile)
+    main_parse_args()
+    main()
+
+Attributes:
+    SNAPSHOT_MAGIC (bytes): header identifying a snapshot file
+    SNAPSHOT_PATTERNS (list): key patterns exported from Redis into a snapshot
+
+Examples:
+    To build a snapshot from the Redis db after setup is complete::
+
+        $ python3 code/snapshot_utilities.py kn-rawdata/id_map/mapping.snap
+
+    To map a table file using the snapshot instead of Redis::
+
+        $ python3 code/conv_utilities.py -msn kn-rawdata/id_map/mapping.snap \\
+            data/dip/PPI/chunks/dip.PPI.table.1.txt
+"""
+
+import os
+import mmap
+import shutil
+import struct
+import subprocess
+import tempfile
+from argparse import ArgumentParser
+import config_utilities as cf
+import redis_utilities as ru
+
+SNAPSHOT_MAGIC = b'KNSNAP01'
+SNAPSHOT_PATTERNS = ['unique::*', 'hint::*', 'taxon::*', 'triplet::*', 'stable::*']
+OFFSET = struct.Struct('<Q')
+SNAPSHOTS = dict()
+
+def escape_key(key):
+    """Escapes the separators used in the snapshot build files.
+
+    Args:
+        key (bytes): a raw Redis key or value
+
+    Returns:
+        bytes: the key with backslashes, tabs and newlines escaped
+    """
+    return key.replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n')
+
+def unescape_key(key):
+    """Reverses escape_key.
+
+    Args:
+        key (bytes): an escaped key or value
+
+    Returns:
+        bytes: the original key or value
+    """
+    out = bytearray()
+    idx = 0
+    while idx < len(key):
+        char = key[idx:idx+1]
+        if char == b'\\' and idx + 1 < len(key):
+            nxt = key[idx+1:idx+2]
+            out += {b't': b'\t', b'n': b'\n'}.get(nxt, nxt)
+            idx += 2
+        else:
+            out += char
+            idx += 1
+    return bytes(out)
+
+def build_snapshot(outfile, args=None):
+    """Exports the Redis mapping db into a snapshot file.
+
+    This scans the Redis db for every key matching SNAPSHOT_PATTERNS, writes
+    the key value pairs to a temporary file, sorts them bytewise by key with
+    the unix sort command and then writes the sorted array index to outfile.
+    Memory use is bounded by MGET_CHUNK regardless of the size of the db.
+
+    The snapshot file is laid out as the SNAPSHOT_MAGIC header, the number of
+    keys N, N+1 key offsets, N+1 value offsets, the key blob and the value
+    blob, with all integers as little endian unsigned 64 bit values.
+
+    Args:
+        outfile (str): path to write the snapshot file to
+        args (Namespace): args as populated namespace or 'None' for defaults
+
+    Returns:
+        int: the number of keys in the snapshot
+    """
+    if args is None:
+        args = cf.config_args()
+    rdb = ru.get_database(args)
+    outdir = os.path.dirname(os.path.abspath(outfile))
+    os.makedirs(outdir, exist_ok=True)
+    tmpdir = tempfile.mkdtemp(dir=outdir)
+    pairs_file = os.path.join(tmpdir, 'pairs.txt')
+    sorted_file = os.path.join(tmpdir, 'sorted.txt')
+    try:
+        with open(pairs_file, 'wb') as pairs:
+            for pattern in SNAPSHOT_PATTERNS:
+                keys = []
+                for key in rdb.scan_iter(match=pattern, count=ru.MGET_CHUNK):
+                    keys.append(key)
+                    if len(keys) == ru.MGET_CHUNK:
+                        write_pairs(rdb, keys, pairs)
+                        keys = []
+                write_pairs(rdb, keys, pairs)
+        env = dict(os.environ, LC_ALL='C')
+        cmd = ['sort', '-t', '\t', '-k1,1', '-T', tmpdir, '-o', sorted_file, pairs_file]
+        print(' '.join(cmd))
+        subprocess.check_call(cmd, env=env)
+        os.remove(pairs_file)
+        num_keys = write_index(sorted_file, outfile, tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+    print('Wrote {0} keys to {1}'.format(num_keys, outfile))
+    return num_keys
+
+def write_pairs(rdb, keys, outfile):
+    """Looks up keys in Redis and writes the escaped key value pairs.
+
+    Args:
+        rdb (redis object): redis connection to the mapping db
+        keys (list): the keys to look up
+        outfile (file): binary file to write the tab separated pairs to
+    """
+    if not keys:
+        return
+    for key, val in zip(keys, rdb.mget(keys)):
+        if val is None:
+            continue
+        outfile.write(escape_key(key) + b'\t' + escape_key(val) + b'\n')
+
+def write_index(sorted_file, outfile, tmpdir):
+    """Writes the sorted array index for sorted_file into outfile.
+
+    Args:
+        sorted_file (str): tab separated escaped key value pairs sorted by key
+        outfile (str): path to write the snapshot file to
+        tmpdir (str): directory for the intermediate offset and blob files
+
+    Returns:
+        int: the number of keys written
+    """
+    parts = [os.path.join(tmpdir, name) for name in ['koff', 'voff', 'keys', 'vals']]
+    num_keys = 0
+    key_pos = 0
+    val_pos = 0
+    with open(sorted_file, 'rb') as infile, \
+        open(parts[0], 'wb') as koff, \
+        open(parts[1], 'wb') as voff, \
+        open(parts[2], 'wb') as kblob, \
+        open(parts[3], 'wb') as vblob:
+        prev = None
+        for line in infile:
+            key, val = line.rstrip(b'\n').split(b'\t', 1)
+            if key == prev:
+                continue
+            prev = key
+            val = unescape_key(val)
+            koff.write(OFFSET.pack(key_pos))
+            voff.write(OFFSET.pack(val_pos))
+            kblob.write(key)
+            vblob.write(val)
+            key_pos += len(key)
+            val_pos += len(val)
+            num_keys += 1
+        koff.write(OFFSET.pack(key_pos))
+        voff.write(OFFSET.pack(val_pos))
+    tmp_out = outfile + '.tmp'
+    with open(tmp_out, 'wb') as out:
+        out.write(SNAPSHOT_MAGIC)
+        out.write(OFFSET.pack(num_keys))
+        for part in parts:
+            with open(part, 'rb') as infile:
+                shutil.copyfileobj(infile, out)
+    os.replace(tmp_out, outfile)
+    return num_keys
+
+def get_snapshot(snapfile):
+    """Returns the Snapshot object for snapfile.
+
+    Snapshots are opened once per process and reused by every later call, so
+    consecutive map jobs in one worker share the same memory map.
+
+    Args:
+        snapfile (str): path to a snapshot file produced by build_snapshot
+
+    Returns:
+        Snapshot: a read only snapshot object
+    """
+    snapfile = os.path.abspath(snapfile)
+    if snapfile not in SNAPSHOTS:
+        SNAPSHOTS[snapfile] = Snapshot(snapfile)
+    return SNAPSHOTS[snapfile]
+
+class Snapshot(object):
+    """Class providing read only lookups into a mapping snapshot file.
+
+    This class mirrors the get and mget functions of a redis connection so it
+    can be passed as the rdb argument of redis_utilities.conv_gene,
+    redis_utilities.node_desc and redis_utilities.get_node_info.
+
+    Attributes:
+        snapfile (str): path of the snapshot file
+        num_keys (int): number of keys in the snapshot
+    """
+    def __init__(self, snapfile):
+        """Init a Snapshot object by memory-mapping snapfile.
+
+        Args:
+            snapfile (str): path to a snapshot file produced by build_snapshot
+        """
+        self.snapfile = snapfile
+        self.infile = open(snapfile, 'rb')
+        self.mmap = mmap.mmap(self.infile.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError(snapfile + ' is not a mapping snapshot')
+        pos = len(SNAPSHOT_MAGIC)
+        self.num_keys, = OFFSET.unpack_from(self.mmap, pos)
+        pos += OFFSET.size
+        self.koff = pos
+        self.voff = self.koff + (self.num_keys + 1) * OFFSET.size
+        self.kblob = self.voff + (self.num_keys + 1) * OFFSET.size
+        kblob_len, = OFFSET.unpack_from(self.mmap, self.voff - OFFSET.size)
+        self.vblob = self.kblob + kblob_len
+
+    def _key(self, idx):
+        """Returns the escaped key stored at position idx."""
+        start, end = struct.unpack_from('<QQ', self.mmap, self.koff + idx * OFFSET.size)
+        return self.mmap[self.kblob + start:self.kblob + end]
+
+    def _val(self, idx):
+        """Returns the value stored at position idx."""
+        start, end = struct.unpack_from('<QQ', self.mmap, self.voff + idx * OFFSET.size)
+        return self.mmap[self.vblob + start:self.vblob + end]
+
+    def get(self, key):
+        """Returns the value of key, or None if the key is not in the snapshot.
+
+        Args:
+            key (str or bytes): the key to look up
+
+        Returns:
+            bytes: the stored value or None
+        """
+        if isinstance(key, str):
+            key = key.encode()
+        key = escape_key(key)
+        low, high = 0, self.num_keys
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.num_keys and self._key(low) == key:
+            return self._val(low)
+        return None
+
+    def mget(self, keys):
+        """Returns the values of keys, with None for each missing key.
+
+        Args:
+            keys (list): the keys to look up
+
+        Returns:
+            list: the stored values in the order of keys
+        """
+        return [self.get(key) for key in keys]
+
+    def close(self):
+        """Close the memory map and the snapshot file."""
+        self.mmap.close()
+        self.infile.close()
+
+def main_parse_args():
+    """Processes command line arguments.
+
+    Expects one positional argument (outfile) and number of optional
+    arguments. If arguments are missing, supplies default values.
+
+    Returns:
+        Namespace: args as populated namespace
+    """
+    parser = ArgumentParser()
+    parser.add_argument('outfile', help='path to write the mapping snapshot to')
+    parser = cf.add_config_args(parser)
+    args = parser.parse_args()
+    return args
+
+def main():
+    """Builds a mapping snapshot from the Redis db described by the command
+    line arguments.
+    """
+    args = main_parse_args()
+    build_snapshot(args.outfile, args)
+
+if __name__ == "__main__":
+    main()
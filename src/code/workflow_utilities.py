@@ -46,6 +46,9 @@ from argparse import ArgumentParser
 import config_utilities as cf
 import mysql_utilities as db
 import job_utilities as ju
+import conv_utilities as cu
+import import_utilities as iu
+import ensembl
 
 DEFAULT_START_STEP = 'CHECK'
 POSSIBLE_STEPS = ['CHECK', 'FETCH', 'TABLE', 'MAP', 'IMPORT', 'EXPORT']
@@ -240,15 +243,24 @@ def run_fetch(args):
 
     This loops through aliases of args.parameters sources, creates a job for
     each that calls fetch_utilities main() (and if not args.one_step, calls
-    workflow_utilities TABLE), and runs job in args.chronos location.
+    workflow_utilities TABLE), and runs job in args.chronos location. In
+    LOCAL mode the ensembl aliases are instead fetched together on a pool of
+    workers (see ensembl.ingest) unless args.ens_workers is 1. In test_mode
+    the pooled species are only printed.
 
     Args:
         args (Namespace): args as populated namespace from parse_args, must
             specify --step_parameters(-p) as ',,' separated list of sources
+
+    Raises:
+        RuntimeError: if any ensembl species fetched on the pool failed
     """
     src_list = list_sources(args)
     ns_parameters = []
     step_job = ju.Job("fetcher", args)
+    ingest_jobs = []
+    use_pool = args.chronos == "LOCAL" and args.ens_workers != 1 and \
+        not (args.storage_dir and args.storage_dir != args.working_dir)
 
     for src in src_list:
         local_src_dir = os.path.join(args.working_dir, args.data_path, src)
@@ -299,6 +311,11 @@ def run_fetch(args):
 
             jobname = "-".join(["fetch", src, alias])
             jobname = jobname.replace(".", "-")
+            if use_pool and src == 'ensembl':
+                if fetch_needed:
+                    logfile = os.path.join(args.working_dir, args.logs_path, jobname + '.log')
+                    ingest_jobs.append((os.path.abspath(metadata_file), logfile))
+                continue
             jobdict = generic_dict(args, None)
             jobdict.update({'TMPJOB': jobname,
                             'TMPLAUNCH': launchstr,
@@ -321,6 +338,17 @@ def run_fetch(args):
                                })
                 ju.run_job_step(args, "next_step_caller", ns_dict)
 
+    if ingest_jobs and args.test_mode:
+        print('Would fetch {0} ensembl species on a pool of ens_workers:'.format(
+            len(ingest_jobs)))
+        for metadata_json, logfile in ingest_jobs:
+            print('\t'.join([metadata_json, logfile]))
+    elif ingest_jobs:
+        failed = ensembl.ingest(ingest_jobs, args)
+        if failed:
+            raise RuntimeError('ERROR: {0} of {1} ensembl species failed to fetch: {2}'.format(
+                len(failed), len(ingest_jobs), ', '.join(failed)))
+
     if not args.setup and not args.one_step and args.chronos in SPECIAL_MODES \
         and ns_parameters:
         ns_dict = generic_dict(args, step_job.jobname)
@@ -418,17 +446,27 @@ def run_map(args):
     """Runs id conversion for a single .table. file on the cloud.
 
     This loops through args.parameters tablefiles, creates a job for each that
-    calls conv_utilities main(), and runs job in args.chronos location.
+    calls conv_utilities main(), and runs job in args.chronos location. In
+    LOCAL mode without a separate storage_dir, the tablefiles are instead
+    mapped on a pool of args.map_workers processes (see
+    conv_utilities.map_files) unless args.map_workers is 1. In test_mode the
+    pooled tablefiles are only printed.
 
     Args:
         args (Namespace): args as populated namespace from parse_args, must
             specify --step_parameters(-p) as ',,' separated list of
             'source.alias.table.chunk.txt' file names
+
+    Raises:
+        RuntimeError: if any tablefile mapped on the pool failed
     """
     tablefile_list = args.step_parameters.split(",,")
     if args.step_parameters == "":
         raise ValueError("ERROR: 'tablefile' must be specified with --step_parameters (-p)")
     ju.Job("mapper", args)
+    pool_jobs = []
+    use_pool = args.chronos == "LOCAL" and args.map_workers != 1 and \
+        not (args.storage_dir and args.storage_dir != args.working_dir)
 
     ctr = 0
     for filestr in tablefile_list:
@@ -451,6 +489,10 @@ def run_map(args):
         jobname = "-".join(["map", tablefile])
         jobname = jobname.replace(".", "-")
         jobname = jobname.replace(".txt", "")
+        if use_pool:
+            logfile = os.path.join(args.working_dir, args.logs_path, jobname + '.log')
+            pool_jobs.append((local_tablefile, logfile))
+            continue
         jobdict = generic_dict(args, None)
         jobdict.update({'TMPJOB': jobname,
                         'TMPTABLEPATH': os.path.join(chunk_path, tablefile),
@@ -458,6 +500,16 @@ def run_map(args):
                        })
         ju.run_job_step(args, "mapper", jobdict)
 
+    if pool_jobs and args.test_mode:
+        print('Would map {0} table files on a pool of map_workers:'.format(len(pool_jobs)))
+        for tablefile, logfile in pool_jobs:
+            print('\t'.join([tablefile, logfile]))
+    elif pool_jobs:
+        failed = cu.map_files(pool_jobs, args)
+        if failed:
+            raise RuntimeError('ERROR: {0} of {1} table files failed to map: {2}'.format(
+                len(failed), len(pool_jobs), ', '.join(os.path.basename(f) for f in failed)))
+
     return 0
 
 
@@ -466,7 +518,13 @@ def run_import(args):
 
     This loops through args.step_parameters (see Args below), and creates a job
     for each that merges the already sorted and unique files found in the data
-    path (if args.merge is True), then calls import_utilities main().
+    path (if args.merge is True), then calls import_utilities main(). In
+    LOCAL mode without a separate storage_dir, the tables are instead merged
+    and loaded together over a pool of args.mysql_load_workers connections
+    (see import_utilities.import_tables) unless args.mysql_load_workers is 1.
+    With args.mysql_incremental, a single job imports only the sources that
+    changed since the last import (see import_utilities.import_incremental).
+    In test_mode the pooled tables are only printed.
 
     Args:
         args (Namespace): args as populated namespace from parse_args,
@@ -479,7 +537,13 @@ def run_import(args):
     tables = ['node', 'node_meta', 'edge2line', 'status', 'edge_meta', 'edge', 'raw_line']
     if args.step_parameters == "":
         importfile_list = tables
+    if args.mysql_incremental:
+        importfile_list = ['incremental']
+        tables = tables + importfile_list
     ju.Job("importer", args)
+    pool_files = []
+    use_pool = args.chronos == "LOCAL" and args.mysql_load_workers != 1 and \
+        not (args.storage_dir and args.storage_dir != args.working_dir)
 
     ctr = 0
     for importfile in importfile_list:
@@ -496,6 +560,15 @@ def run_import(args):
         ctr += 1
         print("\t".join([str(ctr), filestr]))
 
+        if use_pool and importfile == 'incremental':
+            if args.test_mode:
+                print('Would import the sources changed since the last import')
+            else:
+                iu.import_incremental(args)
+            continue
+        if use_pool:
+            pool_files.append(importfile)
+            continue
         jobname = "-".join(["import", filestr])
         jobname = jobname.replace(".", "-")
         jobname = jobname.replace(".txt", "")
@@ -508,6 +581,15 @@ def run_import(args):
                        })
         ju.run_job_step(args, "importer", jobdict)
 
+    if pool_files and args.test_mode:
+        print('Would import {0} tables on a pool of mysql_load_workers:'.format(
+            len(pool_files)))
+        for importfile in pool_files:
+            action = 'merge and load' if importfile in iu.MERGE_KEYS else 'load'
+            print('\t'.join([action, iu.get_table(importfile), importfile]))
+    elif pool_files:
+        iu.import_tables(pool_files, args)
+
     return 0
 
 def run_export(args):